@@ -1,5 +1,5 @@
 import argparse
-from pdf_qa.document_processing import load_documents, split_documents
+from pdf_qa.document_processing import iter_documents, iter_split_documents
 from pdf_qa.chroma_handler import add_to_chroma, clear_database
 
 
@@ -11,8 +11,8 @@ def main():
         print("Clearing Database...")
         clear_database()
 
-    documents = load_documents()
-    chunks = split_documents(documents)
+    documents = iter_documents()
+    chunks = iter_split_documents(documents)
     add_to_chroma(chunks)
 
 
@@ -1,26 +1,62 @@
-import uvicorn
 import os
 import json
 import boto3
 from botocore.exceptions import ClientError
-from fastapi import FastAPI, HTTPException, File, UploadFile, Path as ApiPath
+from contextlib import asynccontextmanager
+from fastapi import FastAPI, HTTPException, File, UploadFile, Path as ApiPath, Query as ApiQuery, Response
+from fastapi.concurrency import run_in_threadpool
 from fastapi.middleware.cors import CORSMiddleware
+from fastapi.responses import StreamingResponse
 from mangum import Mangum
 from pydantic import BaseModel
-from pdf_qa.query_handler import process_query
 from query_model import QueryModel
-from pdf_qa.document_processing import load_documents, split_documents
-from pdf_qa.chroma_handler import add_to_chroma
+from ingestion_job import INGESTION_JOB_PREFIX, IngestionJobModel, arun_ingestion_job, run_ingestion_job
+from background_worker import LOCAL_INGESTION_CONCURRENCY, LOCAL_WORKER_CONCURRENCY, BackgroundWorkerPool, WorkerPoolClosed, WorkerPoolFull
+from query_waiter import WAIT_DEFAULT_SECONDS, WAIT_MAX_SECONDS, wait_for_completion
+from pdf_qa.document_catalog import CATALOG_MAX_PAGE_SIZE, CATALOG_PAGE_SIZE, CatalogPage, InvalidCursor, list_documents
+from pdf_qa.uploads import upload_documents
 from pathlib import Path
+from dataclasses import asdict
 
 
+# The RAG pipeline (LangChain, Chroma, Gemini, pypdf) takes seconds to import. It is imported inside the routes which
+# use it, so a cold start only pays for it when such a route is called; see scripts/benchmark_cold_start.py
+
 WORKER_LAMBDA_NAME = os.environ.get("WORKER_LAMBDA_NAME", None)
+WORKER_QUEUE_URL = os.environ.get("WORKER_QUEUE_URL", None)
+INGESTION_QUEUE_URL = os.environ.get("INGESTION_QUEUE_URL", None)
 IS_USING_IMAGE_RUNTIME = bool(os.environ.get("IS_USING_IMAGE_RUNTIME", False))
 CHAR_LIMIT = 2000
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 
-
-app = FastAPI()
+_sqs_client = None
+
+
+@asynccontextmanager
+async def lifespan(app: FastAPI):
+    """
+    Without a worker Lambda or queue, `LOCAL_WORKER_CONCURRENCY` > 0 answers submitted queries and runs ingestion jobs in the background of this process instead of inline. Up to `LOCAL_INGESTION_CONCURRENCY` ingestion jobs of different users run at the same time, while the jobs of one user run one at a time and in order, as they share the user's vector store and manifest. Queued work is drained on shutdown.
+    """
+    worker_pool = None
+    ingestion_pool = None
+    if LOCAL_WORKER_CONCURRENCY > 0 and not (WORKER_QUEUE_URL or WORKER_LAMBDA_NAME):
+        from worker_handler import afail_query, ainvoke_rag
+        worker_pool = BackgroundWorkerPool(ainvoke_rag, on_failure=afail_query, concurrency=LOCAL_WORKER_CONCURRENCY)
+        worker_pool.start()
+        ingestion_pool = BackgroundWorkerPool(arun_ingestion_job, concurrency=LOCAL_INGESTION_CONCURRENCY, serialize_users=True)
+        ingestion_pool.start()
+    app.state.worker_pool = worker_pool
+    app.state.ingestion_pool = ingestion_pool
+    yield
+    for name, pool in (("worker", worker_pool), ("ingestion", ingestion_pool)):
+        if pool is not None:
+            await pool.drain()
+            print(f"Background {name} pool stopped: {pool.stats()}")
+    app.state.worker_pool = None
+    app.state.ingestion_pool = None
+
+
+app = FastAPI(lifespan=lifespan)
 app.add_middleware(
     CORSMiddleware,
     allow_origins=["*"],
@@ -42,16 +78,36 @@ def index():
 
 
 @app.get("/users/{user_id}/queries/{query_id}")
-def get_user_query_by_id(user_id: str = ApiPath(...), query_id: str = ApiPath(...)) -> QueryModel:
-    query = QueryModel.get_item(user_id, query_id)
+async def get_user_query_by_id(user_id: str = ApiPath(...), query_id: str = ApiPath(...)) -> QueryModel:
+    check_query_id(user_id, query_id)
+    query = await QueryModel.aget_item(user_id, query_id)
     if query:
         return query
     else:
         raise HTTPException(status_code=404, detail=f"Query {query_id} with user {user_id} not found")
 
 
+@app.get("/users/{user_id}/queries/{query_id}/wait")
+async def wait_for_user_query(
+    response: Response,
+    user_id: str = ApiPath(...),
+    query_id: str = ApiPath(...),
+    timeout: float = ApiQuery(WAIT_DEFAULT_SECONDS, gt=0, le=WAIT_MAX_SECONDS),
+) -> QueryModel:
+    """
+    Returns the query once it is complete, or as it is after `timeout` seconds; clients call again while `is_complete` is false. Use this instead of polling the query.
+    """
+    check_query_id(user_id, query_id)
+    result = await wait_for_completion(user_id, query_id, timeout=timeout)
+    if not result.query:
+        raise HTTPException(status_code=404, detail=f"Query {query_id} with user {user_id} not found")
+    response.headers["X-Query-Reads"] = str(result.reads)
+    response.headers["X-Query-Waited-Ms"] = str(result.waited_ms)
+    return result.query
+
+
 @app.post("/users/{user_id}/queries")
-def submit_user_query(request: SubmitQueryRequest, user_id: str = ApiPath(...)) -> QueryModel:
+async def submit_user_query(request: SubmitQueryRequest, user_id: str = ApiPath(...)) -> QueryModel:
     if len(request.query_text) > CHAR_LIMIT:
         raise HTTPException(status_code=400, detail="Query is too long")
 
@@ -60,27 +116,81 @@ def submit_user_query(request: SubmitQueryRequest, user_id: str = ApiPath(...))
         user_id=user_id,
     )
     
-    if WORKER_LAMBDA_NAME:
-        new_query.put_item()
-        invoke_worker(new_query)
+    worker_pool: BackgroundWorkerPool[QueryModel] | None = getattr(app.state, "worker_pool", None)
+    if WORKER_QUEUE_URL or WORKER_LAMBDA_NAME:
+        await new_query.aput_item()
+        await run_in_threadpool(invoke_worker, new_query)
+    elif worker_pool is not None:
+        if worker_pool.is_full():
+            raise HTTPException(status_code=503, detail="Too many queries are waiting to be answered, please retry later")
+        await new_query.aput_item()
+        try:
+            worker_pool.submit(new_query)
+        except (WorkerPoolClosed, WorkerPoolFull) as e:
+            raise HTTPException(status_code=503, detail=str(e))
     else:
-        query_response = process_query(query=request.query_text, user_id=user_id)
+        from pdf_qa.query_handler import aprocess_query
+        query_response = await aprocess_query(query=request.query_text, user_id=user_id)
         if not query_response:
             new_query.answer_text = "No matching results."
             new_query.is_complete = True
         else:
             new_query.answer_text = query_response.response_text
             new_query.sources = query_response.sources
+            new_query.routing = query_response.routing
             new_query.is_complete = True
-        new_query.put_item()
+        await new_query.aput_item()
 
     return new_query
 
 
+@app.post("/users/{user_id}/queries/stream")
+def stream_user_query(request: SubmitQueryRequest, user_id: str = ApiPath(...)) -> StreamingResponse:
+    """
+    Answers a query as Server-Sent Events: a `query` event with the query id, a `sources` event as soon as retrieval is done, a `token` event for every chunk of the answer and a final `done` event with the stored query. The query is stored once the answer is complete.
+    """
+    if len(request.query_text) > CHAR_LIMIT:
+        raise HTTPException(status_code=400, detail="Query is too long")
+
+    from pdf_qa.query_handler import stream_query
+    new_query = QueryModel(
+        query_text=request.query_text,
+        user_id=user_id,
+    )
+
+    def event_stream():
+        yield format_sse("query", {"query_id": new_query.query_id})
+        try:
+            for event, data in stream_query(query=request.query_text, user_id=user_id):
+                if event == "sources":
+                    yield format_sse("sources", [asdict(source) for source in data])
+                elif event == "token":
+                    yield format_sse("token", {"text": data})
+                elif event == "done":
+                    if not data:
+                        new_query.answer_text = "No matching results."
+                    else:
+                        new_query.answer_text = data.response_text
+                        new_query.sources = data.sources
+                        new_query.routing = data.routing
+                    new_query.is_complete = True
+                    new_query.put_item()
+                    yield format_sse("done", new_query.model_dump())
+        except Exception as e:
+            print(f"Error while streaming query {new_query.query_id}: {e}")
+            yield format_sse("error", {"detail": "Failed to answer the query"})
+
+    return StreamingResponse(
+        event_stream(),
+        media_type="text/event-stream",
+        headers={"Cache-Control": "no-cache", "X-Accel-Buffering": "no"},
+    )
+
+
 @app.get("/users/{user_id}/queries")
-def get_user_queries(user_id: str = ApiPath(...)) -> list[QueryModel]:
+async def get_user_queries(user_id: str = ApiPath(...)) -> list[QueryModel]:
     ITEM_COUNT = 25
-    query_items = QueryModel.list_items(user_id=user_id, count=ITEM_COUNT)
+    query_items = await QueryModel.alist_items(user_id=user_id, count=ITEM_COUNT)
     return query_items
 
 
@@ -89,101 +199,104 @@ async def upload_user_documents(
     documents: list[UploadFile] = File(...),
     user_id: str = ApiPath(...)
 ):
-    prefix = f"source/{user_id}/"
-    saved_files = []
+    """
+    Streams the uploaded PDFs to S3, or to the local source directory, and starts an ingestion job for them. Files are read in chunks and never held in memory whole; their content hashes are computed on the way, so ingestion does not read them again to detect unchanged files.
 
+    The job runs on the worker Lambda or the background ingestion pool and the response returns right away with its `job_id`; follow it at `/users/{user_id}/ingestion-jobs/{job_id}`. Without either, the job runs before the response.
+    """
     if 'AWS_EXECUTION_ENV' in os.environ:
         for document in documents:
             if not document.filename or not document.filename.lower().endswith(".pdf"):
                 raise HTTPException(status_code=400, detail=f"Only PDF files are allowed. Invalid file: {document.filename}")
-
-            content = await document.read()
-            if not document.filename:
-                print("Missing document filename")
-                continue
-            key = prefix + document.filename
-
-            try:
-                s3_client = boto3.client('s3')
-                s3_client.put_object(
-                    Bucket=BUCKET_NAME,
-                    Key=key,
-                    Body=content,
-                    ContentType='application/pdf',
-                    ContentDisposition='inline'
-                )
-                saved_files.append(document.filename)
-            except ClientError as e:
-                print(f"Error uploading {document.filename} to S3")
-                print(f"ClientError: {e}")
+        uploads = await upload_documents(documents, bucket=BUCKET_NAME, prefix=f"source/{user_id}/")
     else:
         if IS_USING_IMAGE_RUNTIME:
             upload_directory = os.path.join("/tmp", "data", "source", f"{user_id}")
         else:
             upload_directory = str(Path(__file__).parent / "data" / "source" / f"{user_id}")
-        os.makedirs(upload_directory, exist_ok=True)
+        uploads = await upload_documents(documents, directory=upload_directory)
+    saved_files = [upload.filename for upload in uploads]
 
-        for document in documents:
-            path = os.path.join(upload_directory, f"{document.filename}")
-            with open(path, 'wb') as file:
-                file.write(await document.read())
-            saved_files.append(document.filename)
-
-    loaded_documents = load_documents(user_id)
-    print(f"Documents: {documents[:3]}")
-    chunks = split_documents(loaded_documents)
-    print(f"Chunks: {chunks[:3]}")
-    add_to_chroma(chunks, user_id)
+    job = IngestionJobModel(
+        user_id=user_id,
+        files=saved_files,
+        content_hashes={upload.filename: upload.content_hash for upload in uploads},
+    )
+    ingestion_pool: BackgroundWorkerPool[IngestionJobModel] | None = getattr(app.state, "ingestion_pool", None)
+    if INGESTION_QUEUE_URL or WORKER_LAMBDA_NAME:
+        await job.aput_item()
+        await run_in_threadpool(invoke_ingestion_worker, job)
+    elif ingestion_pool is not None:
+        if ingestion_pool.is_full():
+            raise HTTPException(status_code=503, detail="Too many ingestion jobs are waiting, please retry later")
+        await job.aput_item()
+        try:
+            ingestion_pool.submit(job)
+        except (WorkerPoolClosed, WorkerPoolFull) as e:
+            raise HTTPException(status_code=503, detail=str(e))
+    else:
+        await run_in_threadpool(run_ingestion_job, job)
 
     return {
         "message": "pdf document uploaded",
-        "uploaded_files": saved_files
+        "uploaded_files": saved_files,
+        "job_id": job.job_id,
+        "status": job.status,
     }
 
 
-@app.get("/users/{user_id}/documents")
-def get_user_documents(user_id: str = ApiPath(...)) -> list[str]:
-    prefix = f"source/{user_id}/"
-    documents = []
-
-    if 'AWS_EXECUTION_ENV' in os.environ:
-        try:
-            s3_client = boto3.client('s3')
-            response = s3_client.list_objects_v2(
-                Bucket=BUCKET_NAME,
-                Prefix=prefix
-            )
-        except ClientError as e:
-            print("Error listing objects in S3")
-            print(f"ClientError: {e}")
-            return []
-
-        if 'Contents' in response:
-            for obj in response['Contents']:
-                key = obj['Key']
-                filename = key[len(prefix):]
-                if filename:
-                    documents.append(filename)
+@app.get("/users/{user_id}/ingestion-jobs/{job_id}")
+async def get_user_ingestion_job(user_id: str = ApiPath(...), job_id: str = ApiPath(...)) -> IngestionJobModel:
+    """
+    Returns the status of an ingestion job with its pages parsed, chunks split, embedded and upserted and the milliseconds spent per stage so far.
+    """
+    job = await IngestionJobModel.aget_item(user_id, job_id)
+    if job:
+        return job
     else:
-        if IS_USING_IMAGE_RUNTIME:
-            upload_directory = os.path.join("/tmp", "data", "source", f"{user_id}")
-        else:
-            upload_directory = str(Path(__file__).parent / "data" / "source" / f"{user_id}")
+        raise HTTPException(status_code=404, detail=f"Ingestion job {job_id} with user {user_id} not found")
 
-        if not os.path.isdir(upload_directory):
-            return []
 
-        documents = []
-        for filename in os.listdir(upload_directory):
-            documents.append(filename)
+@app.get("/users/{user_id}/documents")
+async def get_user_documents(
+    user_id: str = ApiPath(...),
+    limit: int = ApiQuery(CATALOG_PAGE_SIZE, ge=1, le=CATALOG_MAX_PAGE_SIZE),
+    cursor: str | None = ApiQuery(None),
+) -> CatalogPage:
+    """
+    Returns a page of the user's ingested documents from the document catalog, with their size, page and chunk counts, content hash and indexing time. Pass `next_cursor` as `cursor` to get the next page; it is null on the last page. Documents appear once their ingestion job is done.
+    """
+    try:
+        return await run_in_threadpool(list_documents, user_id, limit, cursor)
+    except InvalidCursor as e:
+        raise HTTPException(status_code=400, detail=str(e))
+    except ClientError as e:
+        print("Error listing the document catalog")
+        print(f"ClientError: {e}")
+        raise HTTPException(status_code=503, detail="The document catalog is not available, please retry later")
+
+
+def check_query_id(user_id: str, query_id: str):
+    # Ingestion jobs share the query table but are not queries
+    if query_id.startswith(INGESTION_JOB_PREFIX):
+        raise HTTPException(status_code=404, detail=f"Query {query_id} with user {user_id} not found")
+
+
+def format_sse(event: str, data) -> str:
+    return f"event: {event}\ndata: {json.dumps(data)}\n\n"
 
-    return documents
-        
 
 def invoke_worker(query: QueryModel):
-    lambda_client = boto3.client("lambda")
+    """
+    Hands a query to the worker. With `WORKER_QUEUE_URL` set, the query is sent to the worker queue, whose event source delivers queries to the worker in batches; otherwise the worker Lambda is invoked for this query alone.
+    """
     payload = query.model_dump()
-    
+    if WORKER_QUEUE_URL:
+        response = get_sqs_client().send_message(QueueUrl=WORKER_QUEUE_URL, MessageBody=json.dumps(payload))
+        print(f"Query sent to worker queue {response}")
+        return
+
+    lambda_client = boto3.client("lambda")
     response = lambda_client.invoke(
         FunctionName=WORKER_LAMBDA_NAME,
         InvocationType="Event",
@@ -193,8 +306,40 @@ def invoke_worker(query: QueryModel):
     print(f"Worker lambda invoked {response}")
 
 
+def invoke_ingestion_worker(job: IngestionJobModel):
+    """
+    Hands an ingestion job to the worker. With `INGESTION_QUEUE_URL` set, the job is sent to the FIFO ingestion queue in the message group of its user, so the jobs of a user never run concurrently and overwrite each other's manifest; otherwise the worker Lambda is invoked for this job alone. Jobs skip the worker queue, whose batches only carry queries.
+    """
+    if INGESTION_QUEUE_URL:
+        response = get_sqs_client().send_message(
+            QueueUrl=INGESTION_QUEUE_URL,
+            MessageBody=json.dumps(job.as_worker_event()),
+            MessageGroupId=job.user_id,
+            MessageDeduplicationId=job.job_id,
+        )
+        print(f"Ingestion job sent to ingestion queue {response}")
+        return
+
+    lambda_client = boto3.client("lambda")
+    response = lambda_client.invoke(
+        FunctionName=WORKER_LAMBDA_NAME,
+        InvocationType="Event",
+        Payload=json.dumps(job.as_worker_event())
+    )
+
+    print(f"Worker lambda invoked for ingestion job {response}")
+
+
+def get_sqs_client():
+    global _sqs_client
+    if _sqs_client is None:
+        _sqs_client = boto3.client("sqs")
+    return _sqs_client
+
+
 # ===== FOR LOCAL TESTING =====
 if __name__ == "__main__":
+    import uvicorn
     port = 8000
     print(f"Server running on port {port}")
     uvicorn.run("api_handler:app", host="0.0.0.0", port=port)
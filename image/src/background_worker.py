@@ -0,0 +1,188 @@
+from collections import deque
+from typing import Awaitable, Callable, Generic, Protocol, TypeVar
+import asyncio
+import os
+
+
+LOCAL_WORKER_CONCURRENCY = int(os.environ.get("LOCAL_WORKER_CONCURRENCY", 0))
+LOCAL_WORKER_MAX_PENDING = int(os.environ.get("LOCAL_WORKER_MAX_PENDING", 1000))
+LOCAL_WORKER_DRAIN_SECONDS = float(os.environ.get("LOCAL_WORKER_DRAIN_SECONDS", 30))
+LOCAL_INGESTION_CONCURRENCY = int(os.environ.get("LOCAL_INGESTION_CONCURRENCY", 2))
+
+
+class WorkerPoolFull(Exception):
+    pass
+
+
+class WorkerPoolClosed(Exception):
+    pass
+
+
+class WorkItem(Protocol):
+    """
+    A job of the pool, e.g. a `QueryModel` or an `IngestionJobModel`. `query_id` is its key in the query table.
+    """
+
+    @property
+    def user_id(self) -> str: ...
+
+    @property
+    def query_id(self) -> str: ...
+
+
+Job = TypeVar("Job", bound=WorkItem)
+
+
+class BackgroundWorkerPool(Generic[Job]):
+    """
+    Runs jobs in the background of the API process, for deployments without the worker Lambda: queries to answer or documents to ingest.
+
+    Jobs are queued per user and the users take turns, so a user who submits many jobs at once does not delay everyone else's. At most `concurrency` jobs run at the same time. With `serialize_users`, at most one job of each user runs at a time and a user's jobs run in the order they were submitted, while the jobs of different users still run concurrently. When the handler of a job fails, `on_failure` is called with the job and the error, so it can be marked as finished instead of staying pending forever.
+    """
+
+    def __init__(
+        self,
+        handler: Callable[[Job], Awaitable],
+        on_failure: Callable[[Job, Exception], Awaitable] | None = None,
+        concurrency: int = LOCAL_WORKER_CONCURRENCY,
+        max_pending: int = LOCAL_WORKER_MAX_PENDING,
+        serialize_users: bool = False,
+    ):
+        self.handler = handler
+        self.on_failure = on_failure
+        self.concurrency = max(concurrency, 1)
+        self.max_pending = max_pending
+        self.serialize_users = serialize_users
+        self._queues: dict[str, deque[Job]] = {}
+        # Users with queued jobs in the order they take turns
+        self._turns: deque[str] = deque()
+        # With `serialize_users`, users with a running job, who only take turns again once it is done
+        self._busy_users: set[str] = set()
+        self._available = asyncio.Semaphore(0)
+        self._idle = asyncio.Event()
+        self._idle.set()
+        self._workers: list[asyncio.Task] = []
+        self._closed = False
+        self.pending = 0
+        self.running = 0
+        self.completed = 0
+        self.failed = 0
+
+
+    def start(self):
+        self._workers = [asyncio.create_task(self._work(), name=f"background-worker-{i}") for i in range(self.concurrency)]
+        print(f"Background worker pool started with {self.concurrency} workers")
+
+
+    def is_full(self) -> bool:
+        return self.pending >= self.max_pending
+
+
+    def submit(self, job: Job):
+        """
+        Queues a job to be run in the background.
+
+        Raises:
+        WorkerPoolClosed: If the pool is draining.
+        WorkerPoolFull: If `max_pending` jobs are already queued.
+        """
+        if self._closed:
+            raise WorkerPoolClosed("The worker pool is shutting down")
+        if self.is_full():
+            raise WorkerPoolFull(f"{self.pending} jobs are already queued")
+
+        jobs = self._queues.get(job.user_id)
+        if jobs is None:
+            jobs = self._queues[job.user_id] = deque()
+            if job.user_id not in self._busy_users:
+                self._turns.append(job.user_id)
+                if self.serialize_users:
+                    self._available.release()
+        jobs.append(job)
+        self.pending += 1
+        self._idle.clear()
+        # Without `serialize_users` every job can be taken by a worker; with it, only the first job of every user in turn
+        if not self.serialize_users:
+            self._available.release()
+
+
+    async def drain(self, timeout: float = LOCAL_WORKER_DRAIN_SECONDS) -> bool:
+        """
+        Stops accepting jobs, waits up to `timeout` seconds for the queued and running ones and stops the workers.
+
+        Returns:
+        bool: Whether every job was done before the timeout. Jobs which were not stay pending in the table.
+        """
+        self._closed = True
+        try:
+            await asyncio.wait_for(self._idle.wait(), timeout=timeout)
+            drained = True
+        except asyncio.TimeoutError:
+            drained = False
+            print(f"Worker pool drain timed out with {self.pending} queued and {self.running} running jobs")
+        for worker in self._workers:
+            worker.cancel()
+        await asyncio.gather(*self._workers, return_exceptions=True)
+        self._workers = []
+        return drained
+
+
+    def stats(self) -> dict:
+        return {
+            "pending": self.pending,
+            "running": self.running,
+            "completed": self.completed,
+            "failed": self.failed,
+            "users": len(self._queues),
+        }
+
+
+    def _next_job(self) -> Job:
+        user_id = self._turns.popleft()
+        jobs = self._queues[user_id]
+        job = jobs.popleft()
+        if not jobs:
+            del self._queues[user_id]
+        elif not self.serialize_users:
+            self._turns.append(user_id)
+        if self.serialize_users:
+            self._busy_users.add(user_id)
+        return job
+
+
+    def _finish_job(self, user_id: str):
+        if not self.serialize_users:
+            return
+        self._busy_users.discard(user_id)
+        if user_id in self._queues:
+            self._turns.append(user_id)
+            self._available.release()
+
+
+    async def _work(self):
+        while True:
+            await self._available.acquire()
+            job = self._next_job()
+            self.pending -= 1
+            self.running += 1
+            try:
+                await self.handler(job)
+                self.completed += 1
+            except Exception as e:
+                self.failed += 1
+                print(f"Failed to run job {job.query_id}: {e}")
+                await self._report_failure(job, e)
+            finally:
+                self.running -= 1
+                self._finish_job(job.user_id)
+                if self.pending == 0 and self.running == 0:
+                    self._idle.set()
+
+
+    async def _report_failure(self, job: Job, error: Exception):
+        if self.on_failure is None:
+            return
+        try:
+            await self.on_failure(job, error)
+        except Exception as e:
+            print(f"Failed to mark job {job.query_id} as failed: {e}")
@@ -0,0 +1,144 @@
+import asyncio
+import time
+import uuid
+from botocore.exceptions import ClientError
+from pydantic import BaseModel, Field
+from typing import Literal, Optional, Type
+from query_model import TTL_EXPIRE_TIMESTAMP, QueryModel, run_in_dynamodb_executor
+from pdf_qa.ingestion_progress import IngestionProgress
+
+
+# Jobs share the query table. Their partition keys carry this prefix, and without `created_at` they stay out of the
+# index the query list reads, so they never show up as queries.
+INGESTION_JOB_PREFIX = "ingest#"
+INGESTION_JOB_TYPE = "ingestion"
+
+
+class IngestionJobModel(BaseModel):
+    job_id: str = Field(default_factory=lambda: uuid.uuid4().hex)
+    user_id: str = "nobody"
+    status: Literal["pending", "running", "succeeded", "failed"] = "pending"
+    files: list[str] = Field(default_factory=list)
+    content_hashes: dict[str, str] = Field(default_factory=dict)
+    submitted_at: int = Field(default_factory=lambda: int(time.time()))
+    started_at: Optional[int] = None
+    finished_at: Optional[int] = None
+    ttl: int = Field(default_factory=lambda: int(time.time() + TTL_EXPIRE_TIMESTAMP))
+    pages_parsed: int = 0
+    chunks_split: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+    stage_ms: dict[str, int] = Field(default_factory=dict)
+    ingested_files: list[str] = Field(default_factory=list)
+    unchanged_files: list[str] = Field(default_factory=list)
+    removed_files: list[str] = Field(default_factory=list)
+    error: Optional[str] = None
+
+
+    @property
+    def query_id(self) -> str:
+        return INGESTION_JOB_PREFIX + self.job_id
+
+
+    def as_ddb_item(self):
+        item = {k: v for k, v in self.model_dump().items() if v is not None}
+        item["query_id"] = self.query_id
+        return item
+
+
+    def as_worker_event(self) -> dict:
+        return {"job_type": INGESTION_JOB_TYPE, **self.model_dump()}
+
+
+    def put_item(self):
+        try:
+            response = QueryModel.get_table().put_item(Item=self.as_ddb_item())
+            print(response)
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            message = error.get("Message", "Unknown error")
+            print("ClientError:", message)
+            raise e
+
+
+    @classmethod
+    def get_item(cls: Type["IngestionJobModel"], user_id: str, job_id: str) -> "IngestionJobModel | None":
+        try:
+            response = QueryModel.get_table().get_item(
+                Key={"user_id": user_id, "query_id": INGESTION_JOB_PREFIX + job_id}
+            )
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            message = error.get("Message", "Unknown error")
+            print("ClientError:", message)
+            return None
+
+        if "Item" in response:
+            return cls(**response["Item"]) # type: ignore
+        return None
+
+
+    def record_progress(self, progress: IngestionProgress):
+        self.pages_parsed = progress.pages_parsed
+        self.chunks_split = progress.chunks_split
+        self.chunks_embedded = progress.chunks_embedded
+        self.chunks_upserted = progress.chunks_upserted
+        self.stage_ms = progress.stage_ms
+
+
+    async def aput_item(self):
+        await run_in_dynamodb_executor(self.put_item)
+
+
+    @classmethod
+    async def aget_item(cls: Type["IngestionJobModel"], user_id: str, job_id: str) -> "IngestionJobModel | None":
+        return await run_in_dynamodb_executor(cls.get_item, user_id, job_id)
+
+
+def run_ingestion_job(job: IngestionJobModel) -> IngestionJobModel:
+    """
+    Ingests the documents of a job and keeps its stored item up to date: the job is marked running, its counters and stage timings are written while it runs, and it ends as succeeded or failed.
+
+    Parameters:
+    job (IngestionJobModel): The job, as stored by the upload.
+
+    Returns:
+    IngestionJobModel: The finished job.
+    """
+    # The RAG pipeline is only imported where a job actually runs
+    from pdf_qa.ingestion import ingest_user_documents
+
+    job.status = "running"
+    job.started_at = int(time.time())
+    job.put_item()
+
+    def save_progress(progress: IngestionProgress):
+        job.record_progress(progress)
+        try:
+            job.put_item()
+        except ClientError:
+            # A lost progress update is overwritten by the next one, so the ingestion goes on
+            pass
+
+    progress = IngestionProgress(listener=save_progress)
+    try:
+        result = ingest_user_documents(job.user_id, job.content_hashes, progress=progress)
+    except Exception as e:
+        print(f"Ingestion job {job.job_id} failed: {e}")
+        job.status = "failed"
+        job.error = str(e)
+    else:
+        job.status = "succeeded"
+        job.ingested_files = result.ingested_files
+        job.unchanged_files = result.unchanged_files
+        job.removed_files = result.removed_files
+        print(f"Ingestion result: {result}")
+
+    job.record_progress(progress)
+    job.finished_at = int(time.time())
+    job.put_item()
+    return job
+
+
+async def arun_ingestion_job(job: IngestionJobModel) -> IngestionJobModel:
+    return await asyncio.to_thread(run_ingestion_job, job)
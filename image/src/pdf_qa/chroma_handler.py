@@ -2,13 +2,22 @@ from dotenv import load_dotenv
 from langchain_chroma import Chroma
 from langchain_core.documents import Document
 from .embedding import generate_embedding
+from .chroma_pool import ChromaPool
+from .local_vector_store import LocalVectorStoreBackend
+from .vector_store import get_vector_store_backend, register_vector_store_backend
+from .ingestion_progress import IngestionProgress
+from .ingestion_manifest import IngestionManifest
+from .document_catalog import clear_catalog
+from .query_cache import bump_corpus_version
+from .s3_sync import get_s3_client
+from itertools import islice
 from pathlib import Path
+from typing import Iterable, Iterator
 from utils.api_key_loader import get_chroma_api_key
 import hashlib
 import os
 import stat
 import shutil
-import boto3
 import chromadb
 
 
@@ -17,38 +26,21 @@ IS_USING_IMAGE_RUNTIME = bool(os.environ.get("IS_USING_IMAGE_RUNTIME", False))
 BUCKET_NAME = os.environ.get("BUCKET_NAME")
 CHROMA_DB_PATH = os.getenv('CHROMA_DB_PATH', '/mnt/chroma')
 LOCAL_DB_DIR = Path(__file__).parent.parent / "data" / "chroma"
+INGEST_BATCH_SIZE = int(os.environ.get("INGEST_BATCH_SIZE", 128))
 
 
-s3_client = boto3.client('s3')
-
-
-def get_chroma_db(user_id: str = "nobody"):
+def create_chroma_client():
     """
-    Returns an instance of the Chroma vector database for the given user_id.
-
-    Parameters:
-    user_id (str): The user_id string which will be the directory.
+    Creates the HTTP client for the hosted Chroma database.
 
     Returns:
-    Chroma: The instance of the Chroma vector store.
+    chromadb.HttpClient | None: The client, or None if the Chroma API key is not available.
     """
-    embeddings = generate_embedding()
-    # runtime_chroma_path = get_runtime_chroma_path(user_id)
-    # os.makedirs(runtime_chroma_path, exist_ok=True)
-
-    # for root, dirs, files in os.walk(runtime_chroma_path):
-    #     for file in files:
-    #         full_path = os.path.join(root, file)
-    #         print(f"file in {runtime_chroma_path}: {full_path}")
-
-    # if 'AWS_EXECUTION_ENV' in os.environ:
-    #     sync_chroma_from_s3(user_id)
-        
     chroma_api_key = get_chroma_api_key()
     if chroma_api_key is None:
         return None
 
-    client = chromadb.HttpClient(
+    return chromadb.HttpClient(
       ssl=True,
       host='api.trychroma.com',
       tenant='ca0acac0-5424-49ea-89d7-43d60dc3ece4',
@@ -57,19 +49,48 @@ def get_chroma_db(user_id: str = "nobody"):
         'x-chroma-token': chroma_api_key
       }
     )
-  
-    # this loads existing one and doesn't create fresh db every time
-    CHROMA_DB_INSTANCE = Chroma(
-        collection_name=user_id,
-        embedding_function=embeddings,
-        client=client
-        # persist_directory=runtime_chroma_path,
-    )
 
-    print(f"Init ChromaDB {CHROMA_DB_INSTANCE}")
+
+chroma_pool = ChromaPool(
+    client_factory=create_chroma_client,
+    embeddings_factory=generate_embedding
+)
+register_vector_store_backend("chroma", lambda: chroma_pool)
+register_vector_store_backend("local", lambda: LocalVectorStoreBackend(get_runtime_vector_path, generate_embedding))
+
+
+def get_chroma_db(user_id: str = "nobody"):
+    """
+    Returns the vector store of the given user_id from the backend selected by `VECTOR_STORE_BACKEND`: the hosted Chroma database ("chroma", the default) or the in-process `LocalVectorStore` ("local").
+
+    Note:
+    The instance is served from a process-wide backend, so the HTTP client and the embedding function are only created once per process.
+
+    Parameters:
+    user_id (str): The user_id string which will be the directory.
+
+    Returns:
+    VectorStore: The instance of the vector store.
+    """
+    # if 'AWS_EXECUTION_ENV' in os.environ:
+    #     sync_chroma_from_s3(user_id)
+
+    backend = get_vector_store_backend()
+    CHROMA_DB_INSTANCE = backend.get(user_id)
+    print(f"Init vector store {CHROMA_DB_INSTANCE}, backend stats: {backend.stats()}")
     return CHROMA_DB_INSTANCE
 
 
+def get_chroma_pool_stats() -> dict:
+    """
+    Returns the hit/miss/eviction counts of the Chroma handle pool.
+
+    Returns:
+    dict: The pool statistics.
+    """
+    return chroma_pool.stats()
+
+
 def get_runtime_chroma_path(user_id: str):
     """
     Get the ChromaDB path depending on runtime.
@@ -89,40 +110,114 @@ def get_runtime_chroma_path(user_id: str):
     return runtime_path
 
 
-def add_to_chroma(chunks: list[Document], user_id: str = "nobody"):
+def get_runtime_vector_path(user_id: str):
+    """
+    Get the path of the local vector store depending on runtime. It lives in a `vectors` directory next to the ChromaDB directory.
+
+    Returns:
+    str: The local vector store path.
+    """
+    chroma_root = os.path.dirname(get_runtime_chroma_path(user_id))
+    return os.path.join(os.path.dirname(chroma_root), "vectors", user_id)
+
+
+def add_to_chroma(chunks: Iterable[Document], user_id: str = "nobody", batch_size: int = INGEST_BATCH_SIZE, progress: IngestionProgress | None = None):
     """
     Adds a list of chunks to a Chroma vector store, ensure that only new chunks (i.e., chunks that don't already exist in the database) are added. Each chunk is assigned a unique `id` based on its metadata to prevent duplication in the database.
 
+    The chunks may also be a lazy stream, e.g. from `iter_split_documents`. They are consumed, embedded and added in batches of `batch_size`, so memory stays flat regardless of how many chunks are ingested.
+
     Parameters:
-    chunks (list[Document]): A list of 'Document' objects.
+    chunks (Iterable[Document]): A list or stream of 'Document' objects.
+    batch_size (int): The maximum number of chunks which are embedded and added at once.
+    progress (IngestionProgress | None): Counts the embedded and upserted chunks and times the `store` stage.
 
     Returns:
-    None: This function modifies the Chroma database in-place. It does not return any values.
+    int | None: The number of chunks which were added, or None if the database is not available.
     """
     db = get_chroma_db(user_id)
     if db is None:
         print("db not found")
-        return
-    new_chunks = []
-    chunks_with_ids = add_id_metadata_to_chunks(chunks)
-    existing_chunks = db.get(include=[])
-    existing_ids = set(existing_chunks['ids'])
-    for chunk in chunks_with_ids:
-        if chunk.metadata['id'] not in existing_ids:
-            new_chunks.append(chunk)
-
-    new_chunks_count = len(new_chunks)
+        return None
+    progress = progress or IngestionProgress()
+    # Only the candidate ids of each batch are looked up, so the cost of an ingest does not grow with the size of the collection
+    seen_ids = set()
+    new_chunks_count = 0
+    for batch in batched(iter_chunks_with_ids(chunks), batch_size):
+        with progress.stage("store"):
+            existing_ids = get_existing_ids(db, [chunk.metadata['id'] for chunk in batch if chunk.metadata['id'] not in seen_ids])
+        new_chunks = []
+        for chunk in batch:
+            chunk_id = chunk.metadata['id']
+            if chunk_id not in existing_ids and chunk_id not in seen_ids:
+                new_chunks.append(chunk)
+            seen_ids.add(chunk_id)
+
+        if new_chunks:
+            print(f'Adding {len(new_chunks)} new chunks to db')
+            new_chunk_ids = [chunk.metadata['id'] for chunk in new_chunks]
+            # The vector store embeds and upserts in one call, so both are timed as the `store` stage
+            progress.chunks_embedded += len(new_chunks)
+            with progress.stage("store"):
+                db.add_documents(new_chunks, ids=new_chunk_ids)
+            progress.chunks_upserted += len(new_chunks)
+            new_chunks_count += len(new_chunks)
+            # if 'AWS_EXECUTION_ENV' in os.environ:
+            #     sync_chroma_to_s3(user_id)
+
     if new_chunks_count:
-        print(f'Adding {new_chunks_count} new chunks to db')
-        new_chunk_ids = [chunk.metadata['id'] for chunk in new_chunks]
-        print("About to add documents to db")
-        db.add_documents(new_chunks, ids=new_chunk_ids)
-        # if 'AWS_EXECUTION_ENV' in os.environ:
-        #     sync_chroma_to_s3(user_id)
+        bump_corpus_version(user_id)
     else:
         print('No new chunks were added')
 
-    
+    return new_chunks_count
+
+
+def get_existing_ids(db, ids: list[str]) -> set[str]:
+    """
+    Returns which of the given ids already exist in the vector store, without fetching every id of the collection.
+
+    Parameters:
+    db (Chroma): The vector store.
+    ids (list[str]): The candidate ids.
+
+    Returns:
+    set[str]: The subset of ids which already exist.
+    """
+    if not ids:
+        return set()
+    existing_chunks = db.get(ids=list(dict.fromkeys(ids)), include=[])
+    return set(existing_chunks['ids'])
+
+
+def batched(items: Iterable, size: int) -> Iterator[list]:
+    """
+    Lazily groups items into lists of at most `size` items.
+    """
+    iterator = iter(items)
+    while batch := list(islice(iterator, size)):
+        yield batch
+
+
+def delete_from_chroma(ids: list[str], user_id: str = "nobody"):
+    """
+    Removes the chunks with the given ids from the Chroma vector store, e.g. the stale chunks of a replaced or removed file.
+
+    Parameters:
+    ids (list[str]): The ids of the chunks to remove.
+    user_id (str): The user_id whose collection the chunks belong to.
+    """
+    if not ids:
+        return
+    db = get_chroma_db(user_id)
+    if db is None:
+        print("db not found")
+        return
+    print(f'Removing {len(ids)} stale chunks from db')
+    db.delete(ids=ids)
+    bump_corpus_version(user_id)
+
+
 def add_id_metadata_to_chunks(chunks: list[Document]):
     """
     Adds `id` metadata to each chunk in the given list. The `id` is generated based on the `source` and `page` metadata, and a chunk index as well as a hash of the chunk's content to ensure each chunk has a unique identifier.
@@ -143,6 +238,22 @@ def add_id_metadata_to_chunks(chunks: list[Document]):
     Returns:
     list[Document]: The same input list, now with added `id` metadata for each chunk.
     """
+    for _ in iter_chunks_with_ids(chunks):
+        pass
+
+    return chunks
+
+
+def iter_chunks_with_ids(chunks: Iterable[Document]) -> Iterator[Document]:
+    """
+    Lazily adds the same `id` metadata as `add_id_metadata_to_chunks` to each chunk of a stream and yields it.
+
+    Parameters:
+    chunks (Iterable[Document]): A list or stream of `Document` objects.
+
+    Yields:
+    Document: The chunk with its `id` metadata.
+    """
     prev_source_page = None
     current_chunk_idx = 0
 
@@ -161,8 +272,7 @@ def add_id_metadata_to_chunks(chunks: list[Document]):
         
         chunk_id = f'{current_source_page}:{current_chunk_idx}:{content_hash}'
         chunk.metadata['id'] = chunk_id
-
-    return chunks
+        yield chunk
 
 
 def generate_content_hash(chunk: Document) -> str:
@@ -181,25 +291,14 @@ def generate_content_hash(chunk: Document) -> str:
 
 def clear_database(user_id: str = "nobody"):
     """
-    Remove the entire database.
+    Remove the entire database. The ingestion manifest and the document catalog of the user are removed as well, so the same PDFs are embedded again when they are uploaded again.
     """
     # if os.path.exists(LOCAL_DB_DIR):
     #     shutil.rmtree(LOCAL_DB_DIR)
-    chroma_api_key = get_chroma_api_key()
-    if chroma_api_key is None:
-        return None
-
-    client = chromadb.HttpClient(
-      ssl=True,
-      host='api.trychroma.com',
-      tenant='ca0acac0-5424-49ea-89d7-43d60dc3ece4',
-      database='rag-chroma',
-      headers={
-        'x-chroma-token': chroma_api_key
-      }
-    )
-    client.delete_collection(name=user_id)
-
+    get_vector_store_backend().clear(user_id)
+    IngestionManifest.delete(user_id)
+    clear_catalog(user_id)
+    bump_corpus_version(user_id)
 
 
 def copy_chroma_to_tmp(user_id: str = "nobody"):
@@ -256,6 +355,7 @@ def sync_chroma_from_s3(user_id: str):
     print(f"Persist directory for chroma from s3 to local: {local_path}")
     os.makedirs(local_path, exist_ok=True)
 
+    s3_client = get_s3_client()
     response = s3_client.list_objects_v2(
         Bucket=BUCKET_NAME,
         Prefix=prefix
@@ -275,6 +375,7 @@ def sync_chroma_to_s3(user_id: str):
     prefix = f"chroma/{user_id}/"
     local_path = get_runtime_chroma_path(user_id)
     print(f"Persist directory for chroma from local to s3: {local_path}")
+    s3_client = get_s3_client()
 
     for root, dirs, files in os.walk(local_path):
         for file in files:
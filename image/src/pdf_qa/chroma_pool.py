@@ -0,0 +1,169 @@
+from collections import OrderedDict
+from dataclasses import dataclass, asdict
+from typing import Any, Callable
+from langchain_chroma import Chroma
+from langchain_core.documents import Document
+from langchain_core.runnables.config import run_in_executor
+from .vector_store import relevance_from_distance
+import os
+import threading
+import time
+
+
+CHROMA_POOL_MAX_SIZE = int(os.environ.get("CHROMA_POOL_MAX_SIZE", 32))
+CHROMA_POOL_IDLE_SECONDS = float(os.environ.get("CHROMA_POOL_IDLE_SECONDS", 900))
+
+
+class RelevanceChroma(Chroma):
+    """
+    A `Chroma` handle whose searches by vector return cosine similarities like every other vector store backend, see `VectorStoreBackend`. Chroma itself returns distances in the collection's distance metric, which are converted with `relevance_from_distance`.
+    """
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        space = (self._collection.metadata or {}).get("hnsw:space", "l2")
+        results = super().similarity_search_by_vector_with_relevance_scores(embedding, k=k, **kwargs)
+        return [(doc, relevance_from_distance(distance, space)) for doc, distance in results]
+
+
+    async def asimilarity_search_by_vector_with_relevance_scores(self, embedding: list[float], k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return await run_in_executor(None, self.similarity_search_by_vector_with_relevance_scores, embedding, k, **kwargs)
+
+
+@dataclass
+class ChromaPoolStats:
+    hits: int = 0
+    misses: int = 0
+    evictions: int = 0
+    size: int = 0
+
+
+class ChromaPool:
+    """
+    A process-wide pool which keeps a single Chroma HTTP client and caches `Chroma` vector store handles per user_id.
+
+    Handles are kept in an LRU which is bounded by `max_size` and evicts handles that have not been used for `idle_seconds`. Warm Lambda invocations and a long-running uvicorn server therefore reuse the same connection instead of paying for a fresh TLS handshake on every request.
+
+    Parameters:
+    client_factory (Callable): Creates the shared client. Returns None if the client can't be created (e.g. missing API key).
+    embeddings_factory (Callable): Creates the shared embedding function.
+    max_size (int): The maximum number of cached collection handles.
+    idle_seconds (float): The number of seconds after which an unused handle is evicted.
+    """
+
+    def __init__(
+        self,
+        client_factory: Callable,
+        embeddings_factory: Callable,
+        max_size: int = CHROMA_POOL_MAX_SIZE,
+        idle_seconds: float = CHROMA_POOL_IDLE_SECONDS,
+        clock: Callable[[], float] = time.monotonic,
+    ):
+        self.client_factory = client_factory
+        self.embeddings_factory = embeddings_factory
+        self.max_size = max_size
+        self.idle_seconds = idle_seconds
+        self.clock = clock
+        self._client = None
+        self._embeddings = None
+        self._handles: OrderedDict[str, tuple[Chroma, float]] = OrderedDict()
+        self._stats = ChromaPoolStats()
+        self._lock = threading.RLock()
+
+
+    def get_client(self):
+        """
+        Returns the shared client, creating it on first use.
+        """
+        with self._lock:
+            if self._client is None:
+                self._client = self.client_factory()
+            return self._client
+
+
+    def get(self, user_id: str) -> RelevanceChroma | None:
+        """
+        Returns the cached `Chroma` handle for the given user_id, creating it on a cache miss.
+
+        Parameters:
+        user_id (str): The user_id which is used as the collection name.
+
+        Returns:
+        RelevanceChroma | None: The vector store handle, or None if the shared client is not available.
+        """
+        with self._lock:
+            now = self.clock()
+            self._evict_idle(now)
+
+            if user_id in self._handles:
+                handle, _ = self._handles.pop(user_id)
+                self._handles[user_id] = (handle, now)
+                self._stats.hits += 1
+                return handle
+
+            self._stats.misses += 1
+            client = self.get_client()
+            if client is None:
+                return None
+            if self._embeddings is None:
+                self._embeddings = self.embeddings_factory()
+
+            # this loads existing one and doesn't create fresh db every time
+            handle = RelevanceChroma(
+                collection_name=user_id,
+                embedding_function=self._embeddings,
+                client=client
+            )
+            self._handles[user_id] = (handle, now)
+            while len(self._handles) > self.max_size:
+                self._handles.popitem(last=False)
+                self._stats.evictions += 1
+            return handle
+
+
+    def invalidate(self, user_id: str):
+        """
+        Drops the cached handle of the given user_id, e.g. after its collection has been deleted.
+        """
+        with self._lock:
+            self._handles.pop(user_id, None)
+
+
+    def clear(self, user_id: str):
+        """
+        Deletes the collection of the given user_id and drops its cached handle.
+        """
+        client = self.get_client()
+        if client is None:
+            return
+        client.delete_collection(name=user_id)
+        self.invalidate(user_id)
+
+
+    def reset(self):
+        """
+        Drops the shared client, the embedding function and every cached handle.
+        """
+        with self._lock:
+            self._handles.clear()
+            self._client = None
+            self._embeddings = None
+
+
+    def stats(self) -> dict:
+        """
+        Returns the cache hit/miss/eviction counts and the current number of cached handles.
+        """
+        with self._lock:
+            self._stats.size = len(self._handles)
+            return asdict(self._stats)
+
+
+    def _evict_idle(self, now: float):
+        expired = [
+            user_id
+            for user_id, (_, last_used) in self._handles.items()
+            if now - last_used > self.idle_seconds
+        ]
+        for user_id in expired:
+            del self._handles[user_id]
+            self._stats.evictions += 1
@@ -0,0 +1,180 @@
+from dataclasses import dataclass, field
+from langchain_core.documents import Document
+import os
+
+
+CONTEXT_CANDIDATES = int(os.environ.get("CONTEXT_CANDIDATES", 20))
+CONTEXT_MAX_CHUNKS = int(os.environ.get("CONTEXT_MAX_CHUNKS", 5))
+CONTEXT_TOKEN_BUDGET = int(os.environ.get("CONTEXT_TOKEN_BUDGET", 1500))
+CONTEXT_MMR_LAMBDA = float(os.environ.get("CONTEXT_MMR_LAMBDA", 0.7))
+CONTEXT_DUPLICATE_THRESHOLD = float(os.environ.get("CONTEXT_DUPLICATE_THRESHOLD", 0.8))
+CONTEXT_SEPARATOR = '\n\n---\n\n'
+# The text splitter overlaps adjacent chunks by up to 100 characters
+MAX_OVERLAP_CHARS = 300
+# Shorter overlaps only count if they are whole words, anything else is a coincidence
+MIN_OVERLAP_CHARS = 20
+SHINGLE_SIZE = 5
+CHARS_PER_TOKEN = 4
+
+
+@dataclass
+class BuiltContext:
+    text: str
+    results: list[tuple[Document, float]] = field(default_factory=list)
+    tokens: int = 0
+    baseline_tokens: int = 0
+
+    @property
+    def tokens_saved(self) -> int:
+        return self.baseline_tokens - self.tokens
+
+
+def build_context(
+    results: list[tuple[Document, float]],
+    token_budget: int = CONTEXT_TOKEN_BUDGET,
+    max_chunks: int = CONTEXT_MAX_CHUNKS,
+    mmr_lambda: float = CONTEXT_MMR_LAMBDA,
+    baseline_chunks: int = 5,
+) -> BuiltContext:
+    """
+    Assembles the prompt context from a pool of retrieved chunks.
+
+    Chunks are picked by maximal marginal relevance: each pick maximizes `mmr_lambda * relevance - (1 - mmr_lambda) * similarity` to the chunks already picked. The similarity is the Jaccard similarity of word shingles, and chunks at least `CONTEXT_DUPLICATE_THRESHOLD` similar to a picked chunk, e.g. from re-uploaded files, are never picked. Picking stops at `max_chunks` chunks, and chunks which would exceed `token_budget` are skipped. Picked chunks which are adjacent on the same page are merged into one passage without their overlapping text.
+
+    Parameters:
+    results (list[tuple[Document, float]]): The retrieved chunks with their relevance scores, best first.
+    token_budget (int): The maximum number of context tokens, estimated as characters / 4.
+    max_chunks (int): The maximum number of chunks in the context.
+    mmr_lambda (float): The trade-off between relevance (1) and diversity (0).
+    baseline_chunks (int): The number of top chunks the plain concatenation would have used, to report the tokens saved.
+
+    Returns:
+    BuiltContext: The context text, the picked chunks with their scores, and its token count compared with the plain concatenation of the top chunks.
+    """
+    baseline_tokens = estimate_tokens(CONTEXT_SEPARATOR.join(doc.page_content for doc, _ in results[:baseline_chunks]))
+    candidates = dedup_exact(results)
+    if not candidates:
+        return BuiltContext(text="", baseline_tokens=baseline_tokens)
+
+    scores = [score for _, score in candidates]
+    low, high = min(scores), max(scores)
+    relevance = [(score - low) / (high - low) if high > low else 1.0 for score in scores]
+    shingles = [get_shingles(doc.page_content) for doc, _ in candidates]
+
+    picked: list[int] = []
+    tokens = 0
+    remaining = list(range(len(candidates)))
+    while remaining and len(picked) < max_chunks:
+        best, best_value, best_redundancy = None, None, 0.0
+        for i in remaining:
+            redundancy = max((jaccard(shingles[i], shingles[j]) for j in picked), default=0.0)
+            value = mmr_lambda * relevance[i] - (1 - mmr_lambda) * redundancy
+            if best_value is None or value > best_value:
+                best, best_value, best_redundancy = i, value, redundancy
+        remaining.remove(best)
+        if best_redundancy >= CONTEXT_DUPLICATE_THRESHOLD:
+            continue
+        cost = estimate_tokens(candidates[best][0].page_content)
+        # The best chunk is always kept, even if it alone exceeds the budget
+        if picked and tokens + cost > token_budget:
+            continue
+        picked.append(best)
+        tokens += cost
+
+    passages = merge_adjacent([candidates[i] for i in picked])
+    text = CONTEXT_SEPARATOR.join(passages)
+    return BuiltContext(
+        text=text,
+        results=[candidates[i] for i in picked],
+        tokens=estimate_tokens(text),
+        baseline_tokens=baseline_tokens,
+    )
+
+
+def merge_adjacent(picked: list[tuple[Document, float]]) -> list[str]:
+    """
+    Merges chunks with consecutive indices on the same source and page into one passage and strips the text they overlap by. Passages keep the order of their best chunk.
+
+    The overlap is taken from the chunks' `start_index` on the page. Chunks stored without it fall back to `find_overlap`.
+    """
+    groups: dict[tuple, list[tuple[int, str, int | None]]] = {}
+    for doc, _ in picked:
+        source, page, index = parse_chunk_position(doc)
+        key = (source, page) if index is not None else (id(doc),)
+        groups.setdefault(key, []).append((index or 0, doc.page_content, doc.metadata.get('start_index')))
+
+    passages = []
+    for chunks in groups.values():
+        chunks.sort(key=lambda chunk: chunk[0])
+        previous_index, passage, start = chunks[0]
+        end = start + len(passage) if start is not None else None
+        for index, text, start in chunks[1:]:
+            if index == previous_index + 1:
+                if end is not None and start is not None:
+                    overlap = max(min(end - start, len(text)), 0)
+                else:
+                    overlap = find_overlap(passage, text)
+                # The splitter strips the whitespace it split at, so chunks which don't overlap are joined with a space
+                passage += text[overlap:] if overlap else " " + text
+            else:
+                passages.append(passage)
+                passage = text
+            previous_index = index
+            end = start + len(text) if start is not None else None
+        passages.append(passage)
+    return passages
+
+
+def find_overlap(previous: str, text: str) -> int:
+    """
+    Returns the length of the longest suffix of `previous` which is a prefix of `text` and either spans whole words or is at least `MIN_OVERLAP_CHARS` long, or 0 if there is none.
+    """
+    for size in range(min(len(previous), len(text), MAX_OVERLAP_CHARS), 0, -1):
+        if not previous.endswith(text[:size]):
+            continue
+        starts_at_word = size == len(previous) or previous[-size - 1].isspace()
+        ends_at_word = size == len(text) or text[size].isspace() or text[size - 1].isspace()
+        if size >= MIN_OVERLAP_CHARS or (starts_at_word and ends_at_word):
+            return size
+    return 0
+
+
+def parse_chunk_position(doc: Document) -> tuple[str, int | None, int | None]:
+    """
+    Parses source, page and chunk index from the chunk id `{source}:{page}:{chunk}:{content_hash}`.
+    """
+    parts = str(doc.metadata.get('id', '')).split(':')
+    if len(parts) < 4:
+        return doc.metadata.get('source', ''), doc.metadata.get('page'), None
+    try:
+        return parts[0], int(parts[1]), int(parts[2])
+    except ValueError:
+        return parts[0], None, None
+
+
+def dedup_exact(results: list[tuple[Document, float]]) -> list[tuple[Document, float]]:
+    seen = set()
+    unique = []
+    for doc, score in results:
+        key = " ".join(doc.page_content.split())
+        if key not in seen:
+            seen.add(key)
+            unique.append((doc, score))
+    return unique
+
+
+def get_shingles(text: str) -> set[tuple[str, ...]]:
+    words = text.lower().split()
+    if len(words) <= SHINGLE_SIZE:
+        return {tuple(words)}
+    return {tuple(words[i:i + SHINGLE_SIZE]) for i in range(len(words) - SHINGLE_SIZE + 1)}
+
+
+def jaccard(a: set, b: set) -> float:
+    if not a or not b:
+        return 0.0
+    return len(a & b) / len(a | b)
+
+
+def estimate_tokens(text: str) -> int:
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
@@ -0,0 +1,165 @@
+from bisect import bisect_right
+from boto3.dynamodb.conditions import Key
+from botocore.exceptions import ClientError
+from dataclasses import dataclass, asdict
+from .ingestion_manifest import IngestionManifest, ManifestEntry
+import base64
+import binascii
+import boto3
+import json
+import os
+import threading
+
+
+DOCUMENT_TABLE_NAME = os.environ.get("DOCUMENT_TABLE_NAME")
+CATALOG_PAGE_SIZE = int(os.environ.get("CATALOG_PAGE_SIZE", 50))
+CATALOG_MAX_PAGE_SIZE = 200
+
+# boto3 resources are not thread-safe, so every thread gets its own table handle
+_thread_local = threading.local()
+
+
+@dataclass
+class CatalogEntry:
+    filename: str
+    size: int
+    page_count: int
+    chunk_count: int
+    content_hash: str
+    indexed_at: int
+
+
+    @classmethod
+    def from_manifest_entry(cls, entry: ManifestEntry) -> "CatalogEntry":
+        return cls(
+            filename=entry.filename,
+            size=entry.size,
+            page_count=entry.page_count,
+            chunk_count=len(entry.chunk_ids),
+            content_hash=entry.content_hash,
+            indexed_at=entry.ingested_at,
+        )
+
+
+@dataclass
+class CatalogPage:
+    documents: list[CatalogEntry]
+    next_cursor: str | None = None
+
+
+class InvalidCursor(ValueError):
+    pass
+
+
+def get_document_table():
+    table = getattr(_thread_local, "table", None)
+    if table is None:
+        table = boto3.session.Session().resource("dynamodb").Table(DOCUMENT_TABLE_NAME)
+        _thread_local.table = table
+    return table
+
+
+def list_documents(user_id: str, limit: int = CATALOG_PAGE_SIZE, cursor: str | None = None) -> CatalogPage:
+    """
+    Returns one page of a user's document catalog, ordered by filename.
+
+    With `DOCUMENT_TABLE_NAME` set, the page is a single query of at most `limit` items on the catalog table, so listing costs the same for a user with thousands of PDFs. Otherwise the catalog is read from the user's ingestion manifest. Neither lists the source files.
+
+    Parameters:
+    user_id (str): The user_id whose documents should be listed.
+    limit (int): The maximum number of documents of the page.
+    cursor (str | None): The `next_cursor` of the previous page, or None for the first page.
+
+    Returns:
+    CatalogPage: The documents of the page and the cursor of the next page, which is None on the last page.
+    """
+    after = decode_cursor(cursor) if cursor else None
+    if not DOCUMENT_TABLE_NAME:
+        return list_manifest_documents(user_id, limit, after)
+
+    query_args = {"KeyConditionExpression": Key("user_id").eq(user_id), "Limit": limit}
+    if after is not None:
+        # The key is rebuilt from the user_id, so a cursor can't page into another user's documents
+        query_args["ExclusiveStartKey"] = {"user_id": user_id, "filename": after}
+    response = get_document_table().query(**query_args)
+    documents = [
+        CatalogEntry(
+            filename=item["filename"],
+            size=int(item["size"]),
+            page_count=int(item["page_count"]),
+            chunk_count=int(item["chunk_count"]),
+            content_hash=item["content_hash"],
+            indexed_at=int(item["indexed_at"]),
+        )
+        for item in response.get("Items", [])
+    ]
+    last_key = response.get("LastEvaluatedKey")
+    return CatalogPage(documents=documents, next_cursor=encode_cursor(last_key["filename"]) if last_key else None)
+
+
+def list_manifest_documents(user_id: str, limit: int, after: str | None = None) -> CatalogPage:
+    manifest = IngestionManifest.load(user_id)
+    filenames = sorted(manifest.entries)
+    start = bisect_right(filenames, after) if after is not None else 0
+    page = filenames[start:start + limit]
+    has_more = start + limit < len(filenames)
+    return CatalogPage(
+        documents=[CatalogEntry.from_manifest_entry(manifest.entries[filename]) for filename in page],
+        next_cursor=encode_cursor(page[-1]) if has_more else None,
+    )
+
+
+def update_catalog(user_id: str, entries: list[ManifestEntry], removed_files: list[str]):
+    """
+    Writes the catalog entries of newly ingested files and deletes those of removed files, in batches of up to 25 writes. Without `DOCUMENT_TABLE_NAME` there is nothing to do, as the manifest is the catalog.
+    """
+    if not DOCUMENT_TABLE_NAME or not (entries or removed_files):
+        return
+    try:
+        with get_document_table().batch_writer(overwrite_by_pkeys=["user_id", "filename"]) as batch:
+            for entry in entries:
+                batch.put_item(Item={"user_id": user_id, **asdict(CatalogEntry.from_manifest_entry(entry))})
+            for filename in removed_files:
+                batch.delete_item(Key={"user_id": user_id, "filename": filename})
+    except ClientError as e:
+        error = e.response.get("Error", {})
+        message = error.get("Message", "Unknown error")
+        print("ClientError:", message)
+        raise e
+    print(f"Document catalog of {user_id}: {len(entries)} updated, {len(removed_files)} removed")
+
+
+def clear_catalog(user_id: str):
+    """
+    Deletes every catalog entry of the given user_id. Without `DOCUMENT_TABLE_NAME` there is nothing to do, as the manifest is the catalog.
+    """
+    if not DOCUMENT_TABLE_NAME:
+        return
+    table = get_document_table()
+    query_args = {
+        "KeyConditionExpression": Key("user_id").eq(user_id),
+        "ProjectionExpression": "#filename",
+        "ExpressionAttributeNames": {"#filename": "filename"},
+    }
+    filenames = []
+    while True:
+        response = table.query(**query_args)
+        filenames.extend(item["filename"] for item in response.get("Items", []))
+        if "LastEvaluatedKey" not in response:
+            break
+        query_args["ExclusiveStartKey"] = response["LastEvaluatedKey"]
+    update_catalog(user_id, [], filenames)
+
+
+def encode_cursor(filename: str) -> str:
+    return base64.urlsafe_b64encode(json.dumps({"filename": filename}).encode("utf-8")).decode("ascii")
+
+
+def decode_cursor(cursor: str) -> str:
+    try:
+        filename = json.loads(base64.urlsafe_b64decode(cursor.encode("ascii")))["filename"]
+    except (binascii.Error, UnicodeError, ValueError, TypeError, KeyError) as e:
+        raise InvalidCursor(f"Invalid cursor: {cursor}") from e
+    if not isinstance(filename, str):
+        raise InvalidCursor(f"Invalid cursor: {cursor}")
+    return filename
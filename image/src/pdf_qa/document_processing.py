@@ -1,14 +1,14 @@
 from botocore.exceptions import ClientError
-from langchain_community.document_loaders import PyPDFDirectoryLoader
 from langchain_text_splitters import RecursiveCharacterTextSplitter
 from langchain_core.documents import Document
+from .pdf_extraction import iter_pdf_documents, list_pdf_files
+from .s3_sync import sync_s3_prefix
 from pathlib import Path
+from typing import Iterable, Iterator
 import os
-import boto3
 
 
 IS_USING_IMAGE_RUNTIME = bool(os.environ.get("IS_USING_IMAGE_RUNTIME", False))
-BUCKET_NAME = os.environ.get("BUCKET_NAME")
 
 
 def load_documents(user_id: str = "nobody"):
@@ -20,45 +20,49 @@ def load_documents(user_id: str = "nobody"):
     Returns:
     list[Document]: A list of documents, each corresponding to a page from any of the PDF files in the directory
     """
-    if IS_USING_IMAGE_RUNTIME:
-        temp_dir = os.path.join("/tmp", "data", "source", user_id)
-    else:
-        temp_dir = Path(__file__).parent.parent / "data" / "source" / user_id
+    return list(iter_documents(user_id))
+
+
+def iter_documents(user_id: str = "nobody") -> Iterator[Document]:
+    """
+    Lazily yields the pages of the PDF documents associated with the specified user_id, in the same order as `load_documents` returns them.
+
+    Parameters:
+    user_id (str): The user_id string which corresponds to the directory name. Defaults to "nobody" if not provided.
+
+    Yields:
+    Document: A document corresponding to a page from any of the PDF files in the directory
+    """
+    temp_dir = get_source_dir(user_id)
     os.makedirs(temp_dir, exist_ok=True)
 
     if 'AWS_EXECUTION_ENV' in os.environ:
         prefix = f"source/{user_id}/"
 
         try:
-            s3_client = boto3.client('s3')
-            response = s3_client.list_objects_v2(
-                Bucket=BUCKET_NAME,
-                Prefix=prefix
-            )
+            sync_report = sync_s3_prefix(prefix, temp_dir)
         except ClientError as e:
             print(f"Client error: {e}")
-            return []
+            return
 
-        if 'Contents' not in response:
+        if not (sync_report.downloaded_files or sync_report.skipped_files):
             print("No documents found in S3 for user.")
-            return []
-
-        for obj in response['Contents']:
-            key = obj['Key']
-            filename = key[len(prefix):]
-            if filename:
-                local_path = os.path.join(temp_dir, filename)
-
-                try:
-                    s3_client.download_file(BUCKET_NAME, key, local_path)
-                    print(f"Downloaded {filename} to {local_path}")
-                except ClientError as e:
-                    print(f"Failed to download {filename} to {local_path}")
-                    print(f"Client error: {e}")
-
-    loader = PyPDFDirectoryLoader(temp_dir)
+            return
+
     print(f"Load pdf documents from {temp_dir}")
-    return loader.load()
+    yield from iter_pdf_documents(list_pdf_files(temp_dir))
+
+
+def get_source_dir(user_id: str = "nobody") -> str:
+    """
+    Get the directory which holds the source PDFs of the given user_id depending on runtime.
+
+    Returns:
+    str: The source directory path.
+    """
+    if IS_USING_IMAGE_RUNTIME:
+        return os.path.join("/tmp", "data", "source", user_id)
+    return str(Path(__file__).parent.parent / "data" / "source" / user_id)
 
 
 def split_documents(documents: list[Document]):
@@ -71,10 +75,30 @@ def split_documents(documents: list[Document]):
     Returns:
     list[Document]: A list of split document chunks
     """
-    text_splitter = RecursiveCharacterTextSplitter(
+    return get_text_splitter().split_documents(documents)
+
+
+def iter_split_documents(documents: Iterable[Document]) -> Iterator[Document]:
+    """
+    Lazily splits a stream of documents into the same chunks as `split_documents`, one document at a time.
+
+    Parameters:
+    documents (Iterable[Document]): The documents to be split into chunks
+
+    Yields:
+    Document: A split document chunk
+    """
+    text_splitter = get_text_splitter()
+    for document in documents:
+        yield from text_splitter.split_documents([document])
+
+
+def get_text_splitter():
+    return RecursiveCharacterTextSplitter(
         chunk_size=1000,
         chunk_overlap=100,
         length_function=len,
-        is_separator_regex=False
+        is_separator_regex=False,
+        # Lets the context builder merge adjacent chunks without guessing their overlap
+        add_start_index=True
     )
-    return text_splitter.split_documents(documents)
@@ -1,5 +1,10 @@
 from langchain_google_genai import GoogleGenerativeAIEmbeddings
 from utils.api_key_loader import get_google_api_key
+from .embedding_cache import EMBEDDING_CACHE_ENABLED, CachedEmbeddings, EmbeddingCache, get_embedding_cache_path
+from .embedding_service import BatchedEmbeddings
+
+
+EMBEDDING_MODEL = "models/text-embedding-004"
 
 
 def generate_embedding():
@@ -7,13 +12,16 @@ def generate_embedding():
     Generates an embedding using the Google Generative AI model.
 
     Note:
-    This function assumes that the `GoogleGenerativeAIEmbeddings` class is available and properly configure to connect to the Google AI services.
+    This function assumes that the `GoogleGenerativeAIEmbeddings` class is available and properly configure to connect to the Google AI services. The model is wrapped in a `BatchedEmbeddings`, which embeds documents in concurrent, rate-limited batches, and in a `CachedEmbeddings` unless `EMBEDDING_CACHE_ENABLED` is false, so chunks which have been embedded before are served from disk.
 
     Returns:
-    embeddings: An instance of the GoogleGenerativeAIEmbeddings class.
+    embeddings: An instance of the CachedEmbeddings (or BatchedEmbeddings) class wrapping GoogleGenerativeAIEmbeddings.
     """
     embeddings = GoogleGenerativeAIEmbeddings(
-        model="models/text-embedding-004",
+        model=EMBEDDING_MODEL,
         google_api_key=get_google_api_key()
     )
-    return embeddings
+    batched_embeddings = BatchedEmbeddings(embeddings)
+    if not EMBEDDING_CACHE_ENABLED:
+        return batched_embeddings
+    return CachedEmbeddings(batched_embeddings, EmbeddingCache(get_embedding_cache_path()), EMBEDDING_MODEL)
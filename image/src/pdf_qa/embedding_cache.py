@@ -0,0 +1,186 @@
+from langchain_core.embeddings import Embeddings
+from pathlib import Path
+import hashlib
+import os
+import sqlite3
+import threading
+import time
+import numpy as np
+
+
+IS_USING_IMAGE_RUNTIME = bool(os.environ.get("IS_USING_IMAGE_RUNTIME", False))
+EMBEDDING_CACHE_ENABLED = os.environ.get("EMBEDDING_CACHE_ENABLED", "true").lower() == "true"
+EMBEDDING_CACHE_MAX_ENTRIES = int(os.environ.get("EMBEDDING_CACHE_MAX_ENTRIES", 200000))
+# SQLite limits the number of bound parameters per statement
+SQLITE_MAX_VARIABLES = 900
+
+
+class EmbeddingCache:
+    """
+    Disk-backed embedding cache, keyed by the SHA-256 hash of a chunk's content and the name of the embedding model.
+
+    Vectors are stored as float32 blobs in SQLite. Once the cache holds more than `max_entries` vectors, the least recently used ones are evicted.
+
+    Parameters:
+    path (str): The path of the SQLite database file.
+    max_entries (int): The maximum number of cached vectors.
+    """
+
+    def __init__(self, path: str, max_entries: int = EMBEDDING_CACHE_MAX_ENTRIES):
+        self.path = path
+        self.max_entries = max_entries
+        self.hits = 0
+        self.misses = 0
+        self.evictions = 0
+        self._lock = threading.Lock()
+        os.makedirs(os.path.dirname(path) or ".", exist_ok=True)
+        self._connection = sqlite3.connect(path, check_same_thread=False)
+        self._connection.execute("PRAGMA journal_mode=WAL")
+        self._connection.execute(
+            """
+            CREATE TABLE IF NOT EXISTS embeddings (
+                model TEXT NOT NULL,
+                content_hash TEXT NOT NULL,
+                vector BLOB NOT NULL,
+                last_access REAL NOT NULL,
+                PRIMARY KEY (model, content_hash)
+            )
+            """
+        )
+        self._connection.execute("CREATE INDEX IF NOT EXISTS embeddings_last_access ON embeddings (last_access)")
+        self._connection.commit()
+
+
+    def get_many(self, model: str, content_hashes: list[str]) -> dict[str, list[float]]:
+        """
+        Looks up the vectors of the given content hashes.
+
+        Parameters:
+        model (str): The name of the embedding model.
+        content_hashes (list[str]): The content hashes to look up.
+
+        Returns:
+        dict[str, list[float]]: The cached vectors by content hash. Hashes which are not cached are missing.
+        """
+        unique_hashes = list(dict.fromkeys(content_hashes))
+        found = {}
+        with self._lock:
+            for i in range(0, len(unique_hashes), SQLITE_MAX_VARIABLES):
+                hashes = unique_hashes[i:i + SQLITE_MAX_VARIABLES]
+                placeholders = ",".join("?" * len(hashes))
+                rows = self._connection.execute(
+                    f"SELECT content_hash, vector FROM embeddings WHERE model = ? AND content_hash IN ({placeholders})",
+                    [model, *hashes]
+                ).fetchall()
+                for content_hash, vector in rows:
+                    found[content_hash] = np.frombuffer(vector, dtype=np.float32).tolist()
+
+            if found:
+                now = time.time()
+                self._connection.executemany(
+                    "UPDATE embeddings SET last_access = ? WHERE model = ? AND content_hash = ?",
+                    [(now, model, content_hash) for content_hash in found]
+                )
+                self._connection.commit()
+            self.hits += len(found)
+            self.misses += len(unique_hashes) - len(found)
+        return found
+
+
+    def put_many(self, model: str, vectors: dict[str, list[float]]):
+        """
+        Stores the given vectors and evicts the least recently used ones if the cache is full.
+
+        Parameters:
+        model (str): The name of the embedding model.
+        vectors (dict[str, list[float]]): The vectors by content hash.
+        """
+        if not vectors:
+            return
+        now = time.time()
+        with self._lock:
+            self._connection.executemany(
+                "INSERT OR REPLACE INTO embeddings (model, content_hash, vector, last_access) VALUES (?, ?, ?, ?)",
+                [
+                    (model, content_hash, np.asarray(vector, dtype=np.float32).tobytes(), now)
+                    for content_hash, vector in vectors.items()
+                ]
+            )
+            self._evict()
+            self._connection.commit()
+
+
+    def stats(self) -> dict:
+        """
+        Returns the hit/miss counts, the hit rate, the number of evictions and the number of cached vectors.
+        """
+        with self._lock:
+            entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+            lookups = self.hits + self.misses
+            return {
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_rate": self.hits / lookups if lookups else 0.0,
+                "evictions": self.evictions,
+                "entries": entries,
+            }
+
+
+    def _evict(self):
+        entries = self._connection.execute("SELECT COUNT(*) FROM embeddings").fetchone()[0]
+        excess = entries - self.max_entries
+        if excess > 0:
+            self._connection.execute(
+                "DELETE FROM embeddings WHERE rowid IN (SELECT rowid FROM embeddings ORDER BY last_access LIMIT ?)",
+                (excess,)
+            )
+            self.evictions += excess
+
+
+class CachedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model and serves document embeddings from an `EmbeddingCache`, so identical chunks (re-uploaded PDFs, shared boilerplate pages, re-ingests) are never embedded twice.
+
+    Parameters:
+    embeddings (Embeddings): The underlying embedding model.
+    cache (EmbeddingCache): The cache to read from and write to.
+    model (str): The name of the embedding model, which is part of the cache key.
+    """
+
+    def __init__(self, embeddings: Embeddings, cache: EmbeddingCache, model: str):
+        self.embeddings = embeddings
+        self.cache = cache
+        self.model = model
+
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        content_hashes = [hash_text(text) for text in texts]
+        vectors = self.cache.get_many(self.model, content_hashes)
+
+        missing = {}
+        for content_hash, text in zip(content_hashes, texts):
+            if content_hash not in vectors:
+                missing[content_hash] = text
+        if missing:
+            new_vectors = dict(zip(missing, self.embeddings.embed_documents(list(missing.values()))))
+            self.cache.put_many(self.model, new_vectors)
+            vectors.update(new_vectors)
+
+        return [vectors[content_hash] for content_hash in content_hashes]
+
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embeddings.embed_query(text)
+
+
+def hash_text(text: str) -> str:
+    """
+    Hashes a text the same way `generate_content_hash` hashes a chunk's content.
+    """
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+def get_embedding_cache_path() -> str:
+    if IS_USING_IMAGE_RUNTIME:
+        return os.path.join("/tmp", "data", "embedding_cache.sqlite3")
+    return str(Path(__file__).parent.parent / "data" / "embedding_cache.sqlite3")
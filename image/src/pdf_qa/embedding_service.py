@@ -0,0 +1,264 @@
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass
+from langchain_core.embeddings import Embeddings
+import os
+import random
+import threading
+import time
+
+
+EMBEDDING_BATCH_SIZE = int(os.environ.get("EMBEDDING_BATCH_SIZE", 32))
+EMBEDDING_BATCH_MAX_CHARS = int(os.environ.get("EMBEDDING_BATCH_MAX_CHARS", 60000))
+EMBEDDING_MAX_CONCURRENCY = int(os.environ.get("EMBEDDING_MAX_CONCURRENCY", 4))
+EMBEDDING_REQUESTS_PER_MINUTE = float(os.environ.get("EMBEDDING_REQUESTS_PER_MINUTE", 1500))
+EMBEDDING_MAX_RETRIES = int(os.environ.get("EMBEDDING_MAX_RETRIES", 5))
+EMBEDDING_RETRY_BASE_SECONDS = float(os.environ.get("EMBEDDING_RETRY_BASE_SECONDS", 1))
+
+RATE_LIMIT_MARKERS = ("429", "resource_exhausted", "resource exhausted", "quota", "rate limit", "too many requests")
+
+
+class TokenBucket:
+    """
+    Thread-safe token bucket which limits how many requests are started per second.
+
+    Parameters:
+    rate (float): The number of tokens added per second. 0 disables the limit.
+    capacity (float): The maximum number of tokens, i.e. the largest allowed burst.
+    """
+
+    def __init__(self, rate: float, capacity: float, clock=time.monotonic, sleep=time.sleep):
+        self.rate = rate
+        self.capacity = capacity
+        self.clock = clock
+        self.sleep = sleep
+        self._tokens = capacity
+        self._updated_at = clock()
+        self._lock = threading.Lock()
+
+
+    def acquire(self, tokens: float = 1):
+        """
+        Blocks until the given number of tokens is available and takes them.
+        """
+        if self.rate <= 0:
+            return
+        while True:
+            with self._lock:
+                now = self.clock()
+                self._tokens = min(self.capacity, self._tokens + (now - self._updated_at) * self.rate)
+                self._updated_at = now
+                if self._tokens >= tokens:
+                    self._tokens -= tokens
+                    return
+                wait_seconds = (tokens - self._tokens) / self.rate
+            self.sleep(wait_seconds)
+
+
+class AdaptiveConcurrencyLimiter:
+    """
+    Limits the number of requests in flight, halving the limit on every rate-limit response and growing it back by about one request per round of successful requests (AIMD).
+
+    Parameters:
+    max_limit (int): The upper bound of concurrent requests.
+    min_limit (int): The lower bound of concurrent requests.
+    """
+
+    def __init__(self, max_limit: int, min_limit: int = 1):
+        self.max_limit = max_limit
+        self.min_limit = min_limit
+        self.limit = float(max_limit)
+        self._in_flight = 0
+        self._condition = threading.Condition()
+
+
+    def acquire(self):
+        with self._condition:
+            while self._in_flight >= int(self.limit):
+                self._condition.wait()
+            self._in_flight += 1
+
+
+    def release(self, is_rate_limited: bool = False):
+        with self._condition:
+            self._in_flight -= 1
+            if is_rate_limited:
+                self.limit = max(float(self.min_limit), self.limit / 2)
+            else:
+                self.limit = min(float(self.max_limit), self.limit + 1 / self.limit)
+            self._condition.notify_all()
+
+
+@dataclass
+class EmbeddingMetrics:
+    chunks: int = 0
+    requests: int = 0
+    retries: int = 0
+    rate_limited: int = 0
+    seconds: float = 0.0
+
+    @property
+    def chunks_per_second(self) -> float:
+        return self.chunks / self.seconds if self.seconds else 0.0
+
+
+class BatchedEmbeddings(Embeddings):
+    """
+    Wraps an embedding model and embeds documents in size-bounded batches with several requests in flight.
+
+    Requests are started through a token bucket (`requests_per_minute`), and the number of concurrent requests adapts to rate-limit (429/quota) responses, which are retried with exponential backoff.
+
+    Parameters:
+    embeddings (Embeddings): The underlying embedding model, e.g. `GoogleGenerativeAIEmbeddings`.
+    batch_size (int): The maximum number of texts per request.
+    batch_max_chars (int): The maximum number of characters per request.
+    max_concurrency (int): The maximum number of requests in flight.
+    requests_per_minute (float): The maximum request rate. 0 disables the limit.
+    max_retries (int): How often a rate-limited request is retried.
+    """
+
+    def __init__(
+        self,
+        embeddings: Embeddings,
+        batch_size: int = EMBEDDING_BATCH_SIZE,
+        batch_max_chars: int = EMBEDDING_BATCH_MAX_CHARS,
+        max_concurrency: int = EMBEDDING_MAX_CONCURRENCY,
+        requests_per_minute: float = EMBEDDING_REQUESTS_PER_MINUTE,
+        max_retries: int = EMBEDDING_MAX_RETRIES,
+        retry_base_seconds: float = EMBEDDING_RETRY_BASE_SECONDS,
+        sleep=time.sleep,
+    ):
+        self.embeddings = embeddings
+        self.batch_size = batch_size
+        self.batch_max_chars = batch_max_chars
+        self.max_concurrency = max_concurrency
+        self.max_retries = max_retries
+        self.retry_base_seconds = retry_base_seconds
+        self.sleep = sleep
+        self.token_bucket = TokenBucket(
+            rate=requests_per_minute / 60,
+            capacity=max(1, max_concurrency),
+            sleep=sleep
+        )
+        self.limiter = AdaptiveConcurrencyLimiter(max_concurrency)
+        self._metrics = EmbeddingMetrics()
+        self._metrics_lock = threading.Lock()
+        self._executor = None
+        self._executor_lock = threading.Lock()
+
+
+    @property
+    def model(self) -> str:
+        return getattr(self.embeddings, "model", type(self.embeddings).__name__)
+
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        """
+        Embeds the given texts, keeping up to `max_concurrency` batch requests in flight.
+
+        Parameters:
+        texts (list[str]): The texts to embed.
+
+        Returns:
+        list[list[float]]: One embedding per text, in the same order.
+        """
+        start = time.perf_counter()
+        batches = self.make_batches(texts)
+        if len(batches) <= 1 or self.max_concurrency <= 1:
+            results = [self._embed_batch(batch) for batch in batches]
+        else:
+            results = list(self._get_executor().map(self._embed_batch, batches))
+
+        with self._metrics_lock:
+            self._metrics.chunks += len(texts)
+            self._metrics.seconds += time.perf_counter() - start
+        return [embedding for batch_embeddings in results for embedding in batch_embeddings]
+
+
+    def embed_query(self, text: str) -> list[float]:
+        return self._call_with_retries(lambda: self.embeddings.embed_query(text))
+
+
+    def make_batches(self, texts: list[str]) -> list[list[str]]:
+        """
+        Groups texts into batches of at most `batch_size` texts and `batch_max_chars` characters.
+        """
+        batches = []
+        batch = []
+        batch_chars = 0
+        for text in texts:
+            if batch and (len(batch) >= self.batch_size or batch_chars + len(text) > self.batch_max_chars):
+                batches.append(batch)
+                batch = []
+                batch_chars = 0
+            batch.append(text)
+            batch_chars += len(text)
+        if batch:
+            batches.append(batch)
+        return batches
+
+
+    def metrics(self) -> dict:
+        """
+        Returns the number of embedded chunks, requests, retries and rate-limit responses, and the throughput in chunks per second.
+        """
+        with self._metrics_lock:
+            return {
+                "chunks": self._metrics.chunks,
+                "requests": self._metrics.requests,
+                "retries": self._metrics.retries,
+                "rate_limited": self._metrics.rate_limited,
+                "seconds": self._metrics.seconds,
+                "chunks_per_second": self._metrics.chunks_per_second,
+                "concurrency_limit": self.limiter.limit,
+            }
+
+
+    def _embed_batch(self, batch: list[str]) -> list[list[float]]:
+        return self._call_with_retries(lambda: self.embeddings.embed_documents(batch))
+
+
+    def _call_with_retries(self, call):
+        attempt = 0
+        while True:
+            self.limiter.acquire()
+            self.token_bucket.acquire()
+            is_rate_limited = False
+            try:
+                with self._metrics_lock:
+                    self._metrics.requests += 1
+                return call()
+            except Exception as e:
+                is_rate_limited = is_rate_limit_error(e)
+                if not is_rate_limited or attempt >= self.max_retries:
+                    raise
+            finally:
+                self.limiter.release(is_rate_limited)
+
+            with self._metrics_lock:
+                self._metrics.rate_limited += 1
+                self._metrics.retries += 1
+            backoff_seconds = self.retry_base_seconds * 2 ** attempt
+            self.sleep(backoff_seconds + random.uniform(0, backoff_seconds / 2))
+            attempt += 1
+
+
+    def _get_executor(self) -> ThreadPoolExecutor:
+        with self._executor_lock:
+            if self._executor is None:
+                self._executor = ThreadPoolExecutor(max_workers=self.max_concurrency, thread_name_prefix="embedding")
+            return self._executor
+
+
+def is_rate_limit_error(error: Exception) -> bool:
+    """
+    Returns True if the error is a 429/quota response of the embedding API.
+    """
+    current = error
+    while current is not None:
+        if getattr(current, "code", None) == 429:
+            return True
+        message = str(current).lower()
+        if any(marker in message for marker in RATE_LIMIT_MARKERS):
+            return True
+        current = current.__cause__
+    return False
@@ -0,0 +1,208 @@
+from botocore.exceptions import ClientError
+from collections import defaultdict
+from dataclasses import dataclass, field
+from .chroma_handler import add_to_chroma, delete_from_chroma, iter_chunks_with_ids
+from .document_processing import get_source_dir, iter_split_documents
+from .pdf_extraction import iter_pdf_documents
+from .ingestion_manifest import IngestionManifest, ManifestEntry, compute_file_hash
+from .ingestion_progress import IngestionProgress
+from .document_catalog import update_catalog
+from .s3_sync import RemoteFile, SyncReport, list_s3_files, sync_s3_files
+import os
+
+
+class VectorStoreUnavailable(RuntimeError):
+    pass
+
+
+@dataclass
+class SourceFile:
+    filename: str
+    size: int
+    etag: str | None = None
+    key: str | None = None
+
+
+@dataclass
+class IngestionResult:
+    ingested_files: list[str] = field(default_factory=list)
+    unchanged_files: list[str] = field(default_factory=list)
+    removed_files: list[str] = field(default_factory=list)
+    chunks_added: int = 0
+    stale_chunks_removed: int = 0
+    sync_report: SyncReport | None = None
+
+
+def list_source_files(user_id: str = "nobody") -> list[SourceFile]:
+    """
+    Lists the source PDFs of the given user_id, from S3 when running in an AWS environment and from the local source directory otherwise.
+
+    Parameters:
+    user_id (str): The user_id whose PDFs should be listed.
+
+    Returns:
+    list[SourceFile]: The PDFs with their size and, on S3, their ETag.
+    """
+    source_files = []
+    if 'AWS_EXECUTION_ENV' in os.environ:
+        try:
+            remote_files = list_s3_files(f"source/{user_id}/")
+        except ClientError as e:
+            print(f"Client error: {e}")
+            return []
+
+        for remote_file in remote_files:
+            source_files.append(SourceFile(
+                filename=remote_file.filename,
+                size=remote_file.size,
+                etag=remote_file.etag,
+                key=remote_file.key
+            ))
+    else:
+        source_dir = get_source_dir(user_id)
+        if not os.path.isdir(source_dir):
+            return []
+        for filename in sorted(os.listdir(source_dir)):
+            path = os.path.join(source_dir, filename)
+            if filename.lower().endswith(".pdf") and not filename.startswith(".") and os.path.isfile(path):
+                source_files.append(SourceFile(filename=filename, size=os.path.getsize(path)))
+    return source_files
+
+
+def ingest_user_documents(
+    user_id: str = "nobody",
+    content_hashes: dict[str, str] | None = None,
+    progress: IngestionProgress | None = None,
+) -> IngestionResult:
+    """
+    Incrementally ingests the PDFs of the given user_id into the vector store.
+
+    Only files whose content hash differs from the user's ingestion manifest are parsed, split and embedded, so the cost of an upload grows with the new bytes rather than with the user's whole library. On S3, files whose ETag and size match the manifest are not even downloaded. Chunks of replaced or removed files which no longer exist are deleted from the vector store.
+
+    Parameters:
+    user_id (str): The user_id whose PDFs should be ingested.
+    content_hashes (dict[str, str] | None): SHA-256 hashes of files already known from their upload, by filename. Unchanged files among them are neither downloaded nor hashed again.
+    progress (IngestionProgress | None): Receives the pages parsed, chunks split, embedded and upserted, and the time of every stage: list, sync, hash, parse, store, cleanup, catalog and manifest.
+
+    Returns:
+    IngestionResult: Which files were ingested, skipped or removed, and how many chunks were added or removed.
+
+    Raises:
+    VectorStoreUnavailable: If the vector store is not available. Nothing is ingested and the manifest is left as it was.
+    """
+    result = IngestionResult()
+    progress = progress or IngestionProgress()
+    with progress.stage("list"):
+        manifest = IngestionManifest.load(user_id)
+        source_dir = get_source_dir(user_id)
+        os.makedirs(source_dir, exist_ok=True)
+        source_files = list_source_files(user_id)
+
+    content_hashes = content_hashes or {}
+    candidates = []
+    for source_file in source_files:
+        if manifest.matches_etag(source_file.filename, source_file.etag, source_file.size):
+            result.unchanged_files.append(source_file.filename)
+        elif manifest.is_unchanged(source_file.filename, content_hashes.get(source_file.filename)):
+            entry = manifest.entries[source_file.filename]
+            entry.etag = source_file.etag
+            entry.size = source_file.size
+            result.unchanged_files.append(source_file.filename)
+        else:
+            candidates.append(source_file)
+
+    if 'AWS_EXECUTION_ENV' in os.environ and candidates:
+        with progress.stage("sync"):
+            result.sync_report = sync_s3_files(
+                [
+                    RemoteFile(key=source_file.key, filename=source_file.filename, size=source_file.size, etag=source_file.etag)
+                    for source_file in candidates
+                ],
+                source_dir
+            )
+        failed_files = set(result.sync_report.failed_files)
+        candidates = [source_file for source_file in candidates if source_file.filename not in failed_files]
+
+    changed: list[tuple[str, ManifestEntry]] = []
+    with progress.stage("hash"):
+        for source_file in candidates:
+            local_path = os.path.join(source_dir, source_file.filename)
+            content_hash = content_hashes.get(source_file.filename) or compute_file_hash(local_path)
+            if manifest.is_unchanged(source_file.filename, content_hash):
+                entry = manifest.entries[source_file.filename]
+                entry.etag = source_file.etag
+                entry.size = source_file.size
+                result.unchanged_files.append(source_file.filename)
+                continue
+
+            changed.append((local_path, ManifestEntry(
+                filename=source_file.filename,
+                content_hash=content_hash,
+                size=source_file.size,
+                etag=source_file.etag
+            )))
+
+    listed_filenames = {source_file.filename for source_file in source_files}
+    result.removed_files = [filename for filename in manifest.entries if filename not in listed_filenames]
+
+    print(f"Ingesting {len(changed)} new or changed files, skipping {len(result.unchanged_files)} unchanged files")
+    chunk_ids_by_file = defaultdict(list)
+    page_counts = defaultdict(int)
+
+    def record_pages(pages):
+        for page in pages:
+            page_counts[os.path.basename(page.metadata.get('source', ''))] += 1
+            yield page
+
+    def record_chunk_ids(chunks):
+        for chunk in chunks:
+            chunk_ids_by_file[os.path.basename(chunk.metadata.get('source', ''))].append(chunk.metadata['id'])
+            yield chunk
+
+    # Pages are extracted, split and added as a stream, so only a bounded batch of chunks is held in memory.
+    # add_to_chroma derives the same ids again, since ids only depend on the order and content of the chunks.
+    # Parsing is lazy, so its time is what the store waits for the next chunk
+    pages = record_pages(progress.track(iter_pdf_documents([path for path, _ in changed]), "pages_parsed"))
+    split_chunks = progress.track(iter_split_documents(pages), "chunks_split", stage="parse")
+    chunks = record_chunk_ids(iter_chunks_with_ids(split_chunks))
+    chunks_added = add_to_chroma(chunks, user_id, progress=progress)
+    if chunks_added is None:
+        print("Ingestion manifest is not updated since the db is not available")
+        raise VectorStoreUnavailable(f"The vector store of {user_id} is not available, no documents were ingested")
+    result.chunks_added = chunks_added
+
+    stale_ids = []
+    for _, entry in changed:
+        entry.chunk_ids = chunk_ids_by_file.get(entry.filename, [])
+        entry.page_count = page_counts.get(entry.filename, 0)
+        previous_entry = manifest.entries.get(entry.filename)
+        if previous_entry is not None:
+            current_ids = set(entry.chunk_ids)
+            stale_ids.extend(chunk_id for chunk_id in previous_entry.chunk_ids if chunk_id not in current_ids)
+        manifest.record(entry)
+        result.ingested_files.append(entry.filename)
+
+    removed_files = set(result.removed_files)
+    for filename in result.removed_files:
+        stale_ids.extend(manifest.entries[filename].chunk_ids)
+
+    with progress.stage("cleanup"):
+        delete_from_chroma(stale_ids, user_id)
+    result.stale_chunks_removed = len(stale_ids)
+    # Files ingested before the catalog existed are written once as well
+    uncataloged = [entry for entry in manifest.entries.values() if not entry.cataloged and entry.filename not in removed_files]
+    with progress.stage("catalog"):
+        try:
+            update_catalog(user_id, uncataloged, result.removed_files)
+        except ClientError:
+            # Removed files stay in the manifest, so their catalog entries are deleted by the next ingestion
+            print("Document catalog is not updated, it is retried with the next ingestion")
+        else:
+            for entry in uncataloged:
+                entry.cataloged = True
+            for filename in result.removed_files:
+                manifest.remove(filename)
+    with progress.stage("manifest"):
+        manifest.save()
+    progress.report(force=True)
+    return result
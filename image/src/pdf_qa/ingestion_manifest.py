@@ -0,0 +1,163 @@
+from botocore.exceptions import ClientError
+from dataclasses import dataclass, field, asdict
+from pathlib import Path
+import hashlib
+import json
+import os
+import time
+import boto3
+
+
+IS_USING_IMAGE_RUNTIME = bool(os.environ.get("IS_USING_IMAGE_RUNTIME", False))
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+HASH_BLOCK_SIZE = 1024 * 1024
+
+
+@dataclass
+class ManifestEntry:
+    filename: str
+    content_hash: str
+    size: int
+    etag: str | None = None
+    chunk_ids: list[str] = field(default_factory=list)
+    ingested_at: int = field(default_factory=lambda: int(time.time()))
+    page_count: int = 0
+    # Whether the entry has been written to the document catalog
+    cataloged: bool = False
+
+
+class IngestionManifest:
+    """
+    Per-user record of every ingested PDF, so that only new or changed files have to be parsed, split and embedded again.
+
+    The manifest is stored as JSON next to the user's source PDFs, i.e. under `manifest/{user_id}.json` in S3 when running on AWS and in the local data directory otherwise.
+    """
+
+    def __init__(self, user_id: str, entries: dict[str, ManifestEntry] | None = None):
+        self.user_id = user_id
+        self.entries = entries or {}
+
+
+    @classmethod
+    def load(cls, user_id: str) -> "IngestionManifest":
+        """
+        Loads the manifest of the given user_id. Returns an empty manifest if none exists yet.
+
+        Parameters:
+        user_id (str): The user_id whose manifest should be loaded.
+
+        Returns:
+        IngestionManifest: The manifest of the user.
+        """
+        try:
+            if 'AWS_EXECUTION_ENV' in os.environ:
+                s3_client = boto3.client('s3')
+                response = s3_client.get_object(Bucket=BUCKET_NAME, Key=get_manifest_key(user_id))
+                data = json.loads(response["Body"].read())
+            else:
+                with open(get_manifest_path(user_id)) as file:
+                    data = json.load(file)
+        except FileNotFoundError:
+            return cls(user_id)
+        except ClientError as e:
+            if e.response.get("Error", {}).get("Code") not in ("NoSuchKey", "404"):
+                print(f"Failed to load ingestion manifest of {user_id}")
+                print(f"ClientError: {e}")
+            return cls(user_id)
+
+        entries = {
+            filename: ManifestEntry(**entry)
+            for filename, entry in data.get("entries", {}).items()
+        }
+        return cls(user_id, entries)
+
+
+    def save(self):
+        """
+        Persists the manifest.
+        """
+        body = json.dumps({
+            "user_id": self.user_id,
+            "entries": {filename: asdict(entry) for filename, entry in self.entries.items()},
+        })
+        if 'AWS_EXECUTION_ENV' in os.environ:
+            s3_client = boto3.client('s3')
+            s3_client.put_object(
+                Bucket=BUCKET_NAME,
+                Key=get_manifest_key(self.user_id),
+                Body=body.encode('utf-8'),
+                ContentType='application/json'
+            )
+        else:
+            path = get_manifest_path(self.user_id)
+            os.makedirs(os.path.dirname(path), exist_ok=True)
+            tmp_path = f"{path}.tmp"
+            with open(tmp_path, 'w') as file:
+                file.write(body)
+            os.replace(tmp_path, path)
+
+
+    @classmethod
+    def delete(cls, user_id: str):
+        """
+        Deletes the manifest of the given user_id, so that every file is ingested again, e.g. after their vector store was cleared.
+        """
+        if 'AWS_EXECUTION_ENV' in os.environ:
+            s3_client = boto3.client('s3')
+            s3_client.delete_object(Bucket=BUCKET_NAME, Key=get_manifest_key(user_id))
+        else:
+            try:
+                os.remove(get_manifest_path(user_id))
+            except FileNotFoundError:
+                pass
+
+
+    def is_unchanged(self, filename: str, content_hash: str) -> bool:
+        """
+        Returns True if the file with the given content hash has already been ingested.
+        """
+        entry = self.entries.get(filename)
+        return entry is not None and entry.content_hash == content_hash
+
+
+    def matches_etag(self, filename: str, etag: str | None, size: int) -> bool:
+        """
+        Returns True if the S3 object with the given ETag and size has already been ingested, so it does not even have to be downloaded.
+        """
+        entry = self.entries.get(filename)
+        return entry is not None and etag is not None and entry.etag == etag and entry.size == size
+
+
+    def record(self, entry: ManifestEntry):
+        self.entries[entry.filename] = entry
+
+
+    def remove(self, filename: str) -> ManifestEntry | None:
+        return self.entries.pop(filename, None)
+
+
+def get_manifest_key(user_id: str) -> str:
+    return f"manifest/{user_id}.json"
+
+
+def get_manifest_path(user_id: str) -> str:
+    if IS_USING_IMAGE_RUNTIME:
+        return os.path.join("/tmp", "data", "manifest", f"{user_id}.json")
+    return str(Path(__file__).parent.parent / "data" / "manifest" / f"{user_id}.json")
+
+
+def compute_file_hash(path: str) -> str:
+    """
+    Computes the SHA-256 hash of a file without reading it into memory at once.
+
+    Parameters:
+    path (str): The path of the file.
+
+    Returns:
+    str: The hex digest of the file's content.
+    """
+    sha256 = hashlib.sha256()
+    with open(path, 'rb') as file:
+        for block in iter(lambda: file.read(HASH_BLOCK_SIZE), b''):
+            sha256.update(block)
+    return sha256.hexdigest()
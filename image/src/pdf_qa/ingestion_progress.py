@@ -0,0 +1,73 @@
+from contextlib import contextmanager
+from dataclasses import dataclass, field
+from typing import Callable, Iterable, Iterator
+import os
+import time
+
+
+PROGRESS_REPORT_SECONDS = float(os.environ.get("PROGRESS_REPORT_SECONDS", 2))
+
+
+@dataclass
+class IngestionProgress:
+    """
+    Counters and per-stage timings of one ingestion. `listener` is called with the progress at most every `report_interval` seconds while the ingestion runs.
+    """
+    pages_parsed: int = 0
+    chunks_split: int = 0
+    chunks_embedded: int = 0
+    chunks_upserted: int = 0
+    stage_seconds: dict[str, float] = field(default_factory=dict)
+    listener: Callable[["IngestionProgress"], None] | None = field(default=None, repr=False)
+    report_interval: float = PROGRESS_REPORT_SECONDS
+    last_report: float = field(default=0.0, repr=False)
+
+
+    @property
+    def stage_ms(self) -> dict[str, int]:
+        return {stage: int(seconds * 1000) for stage, seconds in self.stage_seconds.items()}
+
+
+    @contextmanager
+    def stage(self, name: str):
+        """
+        Adds the time spent in the block to the stage `name`.
+        """
+        start = time.perf_counter()
+        try:
+            yield
+        finally:
+            self.add_time(name, start)
+            self.report()
+
+
+    def add_time(self, name: str, start: float):
+        self.stage_seconds[name] = self.stage_seconds.get(name, 0.0) + time.perf_counter() - start
+
+
+    def track(self, items: Iterable, counter: str, stage: str | None = None) -> Iterator:
+        """
+        Passes the items through, counting them in `counter` and, for lazy streams, adding the time spent producing them to `stage`.
+        """
+        iterator = iter(items)
+        while True:
+            start = time.perf_counter()
+            try:
+                item = next(iterator)
+            except StopIteration:
+                if stage:
+                    self.add_time(stage, start)
+                return
+            if stage:
+                self.add_time(stage, start)
+            setattr(self, counter, getattr(self, counter) + 1)
+            self.report()
+            yield item
+
+
+    def report(self, force: bool = False):
+        now = time.monotonic()
+        if self.listener is None or (not force and now - self.last_report < self.report_interval):
+            return
+        self.last_report = now
+        self.listener(self)
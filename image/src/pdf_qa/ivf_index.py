@@ -0,0 +1,172 @@
+import math
+import os
+import numpy as np
+
+
+IVF_NLIST = int(os.environ.get("IVF_NLIST", 0))
+IVF_NPROBE = int(os.environ.get("IVF_NPROBE", 8))
+IVF_TRAIN_ITERATIONS = int(os.environ.get("IVF_TRAIN_ITERATIONS", 10))
+IVF_TRAIN_SAMPLE_PER_LIST = 64
+ASSIGN_CHUNK_SIZE = 65536
+
+CENTROIDS_FILENAME = "ivf_centroids.npy"
+ASSIGNMENTS_FILENAME = "ivf_assignments.i32"
+
+
+class IVFIndex:
+    """
+    Inverted-file index over normalized vectors for approximate cosine search.
+
+    The vectors are partitioned into `nlist` clusters by spherical k-means. A query only scores the vectors of the `nprobe` clusters whose centroids are closest to it, which trades recall for latency: raising `nprobe` raises recall, and `nprobe == nlist` is an exact search.
+
+    New vectors are assigned to their closest centroid, so the index grows incrementally without retraining. The centroids and the cluster of every row are persisted next to the vectors; the assignments file is append-only like the vectors file.
+
+    Parameters:
+    centroids (np.ndarray): The normalized cluster centroids, one per row.
+    nprobe (int): The number of clusters scored per query.
+    """
+
+    def __init__(self, centroids: np.ndarray, nprobe: int = IVF_NPROBE):
+        self.centroids = centroids.astype(np.float32)
+        self.nprobe = nprobe
+        self.assignments = np.zeros(0, dtype=np.int32)
+        self._lists: list[list[int]] = [[] for _ in range(len(centroids))]
+        self._arrays: list[np.ndarray | None] = [None] * len(centroids)
+
+
+    @property
+    def nlist(self) -> int:
+        return len(self.centroids)
+
+
+    @classmethod
+    def train(cls, vectors: np.ndarray, nlist: int = IVF_NLIST, nprobe: int = IVF_NPROBE, seed: int = 0) -> "IVFIndex":
+        """
+        Trains the centroids on a sample of the given normalized vectors and adds all of them to the index.
+
+        Parameters:
+        vectors (np.ndarray): The normalized vectors, e.g. the memory-mapped matrix of a store.
+        nlist (int): The number of clusters. 0 picks about 4 * sqrt(n).
+        nprobe (int): The number of clusters scored per query.
+
+        Returns:
+        IVFIndex: The trained index containing every given vector.
+        """
+        count = len(vectors)
+        nlist = nlist or max(1, int(4 * math.sqrt(count)))
+        nlist = min(nlist, count)
+        rng = np.random.default_rng(seed)
+        sample_rows = np.sort(rng.choice(count, size=min(count, nlist * IVF_TRAIN_SAMPLE_PER_LIST), replace=False))
+        sample = np.asarray(vectors[sample_rows], dtype=np.float32)
+
+        centroids = sample[rng.choice(len(sample), size=nlist, replace=False)]
+        for _ in range(IVF_TRAIN_ITERATIONS):
+            labels = assign(sample, centroids)
+            order = np.argsort(labels, kind="stable")
+            counts = np.bincount(labels, minlength=nlist)
+            empty = counts == 0
+            starts = np.concatenate([[0], np.cumsum(counts)[:-1]])
+            sums = np.zeros_like(centroids)
+            sums[~empty] = np.add.reduceat(sample[order], starts[~empty], axis=0)
+            # Empty clusters are re-seeded with random sample vectors
+            sums[empty] = sample[rng.choice(len(sample), size=int(empty.sum()))]
+            centroids = normalize_rows(sums)
+
+        index = cls(centroids, nprobe)
+        index.add(vectors)
+        return index
+
+
+    def add(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Assigns the given vectors, which follow the rows already in the index, to their closest clusters.
+
+        Returns:
+        np.ndarray: The clusters of the added vectors.
+        """
+        start = len(self.assignments)
+        labels = assign(vectors, self.centroids)
+        self.assignments = np.concatenate([self.assignments, labels])
+        for row, label in enumerate(labels.tolist(), start):
+            self._lists[label].append(row)
+            self._arrays[label] = None
+        return labels
+
+
+    def candidates(self, query: np.ndarray, nprobe: int | None = None) -> np.ndarray:
+        """
+        Returns the rows of the `nprobe` clusters closest to the normalized query.
+        """
+        nprobe = min(nprobe or self.nprobe, self.nlist)
+        probes = np.argpartition(-(self.centroids @ query), nprobe - 1)[:nprobe]
+        arrays = []
+        for label in probes:
+            if self._arrays[label] is None:
+                self._arrays[label] = np.asarray(self._lists[label], dtype=np.int64)
+            arrays.append(self._arrays[label])
+        return np.concatenate(arrays)
+
+
+    def save(self, path: str, appended_labels: np.ndarray | None = None):
+        """
+        Persists the index into the given directory. If only `appended_labels` were added since the last save, they are appended instead of rewriting every assignment.
+        """
+        assignments_path = os.path.join(path, ASSIGNMENTS_FILENAME)
+        if appended_labels is not None and os.path.exists(assignments_path):
+            with open(assignments_path, "ab") as file:
+                file.write(appended_labels.astype(np.int32).tobytes())
+            return
+        np.save(os.path.join(path, CENTROIDS_FILENAME), self.centroids)
+        with open(assignments_path + ".tmp", "wb") as file:
+            file.write(self.assignments.astype(np.int32).tobytes())
+        os.replace(assignments_path + ".tmp", assignments_path)
+
+
+    @classmethod
+    def load(cls, path: str, rows: int, nprobe: int = IVF_NPROBE) -> "IVFIndex | None":
+        """
+        Loads a persisted index.
+
+        Returns:
+        IVFIndex | None: The index, or None if there is none or it does not cover exactly `rows` vectors.
+        """
+        centroids_path = os.path.join(path, CENTROIDS_FILENAME)
+        assignments_path = os.path.join(path, ASSIGNMENTS_FILENAME)
+        if not os.path.exists(centroids_path) or not os.path.exists(assignments_path):
+            return None
+        assignments = np.fromfile(assignments_path, dtype=np.int32)
+        if len(assignments) != rows:
+            return None
+
+        index = cls(np.load(centroids_path), nprobe)
+        index.assignments = assignments
+        order = np.argsort(assignments, kind="stable")
+        bounds = np.searchsorted(assignments[order], np.arange(index.nlist + 1))
+        for label in range(index.nlist):
+            index._lists[label] = order[bounds[label]:bounds[label + 1]].tolist()
+        return index
+
+
+    @staticmethod
+    def remove(path: str):
+        for filename in (CENTROIDS_FILENAME, ASSIGNMENTS_FILENAME):
+            file_path = os.path.join(path, filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+def assign(vectors: np.ndarray, centroids: np.ndarray) -> np.ndarray:
+    """
+    Returns the closest centroid of each vector, in chunks to bound the memory of the score matrix.
+    """
+    labels = np.empty(len(vectors), dtype=np.int32)
+    for start in range(0, len(vectors), ASSIGN_CHUNK_SIZE):
+        chunk = np.asarray(vectors[start:start + ASSIGN_CHUNK_SIZE], dtype=np.float32)
+        labels[start:start + len(chunk)] = np.argmax(chunk @ centroids.T, axis=1)
+    return labels
+
+
+def normalize_rows(vectors: np.ndarray) -> np.ndarray:
+    norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+    norms[norms == 0] = 1
+    return (vectors / norms).astype(np.float32)
@@ -0,0 +1,469 @@
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from langchain_core.vectorstores import VectorStore
+from .ivf_index import IVF_NLIST, IVF_NPROBE, IVFIndex, normalize_rows
+from .vector_codec import VectorCodec, get_default_codec
+from typing import Any, Callable, Iterable
+import json
+import os
+import shutil
+import threading
+import numpy as np
+
+
+VECTORS_FILENAME = "vectors.f32"
+METADATA_FILENAME = "metadata.jsonl"
+LOCAL_ANN_MIN_VECTORS = int(os.environ.get("LOCAL_ANN_MIN_VECTORS", 20000))
+LOCAL_VECTOR_RESCORE_MULTIPLIER = int(os.environ.get("LOCAL_VECTOR_RESCORE_MULTIPLIER", 4))
+
+
+class LocalVectorStore(VectorStore):
+    """
+    In-process vector store for a single user, searched by cosine similarity with NumPy.
+
+    Vectors are normalized and appended to a raw float32 file which is memory-mapped for search, so only the pages touched by a query are read. Ids, texts and metadata are appended to a JSON lines sidecar, one record per row. Deleted rows are recorded as tombstones in the sidecar and masked out of the search until enough of them accumulate to compact both files.
+
+    Once the store holds `ann_min_vectors` vectors, an `IVFIndex` is trained and kept up to date on every insert, and searches only score the `nprobe` closest clusters instead of every vector.
+
+    A collection can be stored with a compact `VectorCodec` (int8 and/or truncated dimensions). Its codes are held in memory and scored first, and the best `k * rescore_multiplier` candidates are rescored with their full float32 vectors, which are only read from the memory-mapped file for those rows. A codec without `rescore` writes no float32 vectors at all: results are ranked by the codes alone and the collection takes only the disk of its codes. The codec is persisted with the collection, so every collection keeps the format it was created with until `set_codec` changes it.
+
+    Scores are cosine similarities, i.e. higher is more similar.
+
+    Parameters:
+    path (str): The directory of the store. It is created on the first insert.
+    embedding (Embeddings): The embedding function.
+    ann_min_vectors (int): The number of vectors from which the ANN index is used. 0 disables the index.
+    nprobe (int): The number of IVF clusters scored per query.
+    codec (VectorCodec | None): The codec of a new collection. Defaults to `get_default_codec()`; an existing collection keeps its persisted codec.
+    rescore_multiplier (int): How many candidates per result are rescored in full precision when a compact codec is used.
+    """
+
+    def __init__(
+        self,
+        path: str,
+        embedding: Embeddings,
+        ann_min_vectors: int = LOCAL_ANN_MIN_VECTORS,
+        nprobe: int = IVF_NPROBE,
+        codec: VectorCodec | None = None,
+        rescore_multiplier: int = LOCAL_VECTOR_RESCORE_MULTIPLIER,
+    ):
+        self.path = path
+        self._embedding = embedding
+        self.ann_min_vectors = ann_min_vectors
+        self.nprobe = nprobe
+        self.codec = VectorCodec.load(path) or codec or get_default_codec()
+        self.rescore_multiplier = rescore_multiplier
+        self.index: IVFIndex | None = None
+        self._codes: np.ndarray | None = None
+        self._scales: np.ndarray | None = None
+        self._ids: list[str] = []
+        self._texts: list[str] = []
+        self._metadatas: list[dict] = []
+        self._rows: dict[str, int] = {}
+        self._alive = np.zeros(0, dtype=bool)
+        self._matrix = np.zeros((0, 0), dtype=np.float32)
+        self._lock = threading.RLock()
+        self._load()
+        self.signature = self.read_signature()
+
+
+    @property
+    def embeddings(self) -> Embeddings:
+        return self._embedding
+
+
+    def add_texts(
+        self,
+        texts: Iterable[str],
+        metadatas: list[dict] | None = None,
+        ids: list[str] | None = None,
+        **kwargs: Any,
+    ) -> list[str]:
+        texts = list(texts)
+        if not texts:
+            return []
+        metadatas = metadatas or [{} for _ in texts]
+        ids = ids or [str(metadata.get("id", i)) for i, metadata in enumerate(metadatas)]
+        vectors = normalize_rows(np.asarray(self._embedding.embed_documents(texts), dtype=np.float32))
+
+        with self._lock:
+            existing_ids = [chunk_id for chunk_id in ids if chunk_id in self._rows]
+            if existing_ids:
+                self._delete(existing_ids)
+            if self._matrix.shape[1] and vectors.shape[1] != self._matrix.shape[1]:
+                raise ValueError(f"Expected vectors of dimension {self._matrix.shape[1]}, got {vectors.shape[1]}")
+            codes, scales = (None, None) if self.codec.is_identity else self.codec.encode(vectors)
+            if self._codes is not None and self._ids and codes.shape[1] != self._codes.shape[1]:
+                raise ValueError(f"Expected codes of dimension {self._codes.shape[1]}, got {codes.shape[1]}")
+
+            is_new = not self._ids
+            os.makedirs(self.path, exist_ok=True)
+            if is_new:
+                self.codec.write(self.path)
+            if self.codec.rescore:
+                with open(os.path.join(self.path, VECTORS_FILENAME), "ab") as file:
+                    file.write(vectors.tobytes())
+            with open(os.path.join(self.path, METADATA_FILENAME), "a") as file:
+                for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                    file.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                self._rows[chunk_id] = len(self._ids)
+                self._ids.append(chunk_id)
+                self._texts.append(text)
+                self._metadatas.append(metadata)
+            self._alive = np.concatenate([self._alive, np.ones(len(ids), dtype=bool)])
+            if self.codec.rescore:
+                self._map_vectors(vectors.shape[1])
+            if codes is not None:
+                self.codec.append(self.path, codes, scales)
+                self._codes = codes if is_new else np.concatenate([self._codes, codes])
+                self._scales = None if scales is None else scales if is_new else np.concatenate([self._scales, scales])
+            if self.index is not None and not self._index_is_outgrown():
+                index_vectors = vectors if self.codec.rescore else self.codec.decode(codes, scales)
+                self.index.save(self.path, appended_labels=self.index.add(index_vectors))
+            else:
+                self._build_index()
+            self.signature = self.read_signature()
+        return ids
+
+
+    def get(self, ids: list[str] | None = None, include: list[str] | None = None) -> dict:
+        """
+        Returns the stored ids, like `Chroma.get`. Documents and metadatas are included if requested.
+        """
+        include = ["documents", "metadatas"] if include is None else include
+        with self._lock:
+            rows = [self._rows[chunk_id] for chunk_id in (ids if ids is not None else self._rows) if chunk_id in self._rows]
+            result = {"ids": [self._ids[row] for row in rows]}
+            if "documents" in include:
+                result["documents"] = [self._texts[row] for row in rows]
+            if "metadatas" in include:
+                result["metadatas"] = [self._metadatas[row] for row in rows]
+            return result
+
+
+    def delete(self, ids: list[str] | None = None, **kwargs: Any) -> bool:
+        if not ids:
+            return False
+        with self._lock:
+            self._delete(ids)
+            if self._alive.size and np.count_nonzero(~self._alive) > self._alive.size // 2:
+                self._compact()
+            self.signature = self.read_signature()
+        return True
+
+
+    def similarity_search_by_vector_with_relevance_scores(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        query = normalize_rows(np.asarray(embedding, dtype=np.float32).reshape(1, -1))[0]
+        with self._lock:
+            matrix, alive, index = self._matrix, self._alive, self.index
+            codec, codes, scales = self.codec, self._codes, self._scales
+            ids, texts, metadatas = self._ids, self._texts, self._metadatas
+            # Without full vectors the index is built in the space of the codes
+            index_query = query if codec.rescore else codec.project(query.reshape(1, -1))[0]
+            candidates = index.candidates(index_query, self.nprobe) if index is not None else None
+        if not alive.any():
+            return []
+
+        if candidates is None:
+            rows = np.flatnonzero(alive)
+        else:
+            rows = candidates[alive[candidates]]
+
+        def approximate_scores(rows):
+            if candidates is None:
+                return codec.score(codes, scales, query)[rows]
+            return codec.score(codes[rows], None if scales is None else scales[rows], query)
+
+        if codes is not None and codec.rescore and len(rows) > k * self.rescore_multiplier:
+            approx_scores = approximate_scores(rows)
+            shortlist = np.argpartition(-approx_scores, k * self.rescore_multiplier - 1)[:k * self.rescore_multiplier]
+            rows = rows[shortlist]
+
+        if not codec.rescore:
+            row_scores = approximate_scores(rows)
+        elif candidates is None and codes is None:
+            row_scores = (matrix @ query)[rows]
+        else:
+            # Sorted rows read the memory-mapped file front to back
+            rows = np.sort(rows)
+            row_scores = np.asarray(matrix[rows]) @ query
+        if len(rows) == 0:
+            return []
+        k = min(k, len(rows))
+        top = np.argpartition(-row_scores, k - 1)[:k]
+        top = top[np.argsort(-row_scores[top])]
+        return [
+            (Document(page_content=texts[rows[i]], metadata=metadatas[rows[i]], id=ids[rows[i]]), float(row_scores[i]))
+            for i in top
+        ]
+
+
+    async def asimilarity_search_by_vector_with_relevance_scores(
+        self, embedding: list[float], k: int = 4, **kwargs: Any
+    ) -> list[tuple[Document, float]]:
+        # The search is in-process and CPU-bound, so there is nothing to await
+        return self.similarity_search_by_vector_with_relevance_scores(embedding, k, **kwargs)
+
+
+    def similarity_search_with_score(self, query: str, k: int = 4, **kwargs: Any) -> list[tuple[Document, float]]:
+        return self.similarity_search_by_vector_with_relevance_scores(self._embedding.embed_query(query), k)
+
+
+    def similarity_search(self, query: str, k: int = 4, **kwargs: Any) -> list[Document]:
+        return [doc for doc, _ in self.similarity_search_with_score(query, k)]
+
+
+    def clear(self):
+        """
+        Removes every vector of the store, including its files.
+        """
+        with self._lock:
+            shutil.rmtree(self.path, ignore_errors=True)
+            self._ids, self._texts, self._metadatas, self._rows = [], [], [], {}
+            self._alive = np.zeros(0, dtype=bool)
+            self._matrix = np.zeros((0, 0), dtype=np.float32)
+            self._codes, self._scales = None, None
+            self.index = None
+            self.signature = self.read_signature()
+
+
+    def read_signature(self) -> tuple[int, int] | None:
+        """
+        Returns the modification time and size of the sidecar, which every insert, delete and compaction changes, or None if the store has no files.
+        """
+        try:
+            stat = os.stat(os.path.join(self.path, METADATA_FILENAME))
+        except FileNotFoundError:
+            return None
+        return stat.st_mtime_ns, stat.st_size
+
+
+    def count(self) -> int:
+        return len(self._rows)
+
+
+    def set_codec(self, codec: VectorCodec):
+        """
+        Changes the storage format of the collection and re-encodes its vectors from the full float32 vectors.
+
+        Raises:
+        ValueError: If the collection has no full vectors to re-encode, as its codec does not `rescore`.
+        """
+        with self._lock:
+            if codec == self.codec:
+                return
+            if self._ids and not self.codec.rescore:
+                raise ValueError(f"The collection in {self.path} keeps no full vectors and can't be re-encoded")
+            self.codec = codec
+            if self._ids:
+                self._encode_all()
+                if not codec.rescore:
+                    self._matrix = np.zeros((0, 0), dtype=np.float32)
+                    os.remove(os.path.join(self.path, VECTORS_FILENAME))
+                    # The index is rebuilt in the space of the codes
+                    self._build_index()
+
+
+    def memory_footprint(self) -> dict:
+        """
+        Returns the bytes of the searched vectors (the codes, or the full vectors without a codec) and of the full float32 vectors.
+        """
+        full_bytes = int(self._matrix.size * 4)
+        search_bytes = full_bytes if self._codes is None else int(self._codes.nbytes + (0 if self._scales is None else self._scales.nbytes))
+        return {"search_bytes": search_bytes, "full_bytes": full_bytes}
+
+
+    def disk_bytes(self) -> int:
+        """
+        Returns the total size of the files of the store: vectors, codes, index and sidecar.
+        """
+        if not os.path.isdir(self.path):
+            return 0
+        return sum(entry.stat().st_size for entry in os.scandir(self.path) if entry.is_file())
+
+
+    @classmethod
+    def from_texts(
+        cls,
+        texts: list[str],
+        embedding: Embeddings,
+        metadatas: list[dict] | None = None,
+        *,
+        ids: list[str] | None = None,
+        path: str = "",
+        **kwargs: Any,
+    ) -> "LocalVectorStore":
+        store = cls(path, embedding)
+        store.add_texts(texts, metadatas, ids=ids)
+        return store
+
+
+    def _load(self):
+        metadata_path = os.path.join(self.path, METADATA_FILENAME)
+        if not os.path.exists(metadata_path):
+            return
+        deleted = set()
+        with open(metadata_path) as file:
+            for line in file:
+                record = json.loads(line)
+                if "delete" in record:
+                    deleted.update(row for row in record["delete"])
+                    continue
+                self._rows[record["id"]] = len(self._ids)
+                self._ids.append(record["id"])
+                self._texts.append(record["text"])
+                self._metadatas.append(record["metadata"])
+        self._alive = np.ones(len(self._ids), dtype=bool)
+        if deleted:
+            self._alive[list(deleted)] = False
+            for row in deleted:
+                if self._rows.get(self._ids[row]) == row:
+                    del self._rows[self._ids[row]]
+        if self.codec.rescore:
+            size = os.path.getsize(os.path.join(self.path, VECTORS_FILENAME))
+            self._map_vectors(size // 4 // len(self._ids) if self._ids else 0)
+        if not self.codec.is_identity and self._ids:
+            stored = self.codec.read(self.path, len(self._ids))
+            if stored is None and not self.codec.rescore:
+                raise ValueError(f"The codes in {self.path} are missing or incomplete and there are no full vectors to encode them again")
+            if stored is None:
+                self._encode_all()
+            else:
+                self._codes, self._scales = stored
+        if self.ann_min_vectors:
+            self.index = IVFIndex.load(self.path, len(self._ids), self.nprobe)
+        if self.index is None:
+            self._build_index()
+
+
+    def _build_index(self):
+        """
+        Trains a new IVF index once the store is large enough for it, or drops the index if it is not.
+        """
+        IVFIndex.remove(self.path)
+        self.index = None
+        if not self.ann_min_vectors or len(self._ids) < self.ann_min_vectors:
+            return
+        print(f"Training IVF index on {len(self._ids)} vectors in {self.path}")
+        vectors = self._matrix if self.codec.rescore else self.codec.decode(self._codes, self._scales)
+        self.index = IVFIndex.train(vectors, nprobe=self.nprobe)
+        self.index.save(self.path)
+
+
+    def _encode_all(self):
+        """
+        Rewrites the codes of every row from the full vectors, or drops them for the identity codec.
+        """
+        if self.codec.is_identity:
+            self.codec.write(self.path)
+            self._codes, self._scales = None, None
+            return
+        self._codes, self._scales = self.codec.encode(self._matrix)
+        self.codec.write(self.path, self._codes, self._scales)
+
+
+    def _index_is_outgrown(self) -> bool:
+        # With an automatic nlist, the index is retrained once the store has grown about 4x since training
+        return not IVF_NLIST and self.index.nlist * 2 < 4 * len(self._ids) ** 0.5
+
+
+    def _map_vectors(self, dimension: int):
+        if not self._ids or not dimension:
+            self._matrix = np.zeros((0, dimension), dtype=np.float32)
+            return
+        self._matrix = np.memmap(
+            os.path.join(self.path, VECTORS_FILENAME),
+            dtype=np.float32,
+            mode="r",
+            shape=(len(self._ids), dimension),
+        )
+
+
+    def _delete(self, ids: list[str]):
+        rows = [self._rows.pop(chunk_id) for chunk_id in dict.fromkeys(ids) if chunk_id in self._rows]
+        if not rows:
+            return
+        alive = self._alive.copy()
+        alive[rows] = False
+        self._alive = alive
+        with open(os.path.join(self.path, METADATA_FILENAME), "a") as file:
+            file.write(json.dumps({"delete": rows}) + "\n")
+
+
+    def _compact(self):
+        rows = np.flatnonzero(self._alive)
+        ids = [self._ids[row] for row in rows]
+        texts = [self._texts[row] for row in rows]
+        metadatas = [self._metadatas[row] for row in rows]
+
+        vectors_path = os.path.join(self.path, VECTORS_FILENAME)
+        metadata_path = os.path.join(self.path, METADATA_FILENAME)
+        if self.codec.rescore:
+            vectors = np.array(self._matrix[rows])
+            with open(vectors_path + ".tmp", "wb") as file:
+                file.write(vectors.tobytes())
+        with open(metadata_path + ".tmp", "w") as file:
+            for chunk_id, text, metadata in zip(ids, texts, metadatas):
+                file.write(json.dumps({"id": chunk_id, "text": text, "metadata": metadata}) + "\n")
+        dimension = self._matrix.shape[1]
+        self._matrix = np.zeros((0, dimension), dtype=np.float32)
+        if self.codec.rescore:
+            os.replace(vectors_path + ".tmp", vectors_path)
+        os.replace(metadata_path + ".tmp", metadata_path)
+
+        self._ids, self._texts, self._metadatas = ids, texts, metadatas
+        self._rows = {chunk_id: row for row, chunk_id in enumerate(ids)}
+        self._alive = np.ones(len(ids), dtype=bool)
+        self._map_vectors(dimension)
+        if not self._ids:
+            self._codes, self._scales = None, None
+        elif self.codec.rescore:
+            self._encode_all()
+        else:
+            # Without full vectors, the codes of the remaining rows are kept as they are
+            self._codes, self._scales = self._codes[rows], None if self._scales is None else self._scales[rows]
+            self.codec.write(self.path, self._codes, self._scales)
+        self._build_index()
+
+
+class LocalVectorStoreBackend:
+    """
+    Vector store backend which keeps one `LocalVectorStore` per user_id on the local disk, without any network hop.
+
+    A store is loaded again when its files were changed by another process, e.g. a query server after an ingestion by the worker.
+
+    Parameters:
+    path_factory (Callable[[str], str]): Returns the directory of the given user_id's store.
+    embeddings_factory (Callable): Creates the shared embedding function.
+    """
+
+    def __init__(self, path_factory: Callable[[str], str], embeddings_factory: Callable):
+        self.path_factory = path_factory
+        self.embeddings_factory = embeddings_factory
+        self._embeddings = None
+        self._stores: dict[str, LocalVectorStore] = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, user_id: str) -> LocalVectorStore:
+        with self._lock:
+            store = self._stores.get(user_id)
+            if store is None or store.read_signature() != store.signature:
+                if self._embeddings is None:
+                    self._embeddings = self.embeddings_factory()
+                store = LocalVectorStore(self.path_factory(user_id), self._embeddings)
+                self._stores[user_id] = store
+            return store
+
+
+    def clear(self, user_id: str):
+        self.get(user_id).clear()
+
+
+    def stats(self) -> dict:
+        with self._lock:
+            return {"stores": len(self._stores), "vectors": sum(store.count() for store in self._stores.values())}
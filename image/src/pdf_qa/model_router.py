@@ -0,0 +1,188 @@
+from concurrent.futures import ThreadPoolExecutor, TimeoutError as FutureTimeoutError
+from dataclasses import dataclass
+from typing import TYPE_CHECKING, Callable, Iterator
+from utils.api_key_loader import get_google_api_key
+import asyncio
+import os
+import queue
+import threading
+import time
+
+if TYPE_CHECKING:
+    from langchain_google_genai import GoogleGenerativeAI
+
+
+PRIMARY_MODEL = os.environ.get("PRIMARY_MODEL", "models/gemini-2.5-pro")
+FAST_MODEL = os.environ.get("FAST_MODEL", "models/gemini-2.5-flash")
+ROUTER_SHORT_QUERY_CHARS = int(os.environ.get("ROUTER_SHORT_QUERY_CHARS", 120))
+ROUTER_SMALL_CONTEXT_TOKENS = int(os.environ.get("ROUTER_SMALL_CONTEXT_TOKENS", 800))
+PRIMARY_DEADLINE_SECONDS = float(os.environ.get("PRIMARY_DEADLINE_SECONDS", 20))
+PREMIUM_USER_IDS = {user_id for user_id in os.environ.get("PREMIUM_USER_IDS", "").split(",") if user_id}
+ROUTER_MAX_WORKERS = int(os.environ.get("ROUTER_MAX_WORKERS", 16))
+
+_clients: dict[str, "GoogleGenerativeAI"] = {}
+_clients_lock = threading.Lock()
+_executor = None
+_executor_lock = threading.Lock()
+
+
+@dataclass
+class RoutingInfo:
+    """
+    How an answer was generated. Timings are whole milliseconds, so the record can be stored in DynamoDB as is.
+    """
+    model: str
+    routed_model: str
+    reason: str
+    tier: str = "standard"
+    fell_back: bool = False
+    fallback_reason: str | None = None
+    generation_ms: int = 0
+
+    @classmethod
+    def for_decision(cls, decision: "RoutingDecision") -> "RoutingInfo":
+        return cls(model=decision.model, routed_model=decision.model, reason=decision.reason, tier=decision.tier)
+
+
+@dataclass
+class RoutingDecision:
+    model: str
+    reason: str
+    tier: str
+    deadline_seconds: float | None
+    fallback_model: str | None
+
+    @property
+    def deadline(self) -> float | None:
+        # Without a fallback model there is nothing to switch to, so the routed model is waited for however long it takes
+        return self.deadline_seconds if self.fallback_model is not None else None
+
+
+def get_user_tier(user_id: str) -> str:
+    return "premium" if user_id in PREMIUM_USER_IDS else "standard"
+
+
+def route(query: str, context_tokens: int, user_id: str) -> RoutingDecision:
+    """
+    Picks the model for a query. Premium users always get the primary model. A short query with a small retrieved context is a lookup the fast model answers well, so it goes to the fast model, which has no fallback and no deadline; everything else goes to the primary model, which falls back to the fast model when it misses its deadline.
+
+    Parameters:
+    query (str): The query text.
+    context_tokens (int): The estimated tokens of the retrieved context.
+    user_id (str): The user making the query.
+
+    Returns:
+    RoutingDecision: The model, the reason, the deadline and the fallback model.
+    """
+    tier = get_user_tier(user_id)
+    if tier == "premium":
+        return RoutingDecision(PRIMARY_MODEL, "premium tier", tier, PRIMARY_DEADLINE_SECONDS, FAST_MODEL)
+    if len(query) <= ROUTER_SHORT_QUERY_CHARS and context_tokens <= ROUTER_SMALL_CONTEXT_TOKENS:
+        return RoutingDecision(FAST_MODEL, "short query and small context", tier, None, None)
+    return RoutingDecision(PRIMARY_MODEL, "long query or large context", tier, PRIMARY_DEADLINE_SECONDS, FAST_MODEL)
+
+
+def get_shared_llm(model: str) -> "GoogleGenerativeAI":
+    """
+    Returns the process-wide client of the given model, creating it on first use.
+    """
+    # Imported on first use, so routes which never call the LLM don't pay for it on a cold start
+    from langchain_google_genai import GoogleGenerativeAI
+
+    with _clients_lock:
+        if model not in _clients:
+            _clients[model] = GoogleGenerativeAI(model=model, google_api_key=get_google_api_key())
+        return _clients[model]
+
+
+def invoke_with_fallback(prompt: str, decision: RoutingDecision, llm_factory: Callable = get_shared_llm) -> tuple[str, RoutingInfo]:
+    """
+    Generates the answer with the routed model. If it fails or does not answer within its deadline, the fallback model answers instead. Without a fallback model, the routed model is waited for and its error is raised.
+
+    Note:
+    A call which missed its deadline can't be cancelled and finishes in the background; its answer is discarded.
+
+    Returns:
+    tuple[str, RoutingInfo]: The answer and how it was generated.
+    """
+    start = time.perf_counter()
+    info = RoutingInfo.for_decision(decision)
+    future = get_executor().submit(llm_factory(decision.model).invoke, prompt)
+    try:
+        answer = future.result(timeout=decision.deadline)
+    except Exception as e:
+        if decision.fallback_model is None:
+            raise
+        fallback_reason = "deadline exceeded" if isinstance(e, FutureTimeoutError) else f"error: {type(e).__name__}"
+        print(f"Model {decision.model} failed ({fallback_reason}), falling back to {decision.fallback_model}")
+        info.model, info.fell_back, info.fallback_reason = decision.fallback_model, True, fallback_reason
+        answer = llm_factory(decision.fallback_model).invoke(prompt)
+    info.generation_ms = elapsed_ms(start)
+    return answer, info
+
+
+async def ainvoke_with_fallback(prompt: str, decision: RoutingDecision, llm_factory: Callable = get_shared_llm) -> tuple[str, RoutingInfo]:
+    """
+    Async variant of `invoke_with_fallback`. A call which misses its deadline is cancelled.
+    """
+    start = time.perf_counter()
+    info = RoutingInfo.for_decision(decision)
+    try:
+        answer = await asyncio.wait_for(llm_factory(decision.model).ainvoke(prompt), timeout=decision.deadline)
+    except Exception as e:
+        if decision.fallback_model is None:
+            raise
+        fallback_reason = "deadline exceeded" if isinstance(e, asyncio.TimeoutError) else f"error: {type(e).__name__}"
+        print(f"Model {decision.model} failed ({fallback_reason}), falling back to {decision.fallback_model}")
+        info.model, info.fell_back, info.fallback_reason = decision.fallback_model, True, fallback_reason
+        answer = await llm_factory(decision.fallback_model).ainvoke(prompt)
+    info.generation_ms = elapsed_ms(start)
+    return answer, info
+
+
+def stream_with_fallback(prompt: str, decision: RoutingDecision, info: RoutingInfo, llm_factory: Callable = get_shared_llm) -> Iterator[str]:
+    """
+    Streams the answer of the routed model. The deadline applies to the first chunk: if the routed model fails or sends nothing in time, the fallback model streams the answer instead. Without a fallback model, the first chunk is waited for. `info` is filled in as the stream progresses.
+    """
+    start = time.perf_counter()
+    chunks: queue.Queue = queue.Queue()
+
+    def produce():
+        try:
+            for chunk in llm_factory(decision.model).stream(prompt):
+                chunks.put(("chunk", chunk))
+            chunks.put(("end", None))
+        except Exception as e:
+            chunks.put(("error", e))
+
+    # A stream holds its thread until the last chunk, so it gets its own thread instead of a pool worker
+    threading.Thread(target=produce, daemon=True).start()
+    try:
+        kind, value = chunks.get(timeout=decision.deadline)
+    except queue.Empty:
+        kind, value = "timeout", None
+
+    if kind in ("timeout", "error") and decision.fallback_model is not None:
+        fallback_reason = "deadline exceeded" if kind == "timeout" else f"error: {type(value).__name__}"
+        print(f"Model {decision.model} failed ({fallback_reason}), falling back to {decision.fallback_model}")
+        info.model, info.fell_back, info.fallback_reason = decision.fallback_model, True, fallback_reason
+        yield from llm_factory(decision.fallback_model).stream(prompt)
+    else:
+        while kind == "chunk":
+            yield value
+            kind, value = chunks.get()
+        if kind == "error":
+            raise value
+    info.generation_ms = elapsed_ms(start)
+
+
+def get_executor() -> ThreadPoolExecutor:
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=ROUTER_MAX_WORKERS, thread_name_prefix="llm")
+        return _executor
+
+
+def elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
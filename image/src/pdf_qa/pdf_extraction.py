@@ -0,0 +1,188 @@
+from collections import deque
+from concurrent.futures import ProcessPoolExecutor
+from datetime import datetime
+from itertools import islice
+from langchain_core.documents import Document
+from pathlib import Path
+from typing import Iterator, cast
+import os
+import pypdf
+
+
+PDF_EXTRACTION_WORKERS = int(os.environ.get("PDF_EXTRACTION_WORKERS", os.cpu_count() or 1))
+PDF_PAGES_PER_TASK = int(os.environ.get("PDF_PAGES_PER_TASK", 32))
+# Keys which `PyPDFParser` copies under the names shared by the other PDF parsers
+PDF_METADATA_KEY_ALIASES = {"page_count": "total_pages", "file_path": "source"}
+
+
+def list_pdf_files(directory: str) -> list[str]:
+    """
+    Lists the PDF files in a directory in the same order as `PyPDFDirectoryLoader` loads them, skipping hidden files.
+
+    Parameters:
+    directory (str): The directory to search.
+
+    Returns:
+    list[str]: The paths of the PDF files.
+    """
+    root = Path(directory)
+    paths = []
+    for path in root.glob("**/[!.]*.pdf"):
+        is_visible = not any(part.startswith(".") for part in path.relative_to(root).parts)
+        if path.is_file() and is_visible:
+            paths.append(str(path))
+    return paths
+
+
+def extract_pdf_documents(
+    paths: list[str],
+    max_workers: int = PDF_EXTRACTION_WORKERS,
+    pages_per_task: int = PDF_PAGES_PER_TASK
+) -> list[Document]:
+    """
+    Extracts one `Document` per page from the given PDF files, spreading files and page ranges of large files across a process pool.
+
+    The documents are returned in the same order and with the same `source`/`page` metadata as `PyPDFLoader` produces, so chunk ids generated by `add_id_metadata_to_chunks` stay stable.
+
+    Parameters:
+    paths (list[str]): The paths of the PDF files.
+    max_workers (int): The number of worker processes. 1 extracts serially in the current process.
+    pages_per_task (int): The maximum number of pages of a file which are extracted by a single task.
+
+    Returns:
+    list[Document]: A list of documents, each corresponding to a page from any of the given PDF files.
+    """
+    return list(iter_pdf_documents(paths, max_workers, pages_per_task))
+
+
+def iter_pdf_documents(
+    paths: list[str],
+    max_workers: int = PDF_EXTRACTION_WORKERS,
+    pages_per_task: int = PDF_PAGES_PER_TASK
+) -> Iterator[Document]:
+    """
+    Lazily yields one `Document` per page from the given PDF files, in the same order as `extract_pdf_documents`.
+
+    At most `2 * max_workers` page ranges are in flight at once, so a slow consumer holds back extraction instead of letting extracted pages pile up in memory.
+
+    Note:
+    Falls back to serial extraction when a process pool is not available, e.g. on AWS Lambda which lacks /dev/shm.
+
+    Parameters:
+    paths (list[str]): The paths of the PDF files.
+    max_workers (int): The number of worker processes. 1 extracts serially in the current process.
+    pages_per_task (int): The maximum number of pages of a file which are extracted by a single task.
+
+    Yields:
+    Document: A document corresponding to a page from any of the given PDF files.
+    """
+    tasks = plan_page_ranges(paths, pages_per_task)
+    executor = None
+    if max_workers > 1 and len(tasks) > 1:
+        try:
+            executor = ProcessPoolExecutor(max_workers=min(max_workers, len(tasks)))
+        except (OSError, NotImplementedError) as e:
+            print(f"Process pool is not available, extracting serially: {e}")
+
+    if executor is None:
+        for task in tasks:
+            yield from _extract_page_range_task(task)
+        return
+
+    with executor:
+        remaining_tasks = iter(tasks)
+        in_flight = deque(
+            executor.submit(_extract_page_range_task, task)
+            for task in islice(remaining_tasks, 2 * max_workers)
+        )
+        while in_flight:
+            documents = in_flight.popleft().result()
+            next_task = next(remaining_tasks, None)
+            if next_task is not None:
+                in_flight.append(executor.submit(_extract_page_range_task, next_task))
+            yield from documents
+
+
+def plan_page_ranges(paths: list[str], pages_per_task: int = PDF_PAGES_PER_TASK) -> list[tuple[str, int, int]]:
+    """
+    Splits the given PDF files into `(path, start_page, stop_page)` tasks of at most `pages_per_task` pages each.
+    """
+    tasks = []
+    for path in paths:
+        page_count = len(pypdf.PdfReader(path).pages)
+        if page_count == 0:
+            continue
+        for start in range(0, page_count, pages_per_task):
+            tasks.append((str(path), start, min(start + pages_per_task, page_count)))
+    return tasks
+
+
+def extract_page_range(path: str, start: int, stop: int) -> list[Document]:
+    """
+    Extracts the pages `start` (inclusive) to `stop` (exclusive) of a PDF file like `PyPDFParser` does in "page" mode.
+
+    Parameters:
+    path (str): The path of the PDF file.
+    start (int): The index of the first page.
+    stop (int): The index after the last page.
+
+    Returns:
+    list[Document]: One document per extracted page.
+    """
+    pdf_reader = pypdf.PdfReader(path)
+    doc_metadata = normalize_pdf_metadata(
+        {"producer": "PyPDF", "creator": "PyPDF", "creationdate": ""}
+        | cast(dict, pdf_reader.metadata or {})
+        | {
+            "source": path,
+            "total_pages": len(pdf_reader.pages),
+        }
+    )
+
+    documents = []
+    for page_number in range(start, stop):
+        page = pdf_reader.pages[page_number]
+        # Without images or tables to merge into the text, `PyPDFParser` keeps the stripped page text
+        text_from_page = page.extract_text(extraction_mode="plain")
+        documents.append(Document(
+            page_content=text_from_page.strip(),
+            metadata=doc_metadata | {
+                "page": page_number,
+                "page_label": pdf_reader.page_labels[page_number],
+            },
+        ))
+    return documents
+
+
+def normalize_pdf_metadata(metadata: dict) -> dict:
+    """
+    Normalizes the document information of a PDF like `PyPDFParser` does: keys lose their leading "/" and are lowercased, values which are neither strings nor ints become strings, strings are stripped and PDF dates are converted to ISO 8601.
+
+    Parameters:
+    metadata (dict): The document information of the PDF merged with the defaults and the `source`.
+
+    Returns:
+    dict: The metadata shared by every page of the PDF.
+    """
+    normalized = {}
+    for key, value in metadata.items():
+        if type(value) not in (str, int):
+            value = str(value)
+        key = key.removeprefix("/").lower()
+        if key in ("creationdate", "moddate"):
+            try:
+                normalized[key] = datetime.strptime(value.replace("'", ""), "D:%Y%m%d%H%M%S%z").isoformat("T")
+            except ValueError:
+                normalized[key] = value
+        elif key in PDF_METADATA_KEY_ALIASES:
+            normalized[PDF_METADATA_KEY_ALIASES[key]] = value
+            normalized[key] = value
+        elif isinstance(value, str):
+            normalized[key] = value.strip()
+        else:
+            normalized[key] = value
+    return normalized
+
+
+def _extract_page_range_task(task: tuple[str, int, int]) -> list[Document]:
+    return extract_page_range(*task)
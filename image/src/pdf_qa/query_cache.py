@@ -0,0 +1,252 @@
+from botocore.exceptions import ClientError
+from collections import OrderedDict
+from decimal import Decimal
+from dotenv import load_dotenv
+import hashlib
+import json
+import os
+import threading
+import time
+import boto3
+
+
+load_dotenv()
+
+
+def get_default_cache_backend(environ=os.environ) -> str:
+    """
+    Returns "dynamodb" wherever queries may be answered by another process than the one which ingests, i.e. on AWS or with a worker Lambda or queue, and "memory" otherwise. A process-local cache there would never see the corpus version bumps of the other processes and keep serving stale answers.
+    """
+    if any(environ.get(name) for name in ("AWS_EXECUTION_ENV", "WORKER_LAMBDA_NAME", "WORKER_QUEUE_URL")):
+        return "dynamodb"
+    return "memory"
+
+
+QUERY_CACHE_BACKEND = os.environ.get("QUERY_CACHE_BACKEND") or get_default_cache_backend()
+QUERY_CACHE_TTL_SECONDS = int(os.environ.get("QUERY_CACHE_TTL_SECONDS", 3600))
+QUERY_CACHE_MAX_ENTRIES = int(os.environ.get("QUERY_CACHE_MAX_ENTRIES", 1024))
+TABLE_NAME = os.environ.get("TABLE_NAME")
+
+
+class InMemoryCacheBackend:
+    """
+    Process-local LRU cache with a TTL per entry.
+
+    Parameters:
+    max_entries (int): The maximum number of entries.
+    """
+
+    def __init__(self, max_entries: int = QUERY_CACHE_MAX_ENTRIES, clock=time.time):
+        self.max_entries = max_entries
+        self.clock = clock
+        self._entries: OrderedDict[str, tuple[object, float | None]] = OrderedDict()
+        # Counters are kept apart from the LRU, so a corpus version is never evicted and reset
+        self._counters: dict[str, int] = {}
+        self._lock = threading.Lock()
+
+
+    def get(self, key: str):
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None:
+                return None
+            value, expires_at = entry
+            if expires_at is not None and self.clock() >= expires_at:
+                del self._entries[key]
+                return None
+            self._entries.move_to_end(key)
+            return value
+
+
+    def set(self, key: str, value, ttl_seconds: int | None = None):
+        with self._lock:
+            expires_at = self.clock() + ttl_seconds if ttl_seconds else None
+            self._entries[key] = (value, expires_at)
+            self._entries.move_to_end(key)
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+
+
+    def increment(self, key: str) -> int:
+        with self._lock:
+            self._counters[key] = self._counters.get(key, 0) + 1
+            return self._counters[key]
+
+
+    def get_counter(self, key: str) -> int:
+        with self._lock:
+            return self._counters.get(key, 0)
+
+
+class DynamoDBCacheBackend:
+    """
+    Cache backend which stores entries in the query table, so every API and worker instance shares them.
+
+    Entries are stored with `query_id` set to `cache#{key}` and without `created_at`, so they never show up in the user's query list. Expired entries are removed by the table's `ttl` attribute and ignored on read until then.
+    """
+
+    CACHE_USER_ID = "__cache__"
+
+    def __init__(self, table_name: str | None = TABLE_NAME):
+        if not table_name:
+            raise ValueError("TABLE_NAME must be set")
+        self.table = boto3.resource("dynamodb").Table(table_name)
+
+
+    def get(self, key: str):
+        try:
+            response = self.table.get_item(Key=self._key(key))
+        except ClientError as e:
+            print(f"Query cache ClientError: {e}")
+            return None
+        item = response.get("Item")
+        if item is None:
+            return None
+        if "ttl" in item and int(item["ttl"]) <= time.time():
+            return None
+        return json.loads(item["value"])
+
+
+    def set(self, key: str, value, ttl_seconds: int | None = None):
+        item = {**self._key(key), "value": json.dumps(value)}
+        if ttl_seconds:
+            item["ttl"] = int(time.time() + ttl_seconds)
+        try:
+            self.table.put_item(Item=item)
+        except ClientError as e:
+            print(f"Query cache ClientError: {e}")
+
+
+    def increment(self, key: str) -> int:
+        """
+        Returns the incremented counter, or 0 if it could not be incremented. A failure is only logged, since the counter is bumped after the vector store was already written.
+        """
+        try:
+            response = self.table.update_item(
+                Key=self._key(key),
+                UpdateExpression="ADD #counter :one",
+                ExpressionAttributeNames={"#counter": "counter"},
+                ExpressionAttributeValues={":one": Decimal(1)},
+                ReturnValues="UPDATED_NEW",
+            )
+        except ClientError as e:
+            print(f"Query cache ClientError: {e}")
+            return 0
+        return int(response["Attributes"]["counter"])
+
+
+    def get_counter(self, key: str) -> int:
+        try:
+            response = self.table.get_item(Key=self._key(key), ConsistentRead=True)
+        except ClientError as e:
+            print(f"Query cache ClientError: {e}")
+            return 0
+        return int(response.get("Item", {}).get("counter", 0))
+
+
+    def _key(self, key: str) -> dict:
+        return {"query_id": f"cache#{key}", "user_id": self.CACHE_USER_ID}
+
+
+class QueryCache:
+    """
+    Two-level cache for `process_query`.
+
+    The first level maps a normalized query text to its embedding, so a repeated question is not embedded again. The second level maps (user_id, normalized query, corpus version) to the full query response. The corpus version of a user is bumped whenever their documents change, which invalidates exactly the cached answers of that user.
+
+    Parameters:
+    backend: The storage backend, e.g. `InMemoryCacheBackend` or `DynamoDBCacheBackend`.
+    ttl_seconds (int): How long cached embeddings and answers are kept.
+    """
+
+    def __init__(self, backend, ttl_seconds: int = QUERY_CACHE_TTL_SECONDS):
+        self.backend = backend
+        self.ttl_seconds = ttl_seconds
+        self.hits = 0
+        self.misses = 0
+
+
+    def get_query_embedding(self, model: str, query: str) -> list[float] | None:
+        return self.backend.get(f"embedding#{model}#{hash_key(normalize_query(query))}")
+
+
+    def set_query_embedding(self, model: str, query: str, embedding: list[float]):
+        self.backend.set(f"embedding#{model}#{hash_key(normalize_query(query))}", list(embedding), self.ttl_seconds)
+
+
+    def get_corpus_version(self, user_id: str) -> int:
+        return self.backend.get_counter(f"corpus_version#{user_id}")
+
+
+    def bump_corpus_version(self, user_id: str) -> int:
+        return self.backend.increment(f"corpus_version#{user_id}")
+
+
+    def get_response(self, user_id: str, query: str, corpus_version: int) -> dict | None:
+        value = self.backend.get(self._response_key(user_id, query, corpus_version))
+        if value is None:
+            self.misses += 1
+        else:
+            self.hits += 1
+        return value
+
+
+    def set_response(self, user_id: str, query: str, corpus_version: int, response: dict | None):
+        self.backend.set(self._response_key(user_id, query, corpus_version), {"response": response}, self.ttl_seconds)
+
+
+    def stats(self) -> dict:
+        lookups = self.hits + self.misses
+        return {
+            "hits": self.hits,
+            "misses": self.misses,
+            "hit_rate": self.hits / lookups if lookups else 0.0,
+        }
+
+
+    def _response_key(self, user_id: str, query: str, corpus_version: int) -> str:
+        return f"response#{user_id}#{corpus_version}#{hash_key(normalize_query(query))}"
+
+
+def normalize_query(query: str) -> str:
+    """
+    Normalizes a query text for cache lookups by lowercasing it and collapsing whitespace.
+    """
+    return " ".join(query.lower().split())
+
+
+def hash_key(text: str) -> str:
+    return hashlib.sha256(text.encode('utf-8')).hexdigest()
+
+
+_query_cache = None
+_query_cache_lock = threading.Lock()
+
+
+def get_query_cache() -> QueryCache | None:
+    """
+    Returns the process-wide query cache selected by `QUERY_CACHE_BACKEND` ("memory", "dynamodb" or "none").
+
+    Returns:
+    QueryCache | None: The query cache, or None if caching is disabled.
+    """
+    global _query_cache
+    if QUERY_CACHE_BACKEND == "none":
+        return None
+    with _query_cache_lock:
+        if _query_cache is None:
+            if QUERY_CACHE_BACKEND == "dynamodb":
+                backend = DynamoDBCacheBackend()
+            else:
+                backend = InMemoryCacheBackend()
+            _query_cache = QueryCache(backend)
+        return _query_cache
+
+
+def bump_corpus_version(user_id: str):
+    """
+    Invalidates the cached answers of the given user_id, e.g. after their documents changed.
+    """
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        query_cache.bump_corpus_version(user_id)
@@ -1,12 +1,28 @@
+from langchain_core.documents import Document
 from langchain_core.prompts import ChatPromptTemplate
 from langchain_google_genai import GoogleGenerativeAI
 from .chroma_handler import get_chroma_db
-from dataclasses import dataclass
-from typing import List
-from utils.api_key_loader import get_google_api_key
+from .context_builder import CONTEXT_CANDIDATES, BuiltContext, build_context
+from .model_router import (
+    PRIMARY_MODEL,
+    RoutingInfo,
+    ainvoke_with_fallback,
+    get_shared_llm,
+    invoke_with_fallback,
+    route,
+    stream_with_fallback,
+)
+from .query_cache import QueryCache, get_query_cache
+from .sources import Source
+from dataclasses import dataclass, asdict
+from typing import Iterator, List
+import asyncio
 import os
 
 
+# Cosine similarities, the score every vector store backend returns
+MIN_RETRIEVAL_RELEVANCE = 0.4
+MIN_SOURCE_RELEVANCE = 0.5
 PROMPT_TEMPLATE = """
 Answer the question based only on the following context:
 
@@ -18,17 +34,12 @@ Answer the question based on the above context: {question}
 """
 
 
-@dataclass(frozen=True)
-class Source:
-    filename: str
-    page: int
-
-
 @dataclass
 class QueryResponse:
     query_text: str
     response_text: str
     sources: List[Source]
+    routing: RoutingInfo | None = None
 
 
 def process_query(query: str, user_id: str = "nobody") -> QueryResponse | None:
@@ -47,30 +58,184 @@ def process_query(query: str, user_id: str = "nobody") -> QueryResponse | None:
     #     print("Please upload some PDFs first")
     #     return None
 
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        corpus_version = query_cache.get_corpus_version(user_id)
+        cached = query_cache.get_response(user_id, query, corpus_version)
+        if cached is not None:
+            print(f"Query cache hit, stats: {query_cache.stats()}")
+            return query_response_from_dict(cached["response"])
+
     db = get_chroma_db(user_id)
     if db is None:
         print("db not found")
         return None
-    results = db.similarity_search_with_score(query, k=5)
+    results = retrieve_results(db, query, query_cache)
+    if results is None:
+        if query_cache is not None:
+            query_cache.set_response(user_id, query, corpus_version, None)
+        return None
+
+    context = build_context(results)
+    decision = route(query, context.tokens, user_id)
+    response_str, routing = invoke_with_fallback(build_prompt(query, context), decision, llm_factory=get_llm)
+    sources = get_sources(context.results)
+
+    response = f'Response: {response_str}\n---\nSources: {sources}'
+    print(response)
+
+    query_response = QueryResponse(
+        query_text=query,
+        response_text=response_str,
+        sources=sources,
+        routing=routing
+    )
+    if query_cache is not None:
+        query_cache.set_response(user_id, query, corpus_version, asdict(query_response))
+    return query_response
+
+
+async def aprocess_query(query: str, user_id: str = "nobody") -> QueryResponse | None:
+    """
+    Async variant of `process_query`. Retrieval and generation are awaited, and the blocking cache and Chroma client lookups run in worker threads, so the event loop can keep many queries in flight.
+
+    Parameters:
+    query (str): The question you want to ask.
+    user_id (str, optional): The identifier of the user making the query. Defaults to "nobody".
+
+    Returns:
+    QueryResponse | None: QueryResponse object containing the query, response, and its sources, or None if no suitable response is available.
+    """
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        corpus_version = await asyncio.to_thread(query_cache.get_corpus_version, user_id)
+        cached = await asyncio.to_thread(query_cache.get_response, user_id, query, corpus_version)
+        if cached is not None:
+            print(f"Query cache hit, stats: {query_cache.stats()}")
+            return query_response_from_dict(cached["response"])
+
+    db = await asyncio.to_thread(get_chroma_db, user_id)
+    if db is None:
+        print("db not found")
+        return None
+    results = await aretrieve_results(db, query, query_cache)
+    if results is None:
+        if query_cache is not None:
+            await asyncio.to_thread(query_cache.set_response, user_id, query, corpus_version, None)
+        return None
+
+    context = build_context(results)
+    decision = route(query, context.tokens, user_id)
+    response_str, routing = await ainvoke_with_fallback(build_prompt(query, context), decision, llm_factory=get_llm)
+    sources = get_sources(context.results)
+    print(f'Response: {response_str}\n---\nSources: {sources}')
+
+    query_response = QueryResponse(
+        query_text=query,
+        response_text=response_str,
+        sources=sources,
+        routing=routing
+    )
+    if query_cache is not None:
+        await asyncio.to_thread(query_cache.set_response, user_id, query, corpus_version, asdict(query_response))
+    return query_response
+
+
+def stream_query(query: str, user_id: str = "nobody") -> Iterator[tuple[str, object]]:
+    """
+    Processes a query like `process_query`, but streams the answer as the LLM generates it.
+
+    Yields ("sources", list[Source]) as soon as retrieval is done, then ("token", str) for every chunk of the answer, and finally ("done", QueryResponse | None). If no suitable response is available, only ("done", None) is yielded.
+
+    Parameters:
+    query (str): The question you want to ask.
+    user_id (str, optional): The identifier of the user making the query. Defaults to "nobody".
+    """
+    query_cache = get_query_cache()
+    if query_cache is not None:
+        corpus_version = query_cache.get_corpus_version(user_id)
+        cached = query_cache.get_response(user_id, query, corpus_version)
+        if cached is not None:
+            print(f"Query cache hit, stats: {query_cache.stats()}")
+            query_response = query_response_from_dict(cached["response"])
+            if query_response is not None:
+                yield "sources", query_response.sources
+                yield "token", query_response.response_text
+            yield "done", query_response
+            return
+
+    db = get_chroma_db(user_id)
+    if db is None:
+        print("db not found")
+        yield "done", None
+        return
+    results = retrieve_results(db, query, query_cache)
+    if results is None:
+        if query_cache is not None:
+            query_cache.set_response(user_id, query, corpus_version, None)
+        yield "done", None
+        return
+
+    context = build_context(results)
+    sources = get_sources(context.results)
+    yield "sources", sources
+
+    decision = route(query, context.tokens, user_id)
+    routing = RoutingInfo.for_decision(decision)
+    chunks = []
+    for chunk in stream_with_fallback(build_prompt(query, context), decision, routing, llm_factory=get_llm):
+        chunks.append(chunk)
+        yield "token", chunk
+
+    query_response = QueryResponse(
+        query_text=query,
+        response_text="".join(chunks),
+        sources=sources,
+        routing=routing
+    )
+    if query_cache is not None:
+        query_cache.set_response(user_id, query, corpus_version, asdict(query_response))
+    yield "done", query_response
+
+
+def retrieve_results(db, query: str, query_cache: QueryCache | None = None) -> list[tuple[Document, float]] | None:
+    """
+    Retrieves the chunks most similar to the query.
+
+    Returns:
+    list[tuple[Document, float]] | None: The chunks with their scores, or None if there is no matching chunk.
+    """
+    results = db.similarity_search_by_vector_with_relevance_scores(embed_query(db, query, query_cache), k=CONTEXT_CANDIDATES)
     print(f"Results = {results[:3]}")
-    if len(results) == 0 or results[0][1] < 0.4:
+    if len(results) == 0 or results[0][1] < MIN_RETRIEVAL_RELEVANCE:
         print("Unable to find matching results.")
         return None
+    return results
+
 
-    context_str = '\n\n---\n\n'.join([doc.page_content for doc, _ in results])
+async def aretrieve_results(db, query: str, query_cache: QueryCache | None = None) -> list[tuple[Document, float]] | None:
+    """
+    Async variant of `retrieve_results`.
+    """
+    results = await db.asimilarity_search_by_vector_with_relevance_scores(await aembed_query(db, query, query_cache), k=CONTEXT_CANDIDATES)
+    print(f"Results = {results[:3]}")
+    if len(results) == 0 or results[0][1] < MIN_RETRIEVAL_RELEVANCE:
+        print("Unable to find matching results.")
+        return None
+    return results
+
+
+def build_prompt(query: str, context: BuiltContext) -> str:
+    print(f"Context: {context.tokens} tokens from {len(context.results)} chunks, {context.tokens_saved} tokens saved")
     prompt_template = ChatPromptTemplate.from_template(PROMPT_TEMPLATE)
-    prompt = prompt_template.format(context=context_str, question=query)
+    return prompt_template.format(context=context.text, question=query)
 
-    llm = GoogleGenerativeAI(
-        model="models/gemini-2.5-pro",
-        google_api_key=get_google_api_key()
-    )
-    response_str = llm.invoke(prompt)
 
+def get_sources(results: list[tuple[Document, float]]) -> list[Source]:
     sources = [
         str(doc.metadata.get('id'))
         for doc, score in results
-        if 'id' in doc.metadata and score >= 0.5
+        if 'id' in doc.metadata and score >= MIN_SOURCE_RELEVANCE
     ]
     unique_sources = set()
     for source in sources:
@@ -78,12 +243,61 @@ def process_query(query: str, user_id: str = "nobody") -> QueryResponse | None:
         filename = os.path.basename(parts[0])
         page = int(parts[1])
         unique_sources.add(Source(filename=filename, page=page))
+    return list(unique_sources)
 
-    response = f'Response: {response_str}\n---\nSources: {sources}'
-    print(response)
 
+def get_llm(model: str = PRIMARY_MODEL) -> GoogleGenerativeAI:
+    return get_shared_llm(model)
+
+
+def embed_query(db, query: str, query_cache: QueryCache | None = None) -> list[float]:
+    """
+    Embeds the query with the embedding function of the vector store, reusing a cached embedding of the same normalized query if there is one.
+
+    Parameters:
+    db (Chroma): The vector store whose embedding function is used.
+    query (str): The query text.
+    query_cache (QueryCache | None): The cache to look up and store the embedding in.
+
+    Returns:
+    list[float]: The query embedding.
+    """
+    embeddings = db.embeddings
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    if query_cache is not None:
+        cached_embedding = query_cache.get_query_embedding(model, query)
+        if cached_embedding is not None:
+            return cached_embedding
+
+    query_embedding = embeddings.embed_query(query)
+    if query_cache is not None:
+        query_cache.set_query_embedding(model, query, query_embedding)
+    return query_embedding
+
+
+async def aembed_query(db, query: str, query_cache: QueryCache | None = None) -> list[float]:
+    """
+    Async variant of `embed_query`.
+    """
+    embeddings = db.embeddings
+    model = getattr(embeddings, "model", type(embeddings).__name__)
+    if query_cache is not None:
+        cached_embedding = await asyncio.to_thread(query_cache.get_query_embedding, model, query)
+        if cached_embedding is not None:
+            return cached_embedding
+
+    query_embedding = await embeddings.aembed_query(query)
+    if query_cache is not None:
+        await asyncio.to_thread(query_cache.set_query_embedding, model, query, query_embedding)
+    return query_embedding
+
+
+def query_response_from_dict(data: dict | None) -> QueryResponse | None:
+    if data is None:
+        return None
     return QueryResponse(
-        query_text=query,
-        response_text=response_str,
-        sources=list(unique_sources)
+        query_text=data["query_text"],
+        response_text=data["response_text"],
+        sources=[Source(**source) for source in data["sources"]],
+        routing=RoutingInfo(**data["routing"]) if data.get("routing") else None
     )
@@ -0,0 +1,156 @@
+from botocore.config import Config
+from botocore.exceptions import ClientError
+from concurrent.futures import ThreadPoolExecutor
+from dataclasses import dataclass, field
+import json
+import os
+import threading
+import boto3
+
+
+BUCKET_NAME = os.environ.get("BUCKET_NAME")
+S3_SYNC_MAX_WORKERS = int(os.environ.get("S3_SYNC_MAX_WORKERS", 8))
+
+_s3_client = None
+_s3_client_lock = threading.Lock()
+
+
+@dataclass
+class RemoteFile:
+    key: str
+    filename: str
+    size: int
+    etag: str
+
+
+@dataclass
+class SyncReport:
+    downloaded_files: list[str] = field(default_factory=list)
+    skipped_files: list[str] = field(default_factory=list)
+    failed_files: list[str] = field(default_factory=list)
+    bytes_transferred: int = 0
+    bytes_skipped: int = 0
+
+
+def get_s3_client():
+    """
+    Returns an S3 client which is shared by every thread of the process. Its connection pool is sized for `S3_SYNC_MAX_WORKERS` concurrent transfers.
+    """
+    global _s3_client
+    with _s3_client_lock:
+        if _s3_client is None:
+            _s3_client = boto3.client('s3', config=Config(max_pool_connections=max(S3_SYNC_MAX_WORKERS, 10)))
+        return _s3_client
+
+
+def list_s3_files(prefix: str, s3_client=None) -> list[RemoteFile]:
+    """
+    Lists every object under the given prefix, following the pagination of `list_objects_v2` past the first 1000 keys.
+
+    Parameters:
+    prefix (str): The key prefix, e.g. "source/{user_id}/".
+
+    Returns:
+    list[RemoteFile]: The objects with their filename relative to the prefix, size and ETag.
+    """
+    s3_client = s3_client or get_s3_client()
+    remote_files = []
+    paginator = s3_client.get_paginator('list_objects_v2')
+    for page in paginator.paginate(Bucket=BUCKET_NAME, Prefix=prefix):
+        for obj in page.get('Contents', []):
+            filename = obj['Key'][len(prefix):]
+            if filename:
+                remote_files.append(RemoteFile(
+                    key=obj['Key'],
+                    filename=filename,
+                    size=obj['Size'],
+                    etag=obj['ETag'].strip('"')
+                ))
+    return remote_files
+
+
+def sync_s3_files(
+    remote_files: list[RemoteFile],
+    local_dir: str,
+    s3_client=None,
+    max_workers: int = S3_SYNC_MAX_WORKERS
+) -> SyncReport:
+    """
+    Downloads the given objects into `local_dir` through a bounded thread pool.
+
+    Next to each downloaded file a hidden `.{filename}.s3meta.json` sidecar records its ETag and size. Files whose local copy still matches its sidecar, e.g. from a previous warm Lambda invocation, are skipped.
+
+    Parameters:
+    remote_files (list[RemoteFile]): The objects to download.
+    local_dir (str): The directory to download into.
+    max_workers (int): The maximum number of concurrent downloads.
+
+    Returns:
+    SyncReport: The downloaded, skipped and failed files with the bytes transferred and skipped.
+    """
+    s3_client = s3_client or get_s3_client()
+    report = SyncReport()
+    to_download = []
+    for remote_file in remote_files:
+        if is_local_copy_current(remote_file, local_dir):
+            report.skipped_files.append(remote_file.filename)
+            report.bytes_skipped += remote_file.size
+        else:
+            to_download.append(remote_file)
+
+    def download(remote_file: RemoteFile) -> bool:
+        local_path = os.path.join(local_dir, remote_file.filename)
+        os.makedirs(os.path.dirname(local_path), exist_ok=True)
+        try:
+            s3_client.download_file(BUCKET_NAME, remote_file.key, local_path)
+        except ClientError as e:
+            print(f"Failed to download {remote_file.filename} to {local_path}")
+            print(f"Client error: {e}")
+            return False
+        with open(get_sidecar_path(local_dir, remote_file.filename), 'w') as file:
+            json.dump({"etag": remote_file.etag, "size": remote_file.size}, file)
+        return True
+
+    if to_download:
+        with ThreadPoolExecutor(max_workers=min(max_workers, len(to_download))) as executor:
+            results = list(executor.map(download, to_download))
+        for remote_file, is_downloaded in zip(to_download, results):
+            if is_downloaded:
+                report.downloaded_files.append(remote_file.filename)
+                report.bytes_transferred += remote_file.size
+            else:
+                report.failed_files.append(remote_file.filename)
+
+    print(f"Synced {len(report.downloaded_files)} files ({report.bytes_transferred} bytes), skipped {len(report.skipped_files)} unchanged files ({report.bytes_skipped} bytes)")
+    return report
+
+
+def sync_s3_prefix(prefix: str, local_dir: str, max_workers: int = S3_SYNC_MAX_WORKERS) -> SyncReport:
+    """
+    Lists every object under the given prefix and syncs them into `local_dir`.
+
+    Parameters:
+    prefix (str): The key prefix, e.g. "source/{user_id}/".
+    local_dir (str): The directory to download into.
+
+    Returns:
+    SyncReport: The downloaded, skipped and failed files with the bytes transferred and skipped.
+    """
+    s3_client = get_s3_client()
+    return sync_s3_files(list_s3_files(prefix, s3_client), local_dir, s3_client, max_workers)
+
+
+def is_local_copy_current(remote_file: RemoteFile, local_dir: str) -> bool:
+    local_path = os.path.join(local_dir, remote_file.filename)
+    try:
+        with open(get_sidecar_path(local_dir, remote_file.filename)) as file:
+            sidecar = json.load(file)
+        local_size = os.path.getsize(local_path)
+    except (OSError, ValueError):
+        return False
+    return sidecar.get("etag") == remote_file.etag and sidecar.get("size") == remote_file.size == local_size
+
+
+def get_sidecar_path(local_dir: str, filename: str) -> str:
+    directory, name = os.path.split(filename)
+    return os.path.join(local_dir, directory, f".{name}.s3meta.json")
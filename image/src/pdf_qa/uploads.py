@@ -0,0 +1,172 @@
+from botocore.exceptions import ClientError
+from dataclasses import dataclass
+from typing import Protocol
+from .s3_sync import get_s3_client
+import asyncio
+import hashlib
+import os
+
+
+# S3 requires every part of a multipart upload but the last to be at least 5 MiB
+UPLOAD_PART_SIZE = max(int(os.environ.get("UPLOAD_PART_SIZE", 8 * 1024 * 1024)), 5 * 1024 * 1024)
+UPLOAD_MAX_PARALLEL_PARTS = int(os.environ.get("UPLOAD_MAX_PARALLEL_PARTS", 4))
+UPLOAD_MAX_CONCURRENT_FILES = int(os.environ.get("UPLOAD_MAX_CONCURRENT_FILES", 4))
+
+
+class AsyncReadable(Protocol):
+    filename: str | None
+
+    async def read(self, size: int = -1) -> bytes: ...
+
+
+@dataclass
+class UploadResult:
+    filename: str
+    size: int
+    content_hash: str
+    parts: int = 1
+
+
+def get_upload_memory_bound(
+    part_size: int = UPLOAD_PART_SIZE,
+    max_parallel_parts: int = UPLOAD_MAX_PARALLEL_PARTS,
+    max_concurrent_files: int = UPLOAD_MAX_CONCURRENT_FILES,
+) -> int:
+    """
+    Returns the most bytes of uploaded files held in memory at once: every concurrent file holds its parts in flight and the part being read.
+    """
+    return max_concurrent_files * (max_parallel_parts + 1) * part_size
+
+
+async def upload_documents(
+    documents: list[AsyncReadable],
+    bucket: str | None = None,
+    prefix: str = "",
+    directory: str | None = None,
+    max_concurrent_files: int = UPLOAD_MAX_CONCURRENT_FILES,
+    **kwargs,
+) -> list[UploadResult]:
+    """
+    Streams uploaded PDFs to S3 under `prefix` or, without a bucket, into `directory`, at most `max_concurrent_files` at a time. Files which fail to upload to S3 are left out of the result.
+
+    Parameters:
+    documents (list[AsyncReadable]): The uploaded files, e.g. FastAPI `UploadFile`s.
+    bucket (str | None): The S3 bucket.
+    prefix (str): The key prefix of the files in the bucket.
+    directory (str | None): The local directory, if no bucket is given.
+    max_concurrent_files (int): The maximum number of files uploaded at the same time.
+
+    Returns:
+    list[UploadResult]: The size and SHA-256 hash of every stored file, in the order of `documents`.
+    """
+    semaphore = asyncio.Semaphore(max_concurrent_files)
+
+    async def upload(document: AsyncReadable) -> UploadResult | None:
+        async with semaphore:
+            if bucket is None:
+                return await stream_to_file(document, os.path.join(directory, document.filename), **kwargs)
+            try:
+                return await stream_to_s3(document, bucket, prefix + document.filename, **kwargs)
+            except ClientError as e:
+                print(f"Error uploading {document.filename} to S3")
+                print(f"ClientError: {e}")
+                return None
+
+    results = await asyncio.gather(*(upload(document) for document in documents))
+    return [result for result in results if result is not None]
+
+
+async def stream_to_s3(
+    document: AsyncReadable,
+    bucket: str,
+    key: str,
+    part_size: int = UPLOAD_PART_SIZE,
+    max_parallel_parts: int = UPLOAD_MAX_PARALLEL_PARTS,
+    s3_client=None,
+) -> UploadResult:
+    """
+    Streams a file to S3 in chunks of `part_size` bytes and hashes it on the way. A file larger than one part is sent as a multipart upload with up to `max_parallel_parts` parts in flight; the next part is only read once one of them is done, so memory stays bounded. A failed multipart upload is aborted.
+
+    Returns:
+    UploadResult: The size, SHA-256 hash and number of parts of the file.
+    """
+    s3_client = s3_client or get_s3_client()
+    object_args = {"Bucket": bucket, "Key": key, "ContentType": "application/pdf", "ContentDisposition": "inline"}
+    sha256 = hashlib.sha256()
+    chunk = await read_chunk(document, part_size)
+    sha256.update(chunk)
+    size = len(chunk)
+
+    if len(chunk) < part_size:
+        await asyncio.to_thread(s3_client.put_object, Body=chunk, **object_args)
+        return UploadResult(filename=document.filename, size=size, content_hash=sha256.hexdigest())
+
+    upload_id = (await asyncio.to_thread(s3_client.create_multipart_upload, **object_args))["UploadId"]
+    slots = asyncio.Semaphore(max_parallel_parts)
+    tasks: list[asyncio.Task] = []
+
+    async def upload_part(part_number: int, body: bytes) -> dict:
+        try:
+            response = await asyncio.to_thread(
+                s3_client.upload_part, Bucket=bucket, Key=key, UploadId=upload_id, PartNumber=part_number, Body=body
+            )
+            return {"PartNumber": part_number, "ETag": response["ETag"]}
+        finally:
+            slots.release()
+
+    try:
+        part_number = 1
+        while chunk:
+            await slots.acquire()
+            tasks.append(asyncio.create_task(upload_part(part_number, chunk)))
+            chunk = await read_chunk(document, part_size)
+            sha256.update(chunk)
+            size += len(chunk)
+            part_number += 1
+        parts = await asyncio.gather(*tasks)
+        await asyncio.to_thread(
+            s3_client.complete_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id, MultipartUpload={"Parts": parts}
+        )
+    except BaseException:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+        await asyncio.to_thread(s3_client.abort_multipart_upload, Bucket=bucket, Key=key, UploadId=upload_id)
+        raise
+    return UploadResult(filename=document.filename, size=size, content_hash=sha256.hexdigest(), parts=len(parts))
+
+
+async def stream_to_file(document: AsyncReadable, path: str, part_size: int = UPLOAD_PART_SIZE, **kwargs) -> UploadResult:
+    """
+    Streams a file to `path` in chunks of `part_size` bytes and hashes it on the way. The file is written next to `path` first and moved into place once complete.
+
+    Returns:
+    UploadResult: The size and SHA-256 hash of the file.
+    """
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    sha256 = hashlib.sha256()
+    size = 0
+    tmp_path = f"{path}.part"
+    with open(tmp_path, "wb") as file:
+        while chunk := await read_chunk(document, part_size):
+            sha256.update(chunk)
+            size += len(chunk)
+            await asyncio.to_thread(file.write, chunk)
+    os.replace(tmp_path, path)
+    return UploadResult(filename=document.filename, size=size, content_hash=sha256.hexdigest())
+
+
+async def read_chunk(document: AsyncReadable, size: int) -> bytes:
+    """
+    Reads `size` bytes, or fewer only at the end of the file.
+    """
+    chunk = await document.read(size)
+    if not chunk or len(chunk) == size:
+        return chunk
+    buffer = bytearray(chunk)
+    while len(buffer) < size:
+        more = await document.read(size - len(buffer))
+        if not more:
+            break
+        buffer += more
+    return bytes(buffer)
@@ -0,0 +1,174 @@
+from dataclasses import dataclass, asdict
+import json
+import os
+import numpy as np
+
+
+LOCAL_VECTOR_QUANTIZATION = os.environ.get("LOCAL_VECTOR_QUANTIZATION", "none")
+LOCAL_VECTOR_DIMENSIONS = int(os.environ.get("LOCAL_VECTOR_DIMENSIONS", 0))
+LOCAL_VECTOR_RESCORE = os.environ.get("LOCAL_VECTOR_RESCORE", "true").lower() == "true"
+CODEC_FILENAME = "codec.json"
+SCALES_FILENAME = "codes.scales.f32"
+SCORE_CHUNK_SIZE = 256
+
+
+@dataclass(frozen=True)
+class VectorCodec:
+    """
+    Compact encoding of the normalized vectors of a `LocalVectorStore`, which is searched in place of the full float32 vectors.
+
+    - `dimensions` truncates the vectors to their leading dimensions (Matryoshka-style) and renormalizes them. `text-embedding-004` is trained so that its leading dimensions carry most of the information.
+    - `quantization="int8"` stores every component as an int8 with one float32 scale per vector, i.e. a quarter of the float32 size.
+
+    With `rescore`, the full float32 vectors are kept on disk next to the codes, and the best candidates of the codes are rescored with them. The codes then shrink what is held in memory and scanned per query, while the collection takes more disk than without a codec. Without `rescore`, only the codes are written and results are ranked by their approximate scores, so the collection also takes a fraction of the disk.
+
+    Parameters:
+    quantization (str): "none" or "int8".
+    dimensions (int): The number of leading dimensions to keep. 0 keeps every dimension.
+    rescore (bool): Whether the full float32 vectors are kept to rescore the best candidates.
+    """
+
+    quantization: str = "none"
+    dimensions: int = 0
+    rescore: bool = True
+
+    def __post_init__(self):
+        if self.quantization not in ("none", "int8"):
+            raise ValueError(f"Unknown quantization {self.quantization}, expected 'none' or 'int8'")
+        if self.is_identity and not self.rescore:
+            raise ValueError("Without quantization or truncation, the full vectors are the codes and must be kept")
+
+
+    @property
+    def is_identity(self) -> bool:
+        return self.quantization == "none" and not self.dimensions
+
+
+    @property
+    def codes_filename(self) -> str:
+        return "codes.i8" if self.quantization == "int8" else "codes.f32"
+
+
+    def encode(self, vectors: np.ndarray) -> tuple[np.ndarray, np.ndarray | None]:
+        """
+        Encodes normalized vectors.
+
+        Returns:
+        tuple[np.ndarray, np.ndarray | None]: The codes and, for int8, the scale of every vector.
+        """
+        vectors = self.project(vectors)
+        if self.quantization != "int8":
+            return vectors.astype(np.float32), None
+
+        scales = np.abs(vectors).max(axis=1) / 127
+        scales[scales == 0] = 1
+        codes = np.clip(np.rint(vectors / scales[:, None]), -127, 127).astype(np.int8)
+        return codes, scales.astype(np.float32)
+
+
+    def project(self, vectors: np.ndarray) -> np.ndarray:
+        """
+        Truncates normalized vectors to the kept dimensions and renormalizes them, i.e. maps them to the space of the codes.
+        """
+        vectors = np.asarray(vectors, dtype=np.float32)
+        if self.dimensions and self.dimensions < vectors.shape[1]:
+            vectors = vectors[:, :self.dimensions]
+            norms = np.linalg.norm(vectors, axis=1, keepdims=True)
+            norms[norms == 0] = 1
+            vectors = vectors / norms
+        return vectors
+
+
+    def decode(self, codes: np.ndarray, scales: np.ndarray | None) -> np.ndarray:
+        """
+        Returns the approximate float32 vectors of the codes, in the space of the codes.
+        """
+        if scales is None:
+            return np.asarray(codes, dtype=np.float32)
+        return codes.astype(np.float32) * scales[:, None]
+
+
+    def score(self, codes: np.ndarray, scales: np.ndarray | None, query: np.ndarray) -> np.ndarray:
+        """
+        Returns the approximate cosine similarity of every encoded vector to the normalized query.
+        """
+        query_code = self.project(query.reshape(1, -1))[0]
+        if scales is None:
+            return codes @ query_code
+        # int8 codes are widened in small chunks which stay in the CPU cache, instead of materializing a float copy of the whole matrix
+        scores = np.empty(len(codes), dtype=np.float32)
+        for start in range(0, len(codes), SCORE_CHUNK_SIZE):
+            chunk = codes[start:start + SCORE_CHUNK_SIZE].astype(np.float32)
+            scores[start:start + len(chunk)] = chunk @ query_code
+        return scores * scales
+
+
+    def append(self, path: str, codes: np.ndarray, scales: np.ndarray | None):
+        with open(os.path.join(path, self.codes_filename), "ab") as file:
+            file.write(codes.tobytes())
+        if scales is not None:
+            with open(os.path.join(path, SCALES_FILENAME), "ab") as file:
+                file.write(scales.tobytes())
+
+
+    def write(self, path: str, codes: np.ndarray | None = None, scales: np.ndarray | None = None):
+        """
+        Persists the codec and replaces the codes in the given directory.
+        """
+        self.remove(path)
+        with open(os.path.join(path, CODEC_FILENAME), "w") as file:
+            json.dump(asdict(self), file)
+        if codes is not None:
+            self.append(path, codes, scales)
+
+
+    def read(self, path: str, rows: int) -> tuple[np.ndarray, np.ndarray | None] | None:
+        """
+        Reads the persisted codes into memory.
+
+        Returns:
+        tuple[np.ndarray, np.ndarray | None] | None: The codes and scales, or None if they are missing or do not cover exactly `rows` vectors.
+        """
+        codes_path = os.path.join(path, self.codes_filename)
+        if not os.path.exists(codes_path):
+            return None
+        codes = np.fromfile(codes_path, dtype=np.int8 if self.quantization == "int8" else np.float32)
+        if rows == 0 or len(codes) % rows:
+            return None
+        codes = codes.reshape(rows, -1)
+        scales = None
+        if self.quantization == "int8":
+            scales_path = os.path.join(path, SCALES_FILENAME)
+            if not os.path.exists(scales_path):
+                return None
+            scales = np.fromfile(scales_path, dtype=np.float32)
+            if len(scales) != rows:
+                return None
+        return codes, scales
+
+
+    @staticmethod
+    def remove(path: str):
+        for filename in (CODEC_FILENAME, "codes.i8", "codes.f32", SCALES_FILENAME):
+            file_path = os.path.join(path, filename)
+            if os.path.exists(file_path):
+                os.remove(file_path)
+
+
+    @classmethod
+    def load(cls, path: str) -> "VectorCodec | None":
+        codec_path = os.path.join(path, CODEC_FILENAME)
+        if not os.path.exists(codec_path):
+            return None
+        with open(codec_path) as file:
+            return cls(**json.load(file))
+
+
+def get_default_codec() -> VectorCodec:
+    """
+    Returns the codec of new collections, selected by `LOCAL_VECTOR_QUANTIZATION`, `LOCAL_VECTOR_DIMENSIONS` and `LOCAL_VECTOR_RESCORE`.
+    """
+    quantization, dimensions = LOCAL_VECTOR_QUANTIZATION, LOCAL_VECTOR_DIMENSIONS
+    # The identity codec always keeps the full vectors
+    rescore = LOCAL_VECTOR_RESCORE or (quantization == "none" and not dimensions)
+    return VectorCodec(quantization=quantization, dimensions=dimensions, rescore=rescore)
@@ -0,0 +1,71 @@
+from langchain_core.vectorstores import VectorStore
+from typing import Callable, Protocol
+import os
+import threading
+
+
+VECTOR_STORE_BACKEND = os.environ.get("VECTOR_STORE_BACKEND", "chroma")
+
+
+class VectorStoreBackend(Protocol):
+    """
+    Provides the per-user vector stores used by `add_to_chroma`, `delete_from_chroma`, `clear_database` and `process_query`.
+
+    A store returned by `get` must support `add_documents(documents, ids=...)`, `get(ids=..., include=[])`, `delete(ids=...)`, `similarity_search_by_vector_with_relevance_scores` with its async variant, and expose its `embeddings`.
+
+    Searches return relevance scores, never raw distances: the cosine similarity of the query and the chunk, where higher is more similar and 1 is an exact match. Backends which search by distance convert it with `relevance_from_distance`. The retrieval thresholds of `process_query` and the context selection rely on it.
+    """
+
+    def get(self, user_id: str) -> VectorStore | None: ...
+
+    def clear(self, user_id: str): ...
+
+    def stats(self) -> dict: ...
+
+
+def relevance_from_distance(distance: float, space: str = "l2") -> float:
+    """
+    Converts a distance of normalized embeddings into their cosine similarity.
+
+    Parameters:
+    distance (float): The distance, as returned by Chroma: the squared euclidean distance for "l2", and 1 - similarity for "cosine" and "ip".
+    space (str): The distance metric of the collection.
+
+    Returns:
+    float: The cosine similarity.
+    """
+    if space == "l2":
+        # |a - b|^2 = 2 - 2 cos(a, b) for unit vectors
+        return 1.0 - distance / 2
+    if space in ("cosine", "ip"):
+        return 1.0 - distance
+    raise ValueError(f"Unknown distance metric {space}, expected one of l2, cosine or ip")
+
+
+_backend_factories: dict[str, Callable[[], VectorStoreBackend]] = {}
+_backends: dict[str, VectorStoreBackend] = {}
+_backends_lock = threading.Lock()
+
+
+def register_vector_store_backend(name: str, factory: Callable[[], VectorStoreBackend]):
+    """
+    Registers a vector store backend which can then be selected with `VECTOR_STORE_BACKEND`.
+
+    Parameters:
+    name (str): The name of the backend, e.g. "chroma" or "local".
+    factory (Callable): Creates the backend on first use.
+    """
+    _backend_factories[name] = factory
+
+
+def get_vector_store_backend(name: str | None = None) -> VectorStoreBackend:
+    """
+    Returns the process-wide instance of the given backend, by default the one selected by `VECTOR_STORE_BACKEND`.
+    """
+    name = name or VECTOR_STORE_BACKEND
+    with _backends_lock:
+        if name not in _backends:
+            if name not in _backend_factories:
+                raise ValueError(f"Unknown vector store backend {name}, expected one of {sorted(_backend_factories)}")
+            _backends[name] = _backend_factories[name]()
+        return _backends[name]
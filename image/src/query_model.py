@@ -1,19 +1,33 @@
+import asyncio
 import os
+import threading
 import time
 # from datetime import datetime, timezone
 import uuid
 import boto3
 from pydantic import BaseModel, Field
+from concurrent.futures import ThreadPoolExecutor
 from typing import List, Optional, Type
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
-from pdf_qa.query_handler import Source
+from pdf_qa.model_router import RoutingInfo
+from pdf_qa.sources import Source
 
 load_dotenv()
 TABLE_NAME = os.environ.get("TABLE_NAME")
 TTL_EXPIRE_MONTHS = 6
 TTL_EXPIRE_TIMESTAMP = 60 * 60 * 24 * 30 * TTL_EXPIRE_MONTHS
 GSI_INDEX_NAME = "UserIdSortedByCreatedAt"
+DYNAMODB_MAX_WORKERS = int(os.environ.get("DYNAMODB_MAX_WORKERS", 64))
+# The attributes the worker fills in when a query is answered
+ANSWER_FIELDS = ["answer_text", "sources", "routing", "is_complete"]
+# The attributes the query list shows
+LIST_PROJECTION = ["query_id", "user_id", "created_at", "ttl", "query_text", "is_complete"]
+
+# boto3 resources are not thread-safe, so every thread gets its own table handle
+_thread_local = threading.local()
+_executor = None
+_executor_lock = threading.Lock()
 
 
 class QueryModel(BaseModel):
@@ -26,15 +40,19 @@ class QueryModel(BaseModel):
     answer_text: Optional[str] = None
     sources: List[Source] = Field(default_factory=list)
     is_complete: bool = False
+    routing: Optional[RoutingInfo] = None
 
 
     @classmethod
     def get_table(cls: Type["QueryModel"]):
-        dynamodb = boto3.resource("dynamodb")
         if not TABLE_NAME:
             raise ValueError("TABLE_NAME must be set")
-        print(f"DynamoDB table name: {TABLE_NAME}")
-        return dynamodb.Table(TABLE_NAME)
+        table = getattr(_thread_local, "table", None)
+        if table is None:
+            print(f"DynamoDB table name: {TABLE_NAME}")
+            table = boto3.session.Session().resource("dynamodb").Table(TABLE_NAME)
+            _thread_local.table = table
+        return table
 
 
     def put_item(self):
@@ -50,6 +68,48 @@ class QueryModel(BaseModel):
             raise e
 
 
+    def update_answer(self):
+        """
+        Writes only the answer fields of a stored query instead of the whole item. If the query was never stored, the whole item is put instead.
+        """
+        item = self.as_ddb_item()
+        fields = [field for field in ANSWER_FIELDS if field in item]
+        try:
+            response = QueryModel.get_table().update_item(
+                Key={"query_id": self.query_id, "user_id": self.user_id},
+                UpdateExpression="SET " + ", ".join(f"#{field} = :{field}" for field in fields),
+                ConditionExpression="attribute_exists(query_id)",
+                ExpressionAttributeNames={f"#{field}": field for field in fields},
+                ExpressionAttributeValues={f":{field}": item[field] for field in fields},
+            )
+            print(response)
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            if error.get("Code") == "ConditionalCheckFailedException":
+                self.put_item()
+                return
+            message = error.get("Message", "Unknown error")
+            print("ClientError:", message)
+            raise e
+
+
+    @classmethod
+    def batch_put_items(cls: Type["QueryModel"], items: list["QueryModel"]):
+        """
+        Writes many items with batch writes of up to 25 items each. Unprocessed items are retried by the batch writer.
+        """
+        try:
+            with cls.get_table().batch_writer(overwrite_by_pkeys=["query_id", "user_id"]) as batch:
+                for item in items:
+                    batch.put_item(Item=item.as_ddb_item())
+        except ClientError as e:
+            error = e.response.get("Error", {})
+            message = error.get("Message", "Unknown error")
+            print("ClientError:", message)
+            raise e
+        print(f"Stored {len(items)} items")
+
+
     def as_ddb_item(self):
         item = {k: v for k, v in self.model_dump().items() if v is not None}
         return item
@@ -74,7 +134,15 @@ class QueryModel(BaseModel):
             return None
 
     @classmethod
-    def list_items(cls: Type["QueryModel"], user_id: str, count: int) -> list["QueryModel"]:
+    def list_items(cls: Type["QueryModel"], user_id: str, count: int, projection: list[str] | None = LIST_PROJECTION) -> list["QueryModel"]:
+        """
+        Returns the latest queries of a user. By default only the attributes of `LIST_PROJECTION` are read, so answers and sources are left empty; pass `projection=None` for whole items.
+        """
+        kwargs = {}
+        if projection:
+            # Attribute names like `ttl` are reserved words, so every name goes through a placeholder
+            kwargs["ProjectionExpression"] = ", ".join(f"#{name}" for name in projection)
+            kwargs["ExpressionAttributeNames"] = {f"#{name}": name for name in projection}
         try:
             response = cls.get_table().query(
                 IndexName=GSI_INDEX_NAME,
@@ -82,6 +150,7 @@ class QueryModel(BaseModel):
                 ExpressionAttributeValues={":user_id": user_id},
                 Limit=count,
                 ScanIndexForward=False,
+                **kwargs,
             )
         except ClientError as e:
             error = e.response.get("Error", {})
@@ -91,3 +160,32 @@ class QueryModel(BaseModel):
         
         items = response.get("Items", [])
         return [cls(**item) for item in items] # type: ignore
+
+
+    async def aput_item(self):
+        await run_in_dynamodb_executor(self.put_item)
+
+
+    async def aupdate_answer(self):
+        await run_in_dynamodb_executor(self.update_answer)
+
+
+    @classmethod
+    async def aget_item(cls: Type["QueryModel"], user_id: str, query_id: str) -> "QueryModel | None":
+        return await run_in_dynamodb_executor(cls.get_item, user_id, query_id)
+
+
+    @classmethod
+    async def alist_items(cls: Type["QueryModel"], user_id: str, count: int, projection: list[str] | None = LIST_PROJECTION) -> list["QueryModel"]:
+        return await run_in_dynamodb_executor(cls.list_items, user_id, count, projection)
+
+
+async def run_in_dynamodb_executor(func, *args):
+    """
+    Runs a blocking DynamoDB call on a dedicated thread pool of `DYNAMODB_MAX_WORKERS` threads, so async routes do not compete with sync routes for the default threadpool.
+    """
+    global _executor
+    with _executor_lock:
+        if _executor is None:
+            _executor = ThreadPoolExecutor(max_workers=DYNAMODB_MAX_WORKERS, thread_name_prefix="dynamodb")
+    return await asyncio.get_running_loop().run_in_executor(_executor, func, *args)
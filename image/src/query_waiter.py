@@ -0,0 +1,85 @@
+from dataclasses import dataclass
+from query_model import QueryModel
+import asyncio
+import os
+import time
+
+
+WAIT_DEFAULT_SECONDS = float(os.environ.get("WAIT_DEFAULT_SECONDS", 25))
+WAIT_MAX_SECONDS = float(os.environ.get("WAIT_MAX_SECONDS", 60))
+WAIT_INITIAL_DELAY_SECONDS = float(os.environ.get("WAIT_INITIAL_DELAY_SECONDS", 0.5))
+WAIT_MAX_DELAY_SECONDS = float(os.environ.get("WAIT_MAX_DELAY_SECONDS", 4))
+WAIT_BACKOFF_FACTOR = 2
+
+# Completion notifications of queries answered in this process, by (user_id, query_id)
+_waiters: dict[tuple[str, str], list[asyncio.Future]] = {}
+
+
+@dataclass
+class WaitResult:
+    query: QueryModel | None
+    reads: int
+    notified: bool
+    waited_ms: int
+
+
+def notify_complete(query: QueryModel):
+    """
+    Wakes up the requests waiting for a query which was answered in this process. Must be called on the event loop of the waiting requests.
+    """
+    for future in _waiters.pop((query.user_id, query.query_id), []):
+        if not future.done():
+            future.set_result(query)
+
+
+async def wait_for_completion(
+    user_id: str,
+    query_id: str,
+    timeout: float = WAIT_DEFAULT_SECONDS,
+    initial_delay: float = WAIT_INITIAL_DELAY_SECONDS,
+    max_delay: float = WAIT_MAX_DELAY_SECONDS,
+) -> WaitResult:
+    """
+    Waits until a query is complete or `timeout` seconds have passed.
+
+    A query answered by the background worker pool of this process completes the wait as soon as it is stored, without another read. A query answered by the worker Lambda is read again after exponentially growing delays, from `initial_delay` up to `max_delay` seconds.
+
+    Parameters:
+    user_id (str): The user of the query.
+    query_id (str): The query id.
+    timeout (float): The maximum number of seconds to wait.
+    initial_delay (float): The delay before the second read.
+    max_delay (float): The maximum delay between reads.
+
+    Returns:
+    WaitResult: The latest state of the query, or `None` if it does not exist, with the number of DynamoDB reads it took.
+    """
+    start = time.perf_counter()
+    deadline = start + timeout
+    key = (user_id, query_id)
+    future = asyncio.get_running_loop().create_future()
+    _waiters.setdefault(key, []).append(future)
+    reads = 0
+    delay = initial_delay
+    try:
+        while True:
+            query = await QueryModel.aget_item(user_id, query_id)
+            reads += 1
+            remaining = deadline - time.perf_counter()
+            if query is None or query.is_complete or remaining <= 0:
+                return WaitResult(query, reads, False, elapsed_ms(start))
+
+            done, _ = await asyncio.wait({future}, timeout=min(delay, remaining))
+            if done:
+                return WaitResult(future.result(), reads, True, elapsed_ms(start))
+            delay = min(delay * WAIT_BACKOFF_FACTOR, max_delay)
+    finally:
+        futures = _waiters.get(key, [])
+        if future in futures:
+            futures.remove(future)
+        if not futures:
+            _waiters.pop(key, None)
+
+
+def elapsed_ms(start: float) -> int:
+    return int((time.perf_counter() - start) * 1000)
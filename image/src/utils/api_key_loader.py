@@ -1,55 +1,194 @@
 import os
+import threading
+import time
 import boto3
 from botocore.exceptions import ClientError
 from dotenv import load_dotenv
 
 load_dotenv(override=False)
+SECRET_CACHE_TTL_SECONDS = float(os.getenv("SECRET_CACHE_TTL_SECONDS", 900))
+SECRET_REFRESH_AHEAD_SECONDS = float(os.getenv("SECRET_REFRESH_AHEAD_SECONDS", 60))
+SECRET_RETRY_SECONDS = float(os.getenv("SECRET_RETRY_SECONDS", 30))
+# SSM GetParameters accepts at most 10 names per call
+SSM_GET_PARAMETERS_LIMIT = 10
 
-def get_google_api_key():
+# Maps the name of each secret to the environment variable holding its SSM parameter name
+SECRET_PARAM_ENV_VARS = {
+    "GOOGLE_API_KEY": "GOOGLE_API_KEY_PARAM",
+    "CHROMA_API_KEY": "CHROMA_API_KEY_PARAM",
+}
+
+
+class SecretCache:
     """
-    Returns Google API Key depending on the os environment.
+    In-memory cache of SSM secrets.
 
-    Return:
-    str: The value of Google API Key
+    All secrets are fetched together with a single batched `get_parameters` call and served from memory until `ttl_seconds` have passed. Once a cached value is within `refresh_ahead_seconds` of expiring, it is refreshed in a background thread while the current value keeps being served, so lookups on the hot path never wait for SSM. A failed fetch keeps the last good values and is not retried for `retry_seconds`, so a throttled or unavailable SSM is not called on every lookup.
+
+    Parameters:
+    param_env_vars (dict[str, str]): Maps each secret name to the environment variable holding its SSM parameter name.
+    ttl_seconds (float): How long fetched values are served from memory.
+    refresh_ahead_seconds (float): How long before expiry a background refresh is started.
+    retry_seconds (float): How long to wait after a failed fetch before calling SSM again.
     """
-    print(f"Google API Key Param: {os.getenv('GOOGLE_API_KEY_PARAM')}")
 
-    if 'AWS_EXECUTION_ENV' in os.environ:
-        try:
-            ssm = boto3.client('ssm')
-            api_key_param = os.getenv("GOOGLE_API_KEY_PARAM")
-            response = ssm.get_parameter(
-                Name=api_key_param,
-                WithDecryption=True
+    def __init__(
+        self,
+        param_env_vars: dict[str, str] = SECRET_PARAM_ENV_VARS,
+        ttl_seconds: float = SECRET_CACHE_TTL_SECONDS,
+        refresh_ahead_seconds: float = SECRET_REFRESH_AHEAD_SECONDS,
+        retry_seconds: float = SECRET_RETRY_SECONDS,
+        ssm_client_factory=lambda: boto3.client('ssm'),
+        clock=time.monotonic,
+    ):
+        self.param_env_vars = param_env_vars
+        self.ttl_seconds = ttl_seconds
+        self.refresh_ahead_seconds = refresh_ahead_seconds
+        self.retry_seconds = retry_seconds
+        self.ssm_client_factory = ssm_client_factory
+        self.clock = clock
+        self._ssm = None
+        self._values: dict[str, str] = {}
+        self._expires_at = 0.0
+        self._retry_at = 0.0
+        self._refreshing = False
+        self._lock = threading.Lock()
+        self._refresh_lock = threading.Lock()
+        self.fetch_count = 0
+
+
+    def get(self, name: str) -> str | None:
+        """
+        Returns the value of the given secret.
+
+        Parameters:
+        name (str): The name of the secret, e.g. "GOOGLE_API_KEY".
+
+        Returns:
+        str | None: The value of the secret, or None if it could not be fetched.
+        """
+        now = self.clock()
+        with self._lock:
+            has_values = bool(self._values)
+            expires_at = self._expires_at
+            start_background_refresh = (
+                has_values
+                and now < expires_at
+                and expires_at - now <= self.refresh_ahead_seconds
+                and now >= self._retry_at
+                and not self._refreshing
             )
-            return response['Parameter']['Value']
+            if start_background_refresh:
+                self._refreshing = True
+
+        if start_background_refresh:
+            threading.Thread(target=self._background_refresh, daemon=True).start()
+        elif now >= expires_at:
+            self._refresh_if_stale()
+
+        with self._lock:
+            return self._values.get(name)
+
+
+    def refresh(self):
+        """
+        Fetches every secret with batched `get_parameters` calls and stores them in memory. If the fetch fails or returns none of the secrets, previously cached values are kept and served for another `retry_seconds`.
+        """
+        names_by_param = {}
+        for name, env_var in self.param_env_vars.items():
+            param = os.getenv(env_var)
+            if param:
+                names_by_param[param] = name
+
+        params = list(names_by_param)
+        values = {}
+        try:
+            if self._ssm is None:
+                self._ssm = self.ssm_client_factory()
+            for i in range(0, len(params), SSM_GET_PARAMETERS_LIMIT):
+                response = self._ssm.get_parameters(
+                    Names=params[i:i + SSM_GET_PARAMETERS_LIMIT],
+                    WithDecryption=True
+                )
+                self.fetch_count += 1
+                for parameter in response.get("Parameters", []):
+                    values[names_by_param[parameter["Name"]]] = parameter["Value"]
+                for invalid_param in response.get("InvalidParameters", []):
+                    print(f"SSM parameter not found: {invalid_param}")
         except ClientError as e:
             print(f"SSM error: {e}")
-            return None
+            self._back_off()
+            return
+        if params and not values:
+            self._back_off()
+            return
 
-    return os.getenv("GOOGLE_API_KEY")
+        with self._lock:
+            # A secret missing from this fetch keeps its last good value
+            self._values = {**self._values, **values}
+            self._expires_at = self.clock() + self.ttl_seconds
+            self._retry_at = 0.0
 
 
-def get_chroma_api_key():
+    def clear(self):
+        """
+        Drops every cached value, so the next lookup fetches from SSM again.
+        """
+        with self._lock:
+            self._values = {}
+            self._expires_at = 0.0
+            self._retry_at = 0.0
+
+
+    def _refresh_if_stale(self):
+        # Concurrent cold lookups wait for a single fetch instead of each calling SSM
+        with self._refresh_lock:
+            with self._lock:
+                is_fresh = self.clock() < self._expires_at
+            if not is_fresh:
+                self.refresh()
+
+
+    def _back_off(self):
+        with self._lock:
+            now = self.clock()
+            self._retry_at = now + self.retry_seconds
+            self._expires_at = max(self._expires_at, self._retry_at)
+
+
+    def _background_refresh(self):
+        try:
+            with self._refresh_lock:
+                self.refresh()
+        finally:
+            with self._lock:
+                self._refreshing = False
+
+
+secret_cache = SecretCache()
+
+
+def get_google_api_key():
     """
     Returns Google API Key depending on the os environment.
 
     Return:
     str: The value of Google API Key
     """
-    print(f"Chroma API Key Param: {os.getenv('CHROMA_API_KEY_PARAM')}")
+    if 'AWS_EXECUTION_ENV' in os.environ:
+        return secret_cache.get("GOOGLE_API_KEY")
 
+    return os.getenv("GOOGLE_API_KEY")
+
+
+def get_chroma_api_key():
+    """
+    Returns Chroma API Key depending on the os environment.
+
+    Return:
+    str: The value of Chroma API Key
+    """
     if 'AWS_EXECUTION_ENV' in os.environ:
-        try:
-            ssm = boto3.client('ssm')
-            api_key_param = os.getenv("CHROMA_API_KEY_PARAM")
-            response = ssm.get_parameter(
-                Name=api_key_param,
-                WithDecryption=True
-            )
-            return response['Parameter']['Value']
-        except ClientError as e:
-            print(f"SSM error: {e}")
-            return None
+        return secret_cache.get("CHROMA_API_KEY")
 
     return os.getenv("CHROMA_API_KEY")
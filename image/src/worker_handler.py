@@ -1,23 +1,216 @@
-from query_model import QueryModel
-from pdf_qa.query_handler import process_query
+from query_model import QueryModel, run_in_dynamodb_executor
+from pdf_qa.query_handler import QueryResponse, aprocess_query, process_query
+from query_waiter import notify_complete
+from ingestion_job import INGESTION_JOB_TYPE, IngestionJobModel, run_ingestion_job
+from botocore.exceptions import ClientError
+import asyncio
+import json
+import os
+import time
+
+
+WORKER_BATCH_CONCURRENCY = int(os.environ.get("WORKER_BATCH_CONCURRENCY", 8))
+# The maxReceiveCount of the worker queue, after which a failed query is moved to its dead-letter queue
+WORKER_MAX_RECEIVE_COUNT = int(os.environ.get("WORKER_MAX_RECEIVE_COUNT", 3))
+NO_RESULTS_ANSWER = "No matching results. Please make sure you have uploaded some PDFs related to your question."
+FAILED_ANSWER = "Sorry, your question could not be answered. Please try again later."
+
+# Shared clients may bind to the event loop they were first used on, so every invocation reuses one loop
+_loop = None
 
 
 def handler(event, context):
-    query_item = QueryModel(**event)
-    invoke_rag(query_item)
+    """
+    Answers queries sent by the API. The event is either one query, a list of queries or an SQS event whose `Records` each carry a query as their body. An event with `job_type` "ingestion" is an ingestion job instead, as are the records of the ingestion queue.
+
+    Returns:
+    dict | None: For batches, the identifiers of the queries which failed in the format of SQS partial batch responses: the message id for SQS records, the query id for lists. Completed queries are not reported.
+    """
+    if isinstance(event, dict) and event.get("job_type") == INGESTION_JOB_TYPE:
+        run_ingestion_job(IngestionJobModel(**event))
+        return None
+    if isinstance(event, dict) and "Records" not in event:
+        query_item = QueryModel(**event)
+        invoke_rag(query_item)
+        return None
+    if isinstance(event, dict) and is_ingestion_batch(event):
+        return run_ingestion_batch(event)
+    return run(process_batch(parse_batch(event), last_attempts=get_last_attempts(event)))
 
 
 def invoke_rag(query_item: QueryModel):
     response = process_query(query=query_item.query_text, user_id=query_item.user_id)
+    complete_query(query_item, response)
+    query_item.update_answer()
+    print(f"Item is updated: {query_item}")
+    return query_item
+
+
+async def ainvoke_rag(query_item: QueryModel):
+    response = await aprocess_query(query=query_item.query_text, user_id=query_item.user_id)
+    complete_query(query_item, response)
+    await query_item.aupdate_answer()
+    notify_complete(query_item)
+    print(f"Item is updated: {query_item}")
+    return query_item
+
+
+async def afail_query(query_item: QueryModel, error: Exception):
+    """
+    Completes a query whose answer failed with an error answer, so pollers and waiting requests stop waiting for it.
+    """
+    fail_query(query_item)
+    try:
+        await query_item.aupdate_answer()
+    finally:
+        notify_complete(query_item)
+    print(f"Item is marked as failed: {query_item} ({error})")
+
+
+def fail_query(query_item: QueryModel):
+    query_item.answer_text = FAILED_ANSWER
+    query_item.is_complete = True
+
+
+def complete_query(query_item: QueryModel, response: QueryResponse | None):
     if not response:
-        query_item.answer_text = "No matching results. Please make sure you have uploaded some PDFs related to your question."
+        query_item.answer_text = NO_RESULTS_ANSWER
     else:
         query_item.answer_text = response.response_text
         query_item.sources = response.sources
+        query_item.routing = response.routing
     query_item.is_complete = True
-    query_item.put_item()
-    print(f"Item is updated: {query_item}")
-    return query_item
+
+
+def is_ingestion_batch(event: dict) -> bool:
+    records = event["Records"]
+    return bool(records) and all(parse_body(record.get("body")).get("job_type") == INGESTION_JOB_TYPE for record in records)
+
+
+def parse_body(body) -> dict:
+    try:
+        payload = json.loads(body) if isinstance(body, str) else body
+    except ValueError:
+        return {}
+    return payload if isinstance(payload, dict) else {}
+
+
+def run_ingestion_batch(event: dict) -> dict:
+    """
+    Runs the ingestion jobs of the FIFO ingestion queue in order. A job which fails to ingest is stored as failed by `run_ingestion_job`; only a job whose status could not be stored is reported for retry, together with every later job, which must not overtake it.
+
+    Returns:
+    dict: The message ids of the jobs to retry as `batchItemFailures`.
+    """
+    failed = []
+    for record in event["Records"]:
+        identifier = record.get("messageId")
+        if failed:
+            failed.append(identifier)
+            continue
+        try:
+            job = IngestionJobModel(**parse_body(record.get("body")))
+        except Exception as e:
+            print(f"Dropping invalid ingestion job {identifier}: {e}")
+            continue
+        try:
+            run_ingestion_job(job)
+        except ClientError as e:
+            print(f"Failed to store ingestion job {job.job_id}: {e}")
+            failed.append(identifier)
+    return {"batchItemFailures": [{"itemIdentifier": identifier} for identifier in failed]}
+
+
+def get_last_attempts(event: dict | list) -> set[str]:
+    """
+    Returns the message ids of the SQS records received for the last time, which are dead-lettered instead of retried if they fail again.
+    """
+    if not isinstance(event, dict):
+        return set()
+    return {
+        record.get("messageId")
+        for record in event["Records"]
+        if int(record.get("attributes", {}).get("ApproximateReceiveCount", 1)) >= WORKER_MAX_RECEIVE_COUNT
+    }
+
+
+def parse_batch(event: dict | list) -> list[tuple[str, QueryModel]]:
+    """
+    Returns every query of a batch with its identifier. A query which can't be parsed is logged and dropped: retrying it would fail the same way, so it is not reported as failed.
+    """
+    if isinstance(event, dict):
+        entries = [(record.get("messageId", str(i)), record.get("body")) for i, record in enumerate(event["Records"])]
+    else:
+        entries = [(entry.get("query_id", str(i)) if isinstance(entry, dict) else str(i), entry) for i, entry in enumerate(event)]
+
+    batch = []
+    for identifier, payload in entries:
+        try:
+            if isinstance(payload, str):
+                payload = json.loads(payload)
+            batch.append((identifier, QueryModel(**payload)))
+        except Exception as e:
+            print(f"Dropping invalid query {identifier}: {e}")
+    return batch
+
+
+async def process_batch(
+    batch: list[tuple[str, QueryModel]],
+    concurrency: int = WORKER_BATCH_CONCURRENCY,
+    last_attempts: set[str] | None = None,
+) -> dict:
+    """
+    Answers the queries of a batch concurrently, at most `concurrency` at a time, and writes the completed queries back in one batch write. A query which fails on its last attempt is completed with an error answer instead of being retried, so clients stop waiting for it.
+
+    Parameters:
+    batch (list[tuple[str, QueryModel]]): The queries with their identifiers, see `parse_batch`.
+    concurrency (int): The maximum number of queries answered at the same time.
+    last_attempts (set[str] | None): The identifiers of the queries which are not retried if they fail, see `get_last_attempts`.
+
+    Returns:
+    dict: The identifiers of the failed queries as `batchItemFailures`.
+    """
+    start = time.perf_counter()
+    semaphore = asyncio.Semaphore(concurrency)
+
+    async def answer(query_item: QueryModel) -> QueryModel:
+        async with semaphore:
+            response = await aprocess_query(query=query_item.query_text, user_id=query_item.user_id)
+        complete_query(query_item, response)
+        return query_item
+
+    results = await asyncio.gather(*(answer(query_item) for _, query_item in batch), return_exceptions=True)
+
+    last_attempts = last_attempts or set()
+    completed, failed = [], []
+    for (identifier, query_item), result in zip(batch, results):
+        if isinstance(result, BaseException):
+            print(f"Failed to answer query {query_item.query_id}: {result}")
+            if identifier in last_attempts:
+                fail_query(query_item)
+                completed.append((identifier, query_item))
+            else:
+                failed.append(identifier)
+        else:
+            completed.append((identifier, result))
+
+    if completed:
+        try:
+            await run_in_dynamodb_executor(QueryModel.batch_put_items, [query_item for _, query_item in completed])
+        except ClientError as e:
+            print(f"Failed to store {len(completed)} answered queries: {e}")
+            failed.extend(identifier for identifier, _ in completed)
+
+    elapsed = time.perf_counter() - start
+    print(f"Processed {len(batch)} queries in {elapsed:.2f}s ({len(batch) / max(elapsed, 1e-9):.1f} queries/s), {len(failed)} failed")
+    return {"batchItemFailures": [{"itemIdentifier": identifier} for identifier in failed]}
+
+
+def run(coroutine):
+    global _loop
+    if _loop is None or _loop.is_closed():
+        _loop = asyncio.new_event_loop()
+    return _loop.run_until_complete(coroutine)
 
 
 # ===== FOR LOCAL TESTING =====
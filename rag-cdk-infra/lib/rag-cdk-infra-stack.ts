@@ -3,7 +3,9 @@ import { AttributeType, BillingMode, Table } from 'aws-cdk-lib/aws-dynamodb';
 import * as lambda from 'aws-cdk-lib/aws-lambda';
 import * as ec2 from 'aws-cdk-lib/aws-ec2';
 import { DockerImageCode, DockerImageFunction, FunctionUrlAuthType } from 'aws-cdk-lib/aws-lambda';
+import { SqsEventSource } from 'aws-cdk-lib/aws-lambda-event-sources';
 import { BlockPublicAccess, Bucket } from 'aws-cdk-lib/aws-s3';
+import { Queue } from 'aws-cdk-lib/aws-sqs';
 import { StringParameter } from 'aws-cdk-lib/aws-ssm';
 import { Construct } from 'constructs';
 import { FileSystem } from 'aws-cdk-lib/aws-efs';
@@ -72,6 +74,14 @@ export class RagCdkInfraStack extends cdk.Stack {
 			sortKey: { name: "created_at", type: AttributeType.NUMBER },
 		});
 
+		// Create DynamoDB table to store the catalog of every user's ingested documents
+		const documentCatalogTable = new Table(this, "DocumentCatalogTable", {
+			partitionKey: { name: "user_id", type: AttributeType.STRING },
+			sortKey: { name: "filename", type: AttributeType.STRING },
+			billingMode: BillingMode.PAY_PER_REQUEST,
+			removalPolicy: cdk.RemovalPolicy.DESTROY,
+		});
+
 		// Create Lambda function to handle the worker logic using Docker
 		const workerImageCode = DockerImageCode.fromImageAsset("../image", {
 			cmd: ["worker_handler.handler"]
@@ -92,10 +102,57 @@ export class RagCdkInfraStack extends cdk.Stack {
 			environment: {
 				BUCKET_NAME: userDocumentBucket.bucketName,
 				TABLE_NAME: ragQueryTable.tableName,
+				DOCUMENT_TABLE_NAME: documentCatalogTable.tableName,
+				// Every instance must see the corpus version bumps of the others
+				QUERY_CACHE_BACKEND: 'dynamodb',
 				// CHROMA_DB_PATH: '/mnt/chroma',
 			},
 		});
 
+		// Create SQS queue to hand queries to the worker in batches. Messages which keep failing are moved to a
+		// dead-letter queue instead of being retried until they expire.
+		const workerDeadLetterQueue = new Queue(this, 'WorkerDeadLetterQueue', {
+			retentionPeriod: cdk.Duration.days(14),
+			removalPolicy: cdk.RemovalPolicy.DESTROY,
+		});
+		const workerMaxReceiveCount = 3;
+		const workerQueue = new Queue(this, 'WorkerQueue', {
+			visibilityTimeout: cdk.Duration.seconds(6 * 180),
+			removalPolicy: cdk.RemovalPolicy.DESTROY,
+			deadLetterQueue: {
+				queue: workerDeadLetterQueue,
+				maxReceiveCount: workerMaxReceiveCount,
+			},
+		});
+		// The worker completes a query as failed on its last attempt, so clients don't wait for a dead-lettered query
+		workerFunction.addEnvironment('WORKER_MAX_RECEIVE_COUNT', String(workerMaxReceiveCount));
+		workerFunction.addEventSource(new SqsEventSource(workerQueue, {
+			batchSize: 10,
+			maxBatchingWindow: cdk.Duration.seconds(1),
+			reportBatchItemFailures: true,
+		}));
+
+		// Create FIFO queue for ingestion jobs. Jobs are grouped by user, so the jobs of one user run one at a time and
+		// in order, as they read and write the same manifest and vector store; different users still run in parallel.
+		const ingestionDeadLetterQueue = new Queue(this, 'IngestionDeadLetterQueue', {
+			fifo: true,
+			retentionPeriod: cdk.Duration.days(14),
+			removalPolicy: cdk.RemovalPolicy.DESTROY,
+		});
+		const ingestionQueue = new Queue(this, 'IngestionQueue', {
+			fifo: true,
+			visibilityTimeout: cdk.Duration.seconds(6 * 180),
+			removalPolicy: cdk.RemovalPolicy.DESTROY,
+			deadLetterQueue: {
+				queue: ingestionDeadLetterQueue,
+				maxReceiveCount: 3,
+			},
+		});
+		workerFunction.addEventSource(new SqsEventSource(ingestionQueue, {
+			batchSize: 1,
+			reportBatchItemFailures: true,
+		}));
+
 		// Lambda function to handle the API requests
 		const apiImageCode = DockerImageCode.fromImageAsset("../image", {
 			cmd: ["api_handler.handler"]
@@ -116,7 +173,12 @@ export class RagCdkInfraStack extends cdk.Stack {
 			environment: {
 				BUCKET_NAME: userDocumentBucket.bucketName,
 				TABLE_NAME: ragQueryTable.tableName,
+				DOCUMENT_TABLE_NAME: documentCatalogTable.tableName,
+				// Every instance must see the corpus version bumps of the others
+				QUERY_CACHE_BACKEND: 'dynamodb',
 				WORKER_LAMBDA_NAME: workerFunction.functionName,
+				WORKER_QUEUE_URL: workerQueue.queueUrl,
+				INGESTION_QUEUE_URL: ingestionQueue.queueUrl,
 				// CHROMA_DB_PATH: '/mnt/chroma',
 			},
 		});
@@ -139,11 +201,15 @@ export class RagCdkInfraStack extends cdk.Stack {
 		userDocumentBucket.grantReadWrite(apiFunction);
 		ragQueryTable.grantReadWriteData(workerFunction);
 		ragQueryTable.grantReadWriteData(apiFunction);
+		documentCatalogTable.grantReadWriteData(workerFunction);
+		documentCatalogTable.grantReadWriteData(apiFunction);
 		googleApiKeyParam.grantRead(workerFunction);
 		googleApiKeyParam.grantRead(apiFunction);
 		chromaApiKeyParam.grantRead(workerFunction);
 		chromaApiKeyParam.grantRead(apiFunction);
 		workerFunction.grantInvoke(apiFunction);
+		workerQueue.grantSendMessages(apiFunction);
+		ingestionQueue.grantSendMessages(apiFunction);
 
 		// Set HTTPS Url
 		const functionUrl = apiFunction.addFunctionUrl({
@@ -160,6 +226,15 @@ export class RagCdkInfraStack extends cdk.Stack {
 		new cdk.CfnOutput(this, "RagQueryTableName", {
 			value: ragQueryTable.tableName,
 		});
+		new cdk.CfnOutput(this, "DocumentCatalogTableName", {
+			value: documentCatalogTable.tableName,
+		});
+		new cdk.CfnOutput(this, "WorkerDeadLetterQueueUrl", {
+			value: workerDeadLetterQueue.queueUrl,
+		});
+		new cdk.CfnOutput(this, "IngestionDeadLetterQueueUrl", {
+			value: ingestionDeadLetterQueue.queueUrl,
+		});
 		// new cdk.CfnOutput(this, "ChromaFileSystemId", {
 		// 	value: chromaFileSystem.fileSystemId,
 		// });
@@ -0,0 +1,80 @@
+from pdf_qa.ivf_index import normalize_rows
+from pdf_qa.local_vector_store import LocalVectorStore
+import argparse
+import tempfile
+import time
+import numpy as np
+
+
+class MatrixEmbeddings:
+    """
+    Offline stand-in for the embedding API: the text of a chunk is the row of its vector in a synthetic matrix.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.vectors[[int(text) for text in texts]]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.vectors[int(text)]
+
+
+def make_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    # Clustered data resembles real embeddings better than uniform noise, where every ANN index does badly
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dimension)).astype(np.float32)
+    return normalize_rows(vectors)
+
+
+def run_queries(store: LocalVectorStore, queries: np.ndarray, k: int) -> tuple[list[set[str]], np.ndarray]:
+    results = []
+    latencies = []
+    for query in queries:
+        start = time.perf_counter()
+        docs = store.similarity_search_by_vector_with_relevance_scores(query, k)
+        latencies.append(time.perf_counter() - start)
+        results.append({doc.id for doc, _ in docs})
+    return results, np.array(latencies) * 1000
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark recall@k and query latency of the IVF index of the local vector store against brute force.")
+    parser.add_argument("--vectors", type=int, default=200000, help="Number of stored vectors.")
+    parser.add_argument("--dimension", type=int, default=768, help="Vector dimension.")
+    parser.add_argument("--clusters", type=int, default=500, help="Number of synthetic topics.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--k", type=int, default=5, help="Number of results per query.")
+    parser.add_argument("--nprobe", type=int, nargs="+", default=[1, 4, 8, 16, 32, 64], help="nprobe values to compare.")
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.vectors + args.queries, args.dimension, args.clusters)
+    queries = vectors[args.vectors:]
+    embeddings = MatrixEmbeddings(vectors)
+
+    with tempfile.TemporaryDirectory() as path:
+        store = LocalVectorStore(path, embeddings, ann_min_vectors=args.vectors)
+        start = time.perf_counter()
+        batch_size = 10000
+        for batch_start in range(0, args.vectors, batch_size):
+            rows = [str(i) for i in range(batch_start, min(batch_start + batch_size, args.vectors))]
+            store.add_texts(rows, ids=rows)
+        print(f"Stored {args.vectors} x {args.dimension} vectors and trained {store.index.nlist} lists in {time.perf_counter() - start:.1f}s")
+
+        index = store.index
+        store.index = None
+        exact, latencies = run_queries(store, queries, args.k)
+        print(f"brute force: recall@{args.k}=1.000, p50={np.percentile(latencies, 50):7.2f} ms, p99={np.percentile(latencies, 99):7.2f} ms")
+
+        store.index = index
+        for nprobe in args.nprobe:
+            store.nprobe = nprobe
+            results, latencies = run_queries(store, queries, args.k)
+            recall = np.mean([len(result & truth) / args.k for result, truth in zip(results, exact)])
+            print(f"nprobe={nprobe:3d}: recall@{args.k}={recall:.3f}, p50={np.percentile(latencies, 50):7.2f} ms, p99={np.percentile(latencies, 99):7.2f} ms")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,110 @@
+from pathlib import Path
+import argparse
+import json
+import os
+import statistics
+import subprocess
+import sys
+
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "image" / "src"
+# Packages of the RAG pipeline which only the query, stream and upload routes need
+HEAVY_MODULES = ("chromadb", "langchain_chroma", "langchain_community", "langchain_core", "langchain_google_genai", "langchain_text_splitters", "pypdf")
+ROUTES = {
+    "GET /": ("GET", "/"),
+    "GET /users/{user_id}/queries": ("GET", "/users/user/queries"),
+    "GET /users/{user_id}/queries/{query_id}": ("GET", "/users/user/queries/query"),
+    "GET /users/{user_id}/documents": ("GET", "/users/user/documents"),
+}
+
+# Runs in a fresh interpreter, like a Lambda cold start. DynamoDB calls are stubbed out, so only imports and the route itself are timed.
+ROUTE_PROBE = """
+import json, sys, time
+start = time.perf_counter()
+import api_handler
+import_ms = (time.perf_counter() - start) * 1000
+from fastapi.testclient import TestClient
+from query_model import QueryModel
+
+async def list_items(user_id, count):
+    return []
+
+async def get_item(user_id, query_id):
+    return None
+
+QueryModel.alist_items = list_items
+QueryModel.aget_item = get_item
+client = TestClient(api_handler.app)
+start = time.perf_counter()
+client.request(sys.argv[1], sys.argv[2])
+request_ms = (time.perf_counter() - start) * 1000
+heavy = sorted({name.split(".")[0] for name in sys.modules} & set(sys.argv[3].split(",")))
+start = time.perf_counter()
+import pdf_qa.query_handler
+pipeline_ms = (time.perf_counter() - start) * 1000
+print(json.dumps({"import_ms": import_ms, "request_ms": request_ms, "pipeline_ms": pipeline_ms, "heavy": heavy}))
+"""
+
+
+def run_python(*args: str) -> subprocess.CompletedProcess:
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+    return subprocess.run([sys.executable, *args], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+
+
+def measure_import_times(module: str) -> list[tuple[str, int, int]]:
+    """
+    Returns `(module, depth, cumulative microseconds)` for every module imported by `module` in a fresh interpreter, from `python -X importtime`.
+    """
+    result = run_python("-X", "importtime", "-c", f"import {module}")
+    timings = []
+    for line in result.stderr.splitlines():
+        if not line.startswith("import time:") or "cumulative" in line:
+            continue
+        _, cumulative, name = line[len("import time:"):].split("|")
+        depth = (len(name) - len(name.lstrip())) // 2
+        timings.append((name.strip(), depth, int(cumulative)))
+    return timings
+
+
+def measure_route(method: str, path: str) -> dict:
+    result = run_python("-c", ROUTE_PROBE, method, path, ",".join(HEAVY_MODULES))
+    return json.loads(result.stdout.strip().splitlines()[-1])
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure the import time of the API handler per module and the cold-start latency per route, and fail if they regress.")
+    parser.add_argument("--module", default="api_handler", help="Module whose imports are measured.")
+    parser.add_argument("--top", type=int, default=10, help="Number of direct imports to list.")
+    parser.add_argument("--runs", type=int, default=3, help="Fresh interpreters per measurement.")
+    parser.add_argument("--max-import-ms", type=float, default=1000, help="Fail if the median import time of the module exceeds this.")
+    args = parser.parse_args()
+
+    runs = [measure_import_times(args.module) for _ in range(args.runs)]
+    totals = [next(us for name, depth, us in timings if name == args.module) / 1000 for timings in runs]
+    direct = sorted(((us, name) for name, depth, us in runs[-1] if depth == 1), reverse=True)
+    print(f"import {args.module}: median {statistics.median(totals):.0f} ms over {args.runs} runs")
+    for us, name in direct[:args.top]:
+        print(f"  {name:<40} {us / 1000:8.1f} ms")
+
+    failures = []
+    if statistics.median(totals) > args.max_import_ms:
+        failures.append(f"importing {args.module} takes {statistics.median(totals):.0f} ms, more than {args.max_import_ms:.0f} ms")
+
+    print("\ncold start per route (import + first request)")
+    for route, (method, path) in ROUTES.items():
+        samples = [measure_route(method, path) for _ in range(args.runs)]
+        import_ms = statistics.median(sample["import_ms"] for sample in samples)
+        request_ms = statistics.median(sample["request_ms"] for sample in samples)
+        print(f"  {route:<40} {import_ms + request_ms:8.1f} ms (first request {request_ms:6.1f} ms)")
+        if samples[-1]["heavy"]:
+            failures.append(f"{route} imports {', '.join(samples[-1]['heavy'])}")
+    pipeline_ms = statistics.median(sample["pipeline_ms"] for sample in samples)
+    print(f"  {'first query, upload or stream adds':<40} {pipeline_ms:8.1f} ms to import the RAG pipeline")
+
+    if failures:
+        print("\nRegression:\n  " + "\n  ".join(failures))
+        sys.exit(1)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,67 @@
+from pdf_qa.embedding_service import BatchedEmbeddings
+from langchain_core.embeddings import Embeddings
+import argparse
+import threading
+import time
+
+
+class SimulatedEmbeddings(Embeddings):
+    """
+    Offline stand-in for the embedding API: every request takes `latency` seconds, and requests beyond `requests_per_second` within a second are rejected with a 429 like the real quota.
+    """
+
+    def __init__(self, latency: float, requests_per_second: float, dimensions: int = 768):
+        self.latency = latency
+        self.requests_per_second = requests_per_second
+        self.dimensions = dimensions
+        self.rejected = 0
+        self._window_start = time.monotonic()
+        self._window_requests = 0
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        with self._lock:
+            now = time.monotonic()
+            if now - self._window_start >= 1:
+                self._window_start = now
+                self._window_requests = 0
+            self._window_requests += 1
+            if self._window_requests > self.requests_per_second:
+                self.rejected += 1
+                raise RuntimeError("429 Resource has been exhausted (e.g. check quota).")
+        time.sleep(self.latency)
+        return [[float(len(text))] * self.dimensions for text in texts]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.embed_documents([text])[0]
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Benchmark the batched embedding scheduler against a simulated embedding API.")
+    parser.add_argument("--chunks", type=int, default=2000, help="Number of chunks to embed.")
+    parser.add_argument("--latency", type=float, default=0.2, help="Simulated seconds per request.")
+    parser.add_argument("--quota", type=float, default=20, help="Simulated requests per second before 429s.")
+    parser.add_argument("--batch-size", type=int, default=32, help="Texts per request.")
+    args = parser.parse_args()
+
+    texts = [f"chunk {i} " + "lorem ipsum " * 80 for i in range(args.chunks)]
+    for concurrency in (1, 2, 4, 8, 16):
+        simulated = SimulatedEmbeddings(args.latency, args.quota)
+        embeddings = BatchedEmbeddings(
+            simulated,
+            batch_size=args.batch_size,
+            max_concurrency=concurrency,
+            requests_per_minute=0,
+            retry_base_seconds=0.05,
+        )
+        embeddings.embed_documents(texts)
+        metrics = embeddings.metrics()
+        print(
+            f"concurrency={concurrency:2d}: {metrics['chunks_per_second']:8.1f} chunks/s, "
+            f"{metrics['requests']} requests, {metrics['rate_limited']} rate limited, "
+            f"final limit {metrics['concurrency_limit']:.1f}"
+        )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,52 @@
+from pdf_qa.pdf_extraction import extract_pdf_documents
+from fpdf import FPDF
+import argparse
+import os
+import tempfile
+import time
+
+
+PARAGRAPH = "The quick brown fox jumps over the lazy dog while the committee reviews the annual report. " * 12
+
+
+def generate_pdfs(directory: str, file_count: int, pages_per_file: int) -> list[str]:
+    paths = []
+    for i in range(file_count):
+        pdf = FPDF()
+        pdf.set_font("Arial", size=10)
+        for page in range(pages_per_file):
+            pdf.add_page()
+            pdf.write(5, f"File {i} page {page}. " + PARAGRAPH * 2)
+        path = os.path.join(directory, f"file_{i}.pdf")
+        pdf.output(path)
+        paths.append(path)
+    return paths
+
+
+def measure(paths: list[str], workers: int, pages_per_task: int) -> tuple[int, float]:
+    start = time.perf_counter()
+    documents = extract_pdf_documents(paths, max_workers=workers, pages_per_task=pages_per_task)
+    return len(documents), time.perf_counter() - start
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare serial and parallel PDF extraction throughput.")
+    parser.add_argument("--files", type=int, default=8, help="Number of generated PDFs.")
+    parser.add_argument("--pages", type=int, default=60, help="Pages per generated PDF.")
+    parser.add_argument("--workers", type=int, default=os.cpu_count() or 1, help="Worker processes for the parallel run.")
+    parser.add_argument("--pages-per-task", type=int, default=32, help="Maximum pages per extraction task.")
+    args = parser.parse_args()
+
+    with tempfile.TemporaryDirectory() as directory:
+        paths = generate_pdfs(directory, args.files, args.pages)
+
+        pages, serial_seconds = measure(paths, 1, args.pages_per_task)
+        print(f"serial:   {pages} pages in {serial_seconds:.2f}s ({pages / serial_seconds:.1f} pages/s)")
+
+        pages, parallel_seconds = measure(paths, args.workers, args.pages_per_task)
+        print(f"parallel: {pages} pages in {parallel_seconds:.2f}s ({pages / parallel_seconds:.1f} pages/s) with {args.workers} workers")
+        print(f"speedup:  {serial_seconds / parallel_seconds:.2f}x")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,96 @@
+from pdf_qa.ivf_index import normalize_rows
+from pdf_qa.local_vector_store import VECTORS_FILENAME, LocalVectorStore
+from pdf_qa.vector_codec import VectorCodec
+import argparse
+import os
+import tempfile
+import time
+import numpy as np
+
+
+class MatrixEmbeddings:
+    """
+    Offline stand-in for the embedding API: the text of a chunk is the row of its vector in a synthetic matrix.
+    """
+
+    def __init__(self, vectors: np.ndarray):
+        self.vectors = vectors
+
+    def embed_documents(self, texts: list[str]) -> list[list[float]]:
+        return self.vectors[[int(text) for text in texts]]
+
+    def embed_query(self, text: str) -> list[float]:
+        return self.vectors[int(text)]
+
+
+def make_vectors(count: int, dimension: int, clusters: int, seed: int = 0) -> np.ndarray:
+    # Like Matryoshka embeddings, the leading dimensions carry more of the signal than the trailing ones
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension)).astype(np.float32)
+    vectors = centers[rng.integers(clusters, size=count)] + 0.5 * rng.normal(size=(count, dimension)).astype(np.float32)
+    return normalize_rows(vectors / np.sqrt(1 + np.arange(dimension) / 32))
+
+
+def main():
+    # With rescoring, a codec keeps the full float32 vectors next to its codes: it shrinks the searched bytes but adds
+    # to the disk. Only codecs without rescoring make the collection smaller on disk, at the cost of recall.
+    parser = argparse.ArgumentParser(description="Compare searched bytes, bytes on disk, load time and recall@k of the compact vector codecs with full precision.")
+    parser.add_argument("--vectors", type=int, default=100000, help="Number of stored vectors.")
+    parser.add_argument("--dimension", type=int, default=768, help="Vector dimension.")
+    parser.add_argument("--clusters", type=int, default=500, help="Number of synthetic topics.")
+    parser.add_argument("--queries", type=int, default=200, help="Number of queries.")
+    parser.add_argument("--k", type=int, default=5, help="Number of results per query.")
+    args = parser.parse_args()
+
+    vectors = make_vectors(args.vectors + args.queries, args.dimension, args.clusters)
+    queries = vectors[args.vectors:]
+    exact = [set(np.argsort(-(vectors[:args.vectors] @ query))[:args.k].tolist()) for query in queries]
+    codecs = [
+        VectorCodec(),
+        VectorCodec(quantization="int8"),
+        VectorCodec(dimensions=256),
+        VectorCodec(quantization="int8", dimensions=256),
+        VectorCodec(quantization="int8", dimensions=128),
+        VectorCodec(quantization="int8", rescore=False),
+        VectorCodec(quantization="int8", dimensions=256, rescore=False),
+    ]
+
+    with tempfile.TemporaryDirectory() as directory:
+        for i, codec in enumerate(codecs):
+            path = os.path.join(directory, str(i))
+            store = LocalVectorStore(path, MatrixEmbeddings(vectors), ann_min_vectors=0, codec=codec)
+            for batch_start in range(0, args.vectors, 10000):
+                rows = [str(row) for row in range(batch_start, min(batch_start + 10000, args.vectors))]
+                store.add_texts(rows, ids=rows)
+
+            start = time.perf_counter()
+            if codec.is_identity:
+                np.fromfile(os.path.join(path, VECTORS_FILENAME), dtype=np.float32)
+            else:
+                codec.read(path, args.vectors)
+            load_ms = (time.perf_counter() - start) * 1000
+
+            recall_without_rescore = 0.0
+            recall = 0.0
+            latencies = []
+            for query, truth in zip(queries, exact):
+                if store._codes is not None:
+                    approx = codec.score(store._codes, store._scales, query)
+                    recall_without_rescore += len(truth & set(np.argsort(-approx)[:args.k].tolist())) / args.k
+                start = time.perf_counter()
+                docs = store.similarity_search_by_vector_with_relevance_scores(query, args.k)
+                latencies.append((time.perf_counter() - start) * 1000)
+                recall += len(truth & {int(doc.id) for doc, _ in docs}) / args.k
+
+            footprint = store.memory_footprint()
+            name = f"{codec.quantization}/{codec.dimensions or args.dimension}" + ("" if codec.rescore else " only")
+            without_rescore = f"{recall_without_rescore / args.queries:.3f}" if store._codes is not None else "  -  "
+            print(
+                f"{name:>15}: searched {footprint['search_bytes'] / 2**20:7.1f} MiB, on disk {store.disk_bytes() / 2**20:7.1f} MiB, load {load_ms:7.1f} ms, "
+                f"recall@{args.k} {recall / args.queries:.3f} (without rescoring {without_rescore}), "
+                f"p50 {np.percentile(latencies, 50):6.2f} ms"
+            )
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,78 @@
+from query_model import QueryModel
+from query_waiter import WAIT_DEFAULT_SECONDS, WAIT_INITIAL_DELAY_SECONDS, WAIT_MAX_DELAY_SECONDS, wait_for_completion
+import argparse
+import asyncio
+import time
+
+
+class SimulatedTable:
+    """
+    Offline stand-in for DynamoDB: the worker Lambda stores the answer `answer_seconds` after the query was submitted.
+    """
+
+    def __init__(self, answer_seconds: float):
+        self.answer_seconds = answer_seconds
+        self.submitted_at = time.perf_counter()
+        self.reads = 0
+
+    async def aget_item(self, user_id: str, query_id: str) -> QueryModel:
+        self.reads += 1
+        is_complete = time.perf_counter() - self.submitted_at >= self.answer_seconds
+        return QueryModel(query_id=query_id, user_id=user_id, query_text="question", is_complete=is_complete)
+
+
+async def poll(table: SimulatedTable, interval: float) -> int:
+    """
+    The client polls `GET /users/{user_id}/queries/{query_id}` every `interval` seconds. Returns the number of requests.
+    """
+    requests = 0
+    while True:
+        requests += 1
+        if (await table.aget_item("user", "query")).is_complete:
+            return requests
+        await asyncio.sleep(interval)
+
+
+async def long_poll(table: SimulatedTable, timeout: float, initial_delay: float, max_delay: float) -> int:
+    """
+    The client calls `GET /users/{user_id}/queries/{query_id}/wait` until the query is complete. Returns the number of requests.
+    """
+    requests = 0
+    while True:
+        requests += 1
+        result = await wait_for_completion("user", "query", timeout=timeout, initial_delay=initial_delay, max_delay=max_delay)
+        if result.query.is_complete:
+            return requests
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Count the API requests and DynamoDB reads to wait for one answer of the worker Lambda, polling versus the wait endpoint.")
+    parser.add_argument("--answer-seconds", type=float, nargs="+", default=[3, 8, 20, 45], help="Seconds until the worker stores the answer.")
+    parser.add_argument("--poll-interval", type=float, default=1, help="Seconds between client polls.")
+    parser.add_argument("--time-scale", type=float, default=20, help="Runs the simulation this many times faster than real time.")
+    args = parser.parse_args()
+
+    scale = args.time_scale
+    print(f"Polling every {args.poll_interval}s versus waiting up to {WAIT_DEFAULT_SECONDS}s per request with reads backing off from {WAIT_INITIAL_DELAY_SECONDS}s to {WAIT_MAX_DELAY_SECONDS}s")
+    for answer_seconds in args.answer_seconds:
+        table = SimulatedTable(answer_seconds / scale)
+        poll_requests = asyncio.run(poll(table, args.poll_interval / scale))
+        poll_reads = table.reads
+
+        table = SimulatedTable(answer_seconds / scale)
+        QueryModel.aget_item = table.aget_item
+        wait_requests = asyncio.run(long_poll(
+            table,
+            WAIT_DEFAULT_SECONDS / scale,
+            WAIT_INITIAL_DELAY_SECONDS / scale,
+            WAIT_MAX_DELAY_SECONDS / scale,
+        ))
+        print(
+            f"answer after {answer_seconds:4.0f}s: "
+            f"polling {poll_requests:3d} requests / {poll_reads:3d} reads, "
+            f"wait endpoint {wait_requests:3d} requests / {table.reads:3d} reads"
+        )
+
+
+if __name__ == "__main__":
+    main()
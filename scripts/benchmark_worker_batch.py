@@ -0,0 +1,103 @@
+from pdf_qa import query_cache, query_handler
+from langchain_core.documents import Document
+from query_model import QueryModel
+import argparse
+import asyncio
+import time
+import worker_handler
+
+
+class SimulatedEmbeddings:
+    model = "simulated"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return [1.0, 0.0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return [1.0, 0.0]
+
+
+class SimulatedDB:
+    """
+    Offline stand-in for Chroma: every search takes `latency` seconds.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.embeddings = SimulatedEmbeddings(latency)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        time.sleep(self.latency)
+        return self._results()
+
+    async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        await asyncio.sleep(self.latency)
+        return self._results()
+
+    def _results(self):
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+
+class SimulatedLLM:
+    """
+    Offline stand-in for Gemini: every answer takes `latency` seconds.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        return "answer"
+
+    async def ainvoke(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        return "answer"
+
+
+def make_sqs_event(size: int) -> dict:
+    return {"Records": [
+        {"messageId": str(i), "body": QueryModel(user_id=f"user-{i % 5}", query_text=f"question {i}").model_dump_json()}
+        for i in range(size)
+    ]}
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Measure queries per second per worker invocation for single-query events and batches against simulated backends.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per embedding, search and LLM call.")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Simulated seconds per DynamoDB request.")
+    parser.add_argument("--batch-sizes", type=int, nargs="+", default=[1, 10, 50, 100], help="Queries per invocation.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 8, 32], help="Queries answered at the same time within a batch.")
+    args = parser.parse_args()
+
+    query_cache.QUERY_CACHE_BACKEND = "none"
+    db = SimulatedDB(args.latency)
+    query_handler.get_chroma_db = lambda user_id="nobody": db
+    query_handler.get_llm = lambda model=None: SimulatedLLM(args.latency)
+    QueryModel.put_item = lambda self: time.sleep(args.db_latency)
+    # A batch write stores up to 25 items per request
+    QueryModel.batch_put_items = classmethod(lambda cls, items: time.sleep(args.db_latency * -(-len(items) // 25)))
+
+    print(f"Each query makes 3 simulated calls of {args.latency}s; DynamoDB requests take {args.db_latency}s")
+    start = time.perf_counter()
+    worker_handler.handler(QueryModel(query_text="question").model_dump(), None)
+    single = time.perf_counter() - start
+    print(f"single query event: {single:6.2f}s ({1 / single:7.1f} queries/s per invocation)")
+
+    for batch_size in args.batch_sizes:
+        for concurrency in args.concurrency:
+            event = make_sqs_event(batch_size)
+            start = time.perf_counter()
+            result = worker_handler.run(worker_handler.process_batch(worker_handler.parse_batch(event), concurrency))
+            elapsed = time.perf_counter() - start
+            assert not result["batchItemFailures"]
+            print(f"batch={batch_size:4d} concurrency={concurrency:3d}: {elapsed:6.2f}s ({batch_size / elapsed:7.1f} queries/s per invocation)")
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,125 @@
+from pdf_qa import query_cache, query_handler
+from pdf_qa.query_handler import process_query
+from fastapi import FastAPI, Path as ApiPath
+from langchain_core.documents import Document
+from query_model import QueryModel
+import api_handler
+import argparse
+import asyncio
+import httpx
+import time
+
+
+class SimulatedEmbeddings:
+    model = "simulated"
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def embed_query(self, text: str) -> list[float]:
+        time.sleep(self.latency)
+        return [1.0, 0.0]
+
+    async def aembed_query(self, text: str) -> list[float]:
+        await asyncio.sleep(self.latency)
+        return [1.0, 0.0]
+
+
+class SimulatedDB:
+    """
+    Offline stand-in for Chroma: every search takes `latency` seconds.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+        self.embeddings = SimulatedEmbeddings(latency)
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        time.sleep(self.latency)
+        return self._results()
+
+    async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        await asyncio.sleep(self.latency)
+        return self._results()
+
+    def _results(self):
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+
+class SimulatedLLM:
+    """
+    Offline stand-in for Gemini: every answer takes `latency` seconds.
+    """
+
+    def __init__(self, latency: float):
+        self.latency = latency
+
+    def invoke(self, prompt: str) -> str:
+        time.sleep(self.latency)
+        return "answer"
+
+    async def ainvoke(self, prompt: str) -> str:
+        await asyncio.sleep(self.latency)
+        return "answer"
+
+
+def create_sync_app() -> FastAPI:
+    """
+    The query route as it was before the async path: a sync handler, which occupies a threadpool thread for the whole query.
+    """
+    app = FastAPI()
+
+    @app.post("/users/{user_id}/queries")
+    def submit_user_query(request: api_handler.SubmitQueryRequest, user_id: str = ApiPath(...)) -> QueryModel:
+        new_query = QueryModel(query_text=request.query_text, user_id=user_id)
+        query_response = process_query(query=request.query_text, user_id=user_id)
+        new_query.answer_text = query_response.response_text
+        new_query.sources = query_response.sources
+        new_query.is_complete = True
+        new_query.put_item()
+        return new_query
+
+    return app
+
+
+async def run_load(app: FastAPI, concurrency: int) -> float:
+    transport = httpx.ASGITransport(app=app)
+    async with httpx.AsyncClient(transport=transport, base_url="http://test", timeout=None) as client:
+        start = time.perf_counter()
+        responses = await asyncio.gather(*(
+            client.post(f"/users/user-{i}/queries", json={"query_text": f"question {i}"})
+            for i in range(concurrency)
+        ))
+        elapsed = time.perf_counter() - start
+    assert all(response.status_code == 200 for response in responses)
+    return elapsed
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Compare how the sync and async query routes scale with concurrent queries against simulated backends.")
+    parser.add_argument("--latency", type=float, default=0.1, help="Simulated seconds per embedding, search and LLM call.")
+    parser.add_argument("--db-latency", type=float, default=0.01, help="Simulated seconds per DynamoDB write.")
+    parser.add_argument("--concurrency", type=int, nargs="+", default=[1, 10, 50, 100, 200, 400], help="Concurrent queries per run.")
+    args = parser.parse_args()
+
+    query_cache.QUERY_CACHE_BACKEND = "none"
+    db = SimulatedDB(args.latency)
+    query_handler.get_chroma_db = lambda user_id="nobody": db
+    query_handler.get_llm = lambda model=None: SimulatedLLM(args.latency)
+    QueryModel.put_item = lambda self: time.sleep(args.db_latency)
+    api_handler.WORKER_LAMBDA_NAME = None
+
+    sync_app = create_sync_app()
+    print(f"Each query makes 3 simulated calls of {args.latency}s and one {args.db_latency}s write")
+    for concurrency in args.concurrency:
+        sync_seconds = asyncio.run(run_load(sync_app, concurrency))
+        async_seconds = asyncio.run(run_load(api_handler.app, concurrency))
+        print(
+            f"concurrency={concurrency:4d}: "
+            f"sync {sync_seconds:6.2f}s ({concurrency / sync_seconds:7.1f} queries/s), "
+            f"async {async_seconds:6.2f}s ({concurrency / async_seconds:7.1f} queries/s)"
+        )
+
+
+if __name__ == "__main__":
+    main()
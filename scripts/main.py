@@ -1,12 +1,12 @@
-from pdf_qa.document_processing import load_documents, split_documents 
+from pdf_qa.document_processing import iter_documents, iter_split_documents
 from pdf_qa.chroma_handler import add_to_chroma
 from pdf_qa.query_handler import process_query
 import argparse
 
 
 def main():
-    documents = load_documents()
-    chunks = split_documents(documents)
+    documents = iter_documents()
+    chunks = iter_split_documents(documents)
     add_to_chroma(chunks)
 
     parser = argparse.ArgumentParser()
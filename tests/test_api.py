@@ -9,6 +9,7 @@ from pdf_qa.chroma_handler import clear_database
 ENDPOINT = "http://localhost:8000"
 QUERY_ENDPOINT = "{}/users/{{user_id}}/queries/".format(ENDPOINT)
 DOCUMENT_ENDPOINT = "{}/users/{{user_id}}/documents/".format(ENDPOINT)
+INGESTION_JOB_ENDPOINT = "{}/users/{{user_id}}/ingestion-jobs/{{job_id}}".format(ENDPOINT)
 WAIT_TIME = 15 # seconds
 
 
@@ -122,7 +123,12 @@ def test_upload_then_list_documents():
         files=files
     )
     assert response.status_code == 200
-    
+    job_id = response.json()["job_id"]
+
+    # Documents are only listed once their ingestion job is done
+    job = wait_for_ingestion_job(user_id, job_id)
+    assert job["status"] == "succeeded"
+
     # GET
     response = requests.get(
         DOCUMENT_ENDPOINT.format(user_id=user_id),
@@ -130,5 +136,19 @@ def test_upload_then_list_documents():
     )
     print(response.json())
     assert response.status_code == 200
-    assert len(response.json()) == 2
+    data = response.json()
+    assert sorted(d["filename"] for d in data["documents"]) == ["file1.pdf", "file2.pdf"]
+    assert data["next_cursor"] is None
     clear_database(user_id)
+
+
+# Helper function for test_upload_then_list_documents()
+def wait_for_ingestion_job(user_id: str, job_id: str, timeout: float = 120) -> dict:
+    deadline = time.monotonic() + timeout
+    while True:
+        response = requests.get(INGESTION_JOB_ENDPOINT.format(user_id=user_id, job_id=job_id), timeout=WAIT_TIME)
+        assert response.status_code == 200
+        job = response.json()
+        if job["status"] in ("succeeded", "failed") or time.monotonic() > deadline:
+            return job
+        time.sleep(2)
@@ -0,0 +1,135 @@
+from utils.api_key_loader import SecretCache
+from botocore.exceptions import ClientError
+import pytest
+import time
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+class FakeSSM:
+    def __init__(self):
+        self.calls = []
+        self.fail = False
+        self.invalid = False
+        self.version = 1
+
+    def get_parameters(self, Names, WithDecryption):
+        self.calls.append(Names)
+        if self.fail:
+            raise ClientError({"Error": {"Code": "ThrottlingException", "Message": "Rate exceeded"}}, "GetParameters")
+        if self.invalid:
+            return {"Parameters": [], "InvalidParameters": list(Names)}
+        return {
+            "Parameters": [{"Name": name, "Value": f"{name}-v{self.version}"} for name in Names],
+            "InvalidParameters": [],
+        }
+
+
+@pytest.fixture
+def params(monkeypatch):
+    monkeypatch.setenv("GOOGLE_API_KEY_PARAM", "/rag-app/google_api_key")
+    monkeypatch.setenv("CHROMA_API_KEY_PARAM", "/rag-app/chroma_api_key")
+
+
+def make_cache(ssm, clock, ttl_seconds=100, refresh_ahead_seconds=0, retry_seconds=30):
+    return SecretCache(
+        ttl_seconds=ttl_seconds,
+        refresh_ahead_seconds=refresh_ahead_seconds,
+        retry_seconds=retry_seconds,
+        ssm_client_factory=lambda: ssm,
+        clock=clock,
+    )
+
+
+def test_fetches_all_secrets_in_one_batch(params):
+    ssm = FakeSSM()
+    cache = make_cache(ssm, FakeClock())
+
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+    assert cache.get("CHROMA_API_KEY") == "/rag-app/chroma_api_key-v1"
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+    assert len(ssm.calls) == 1
+    assert sorted(ssm.calls[0]) == ["/rag-app/chroma_api_key", "/rag-app/google_api_key"]
+
+
+def test_refetches_after_ttl(params):
+    ssm = FakeSSM()
+    clock = FakeClock()
+    cache = make_cache(ssm, clock)
+    cache.get("GOOGLE_API_KEY")
+
+    ssm.version = 2
+    clock.now = 101
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v2"
+    assert len(ssm.calls) == 2
+
+
+def test_keeps_stale_values_when_refresh_fails(params):
+    ssm = FakeSSM()
+    clock = FakeClock()
+    cache = make_cache(ssm, clock)
+    cache.get("GOOGLE_API_KEY")
+
+    ssm.fail = True
+    clock.now = 101
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+
+
+def test_refreshes_in_background_before_expiry(params):
+    ssm = FakeSSM()
+    clock = FakeClock()
+    cache = make_cache(ssm, clock, refresh_ahead_seconds=10)
+    cache.get("GOOGLE_API_KEY")
+
+    ssm.version = 2
+    clock.now = 95
+    # The current value is served while the refresh runs in the background
+    assert cache.get("GOOGLE_API_KEY") in ("/rag-app/google_api_key-v1", "/rag-app/google_api_key-v2")
+    deadline = time.monotonic() + 5
+    while cache._refreshing and time.monotonic() < deadline:
+        time.sleep(0.01)
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v2"
+
+
+@pytest.mark.parametrize("failure", ["fail", "invalid"])
+def test_backs_off_after_a_failed_refresh(params, failure):
+    ssm = FakeSSM()
+    clock = FakeClock()
+    cache = make_cache(ssm, clock, refresh_ahead_seconds=10)
+    cache.get("GOOGLE_API_KEY")
+
+    setattr(ssm, failure, True)
+    clock.now = 101
+    for _ in range(5):
+        assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+    clock.now = 120
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+    assert len(ssm.calls) == 2
+
+    setattr(ssm, failure, False)
+    ssm.version = 2
+    clock.now = 131
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v2"
+    assert len(ssm.calls) == 3
+
+
+def test_backs_off_when_the_first_fetch_fails(params):
+    ssm = FakeSSM()
+    clock = FakeClock()
+    cache = make_cache(ssm, clock)
+    ssm.fail = True
+
+    assert cache.get("GOOGLE_API_KEY") is None
+    assert cache.get("CHROMA_API_KEY") is None
+    assert len(ssm.calls) == 1
+
+    ssm.fail = False
+    clock.now = 30
+    assert cache.get("GOOGLE_API_KEY") == "/rag-app/google_api_key-v1"
+    assert len(ssm.calls) == 2
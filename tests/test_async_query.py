@@ -0,0 +1,68 @@
+from pdf_qa import query_cache, query_handler
+from pdf_qa.query_handler import Source, aprocess_query
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from query_model import QueryModel
+import api_handler
+import asyncio
+import pytest
+import time
+
+
+LATENCY = 0.2
+
+
+class FakeEmbeddings:
+    model = "fake-model"
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeDB:
+    embeddings = FakeEmbeddings()
+
+    async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        await asyncio.sleep(LATENCY)
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+
+class FakeLLM:
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(LATENCY)
+        return "answer"
+
+
+@pytest.fixture(autouse=True)
+def fakes(monkeypatch):
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "none")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM())
+
+
+def test_concurrent_queries_overlap():
+    async def run():
+        return await asyncio.gather(*(aprocess_query(f"question {i}", "user") for i in range(100)))
+
+    start = time.perf_counter()
+    responses = asyncio.run(run())
+    elapsed = time.perf_counter() - start
+
+    assert all(response.sources == [Source(filename="file.pdf", page=1)] for response in responses)
+    # 100 sequential queries would take 40 seconds
+    assert elapsed < 10 * LATENCY
+
+
+def test_submit_route_awaits_the_query(monkeypatch):
+    stored = []
+
+    async def aput_item(self):
+        stored.append(self.model_copy())
+
+    monkeypatch.setattr(api_handler, "WORKER_LAMBDA_NAME", None)
+    monkeypatch.setattr(QueryModel, "aput_item", aput_item)
+    response = TestClient(api_handler.app).post("/users/user/queries", json={"query_text": "question"})
+
+    assert response.status_code == 200
+    assert response.json()["answer_text"] == "answer"
+    assert stored[0].is_complete
@@ -0,0 +1,186 @@
+from background_worker import BackgroundWorkerPool, WorkerPoolClosed, WorkerPoolFull
+from pdf_qa import query_cache, query_handler
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from query_model import QueryModel
+from query_waiter import wait_for_completion
+import api_handler
+import asyncio
+import pytest
+import worker_handler
+
+
+def make_query(user_id, i=0):
+    return QueryModel(user_id=user_id, query_text=f"question {i}")
+
+
+def test_users_take_turns():
+    async def run():
+        answered = []
+
+        async def handler(query):
+            await asyncio.sleep(0.01)
+            answered.append(query.user_id)
+
+        pool = BackgroundWorkerPool(handler, concurrency=1)
+        pool.start()
+        for i in range(4):
+            pool.submit(make_query("busy", i))
+        pool.submit(make_query("other"))
+        await pool.drain()
+        return answered, pool.stats()
+
+    answered, stats = asyncio.run(run())
+    assert answered == ["busy", "other", "busy", "busy", "busy"]
+    assert stats["completed"] == 5
+
+
+def test_concurrency_is_bounded_and_failures_are_counted():
+    async def run():
+        running = 0
+        peak = 0
+
+        async def handler(query):
+            nonlocal running, peak
+            running += 1
+            peak = max(peak, running)
+            await asyncio.sleep(0.01)
+            running -= 1
+            if query.user_id == "broken":
+                raise RuntimeError("failed")
+
+        pool = BackgroundWorkerPool(handler, concurrency=3)
+        pool.start()
+        for i in range(10):
+            pool.submit(make_query(f"user-{i}"))
+        pool.submit(make_query("broken"))
+        assert await pool.drain()
+        return peak, pool.stats()
+
+    peak, stats = asyncio.run(run())
+    assert peak == 3
+    assert stats["completed"] == 10
+    assert stats["failed"] == 1
+
+
+def test_serialized_users_run_in_parallel_but_their_own_jobs_in_order():
+    async def run():
+        running = {}
+        overlapping_users = 0
+        order = []
+
+        async def handler(query):
+            nonlocal overlapping_users
+            assert not running.get(query.user_id), "two jobs of one user overlap"
+            running[query.user_id] = True
+            overlapping_users = max(overlapping_users, sum(running.values()))
+            await asyncio.sleep(0.02)
+            order.append((query.user_id, query.query_text))
+            running[query.user_id] = False
+
+        pool = BackgroundWorkerPool(handler, concurrency=4, serialize_users=True)
+        pool.start()
+        for i in range(3):
+            pool.submit(make_query("busy", i))
+        pool.submit(make_query("other"))
+        assert await pool.drain()
+        return overlapping_users, order, pool.stats()
+
+    overlapping_users, order, stats = asyncio.run(run())
+    assert overlapping_users == 2
+    assert [text for user_id, text in order if user_id == "busy"] == ["question 0", "question 1", "question 2"]
+    # The other user's job does not wait behind the busy user's jobs
+    assert order.index(("other", "question 0")) < 2
+    assert stats["completed"] == 4
+
+
+def test_full_and_draining_pools_reject_queries():
+    async def run():
+        async def handler(query):
+            await asyncio.sleep(1)
+
+        pool = BackgroundWorkerPool(handler, concurrency=1, max_pending=1)
+        pool.submit(make_query("user"))
+        with pytest.raises(WorkerPoolFull):
+            pool.submit(make_query("user"))
+        pool.start()
+        assert not await pool.drain(timeout=0.05)
+        with pytest.raises(WorkerPoolClosed):
+            pool.submit(make_query("user"))
+
+    asyncio.run(run())
+
+
+def test_submit_returns_pending_query_and_answers_it_in_the_background(monkeypatch):
+    class FakeEmbeddings:
+        model = "fake-model"
+
+        async def aembed_query(self, text):
+            return [1.0, 0.0]
+
+    class FakeDB:
+        embeddings = FakeEmbeddings()
+
+        async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+            return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+    class FakeLLM:
+        async def ainvoke(self, prompt):
+            await asyncio.sleep(0.05)
+            return "answer"
+
+    stored = []
+
+    async def aput_item(self):
+        stored.append(self.model_copy())
+
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "none")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM())
+    monkeypatch.setattr(QueryModel, "aput_item", aput_item)
+    monkeypatch.setattr(QueryModel, "aupdate_answer", aput_item)
+    monkeypatch.setattr(api_handler, "WORKER_LAMBDA_NAME", None)
+    monkeypatch.setattr(api_handler, "LOCAL_WORKER_CONCURRENCY", 2)
+
+    with TestClient(api_handler.app) as client:
+        response = client.post("/users/user/queries", json={"query_text": "question"})
+        assert response.status_code == 200
+        assert not response.json()["is_complete"]
+
+    assert [item.is_complete for item in stored] == [False, True]
+    assert stored[-1].answer_text == "answer"
+    assert stored[-1].query_id == response.json()["query_id"]
+
+
+def test_failed_query_is_completed_with_an_error_answer(monkeypatch):
+    stored = []
+
+    async def aupdate_answer(self):
+        stored.append(self.model_copy())
+
+    async def aget_item(cls, user_id, query_id):
+        return QueryModel(query_id=query_id, user_id=user_id, query_text="question")
+
+    async def failing_handler(query):
+        await asyncio.sleep(0.05)
+        raise RuntimeError("quota")
+
+    monkeypatch.setattr(QueryModel, "aupdate_answer", aupdate_answer)
+    monkeypatch.setattr(QueryModel, "aget_item", classmethod(aget_item))
+
+    async def run():
+        pool = BackgroundWorkerPool(failing_handler, on_failure=worker_handler.afail_query, concurrency=1)
+        pool.start()
+        query = make_query("user")
+        pool.submit(query)
+        # The waiting request is woken up by the failure instead of waiting out its timeout
+        result = await wait_for_completion("user", query.query_id, timeout=5, initial_delay=5)
+        await pool.drain()
+        return result, pool.stats()
+
+    result, stats = asyncio.run(run())
+    assert result.notified
+    assert result.query.is_complete
+    assert result.query.answer_text == worker_handler.FAILED_ANSWER
+    assert [item.answer_text for item in stored] == [worker_handler.FAILED_ANSWER]
+    assert stats["failed"] == 1
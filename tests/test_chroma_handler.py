@@ -0,0 +1,59 @@
+from pdf_qa import chroma_handler
+from pdf_qa.chroma_handler import add_id_metadata_to_chunks, add_to_chroma
+from langchain_core.documents import Document
+import pytest
+
+
+class FakeDB:
+    def __init__(self, ids=()):
+        self.ids = list(ids)
+        self.batches = []
+        self.lookups = []
+
+    def get(self, ids=None, include=None):
+        assert ids is not None, "the whole collection should never be fetched"
+        self.lookups.append(ids)
+        return {"ids": [chunk_id for chunk_id in ids if chunk_id in self.ids]}
+
+    def add_documents(self, documents, ids):
+        self.batches.append(ids)
+        self.ids.extend(ids)
+
+
+def make_chunks(count, source="data/file.pdf"):
+    return [
+        Document(page_content=f"chunk {i}", metadata={"source": source, "page": i // 3})
+        for i in range(count)
+    ]
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake_db = FakeDB()
+    monkeypatch.setattr(chroma_handler, "get_chroma_db", lambda user_id="nobody": fake_db)
+    return fake_db
+
+
+def test_streamed_chunks_are_added_in_bounded_batches(db):
+    consumed = []
+
+    def stream():
+        for chunk in make_chunks(10):
+            consumed.append(chunk)
+            yield chunk
+
+    assert add_to_chroma(stream(), "user", batch_size=4) == 10
+    assert [len(batch) for batch in db.batches] == [4, 4, 2]
+    assert db.ids == [chunk.metadata["id"] for chunk in add_id_metadata_to_chunks(make_chunks(10))]
+
+
+def test_existing_chunks_are_skipped(db):
+    add_to_chroma(make_chunks(5), "user")
+    assert add_to_chroma(make_chunks(7), "user") == 2
+    assert len(db.ids) == 7
+
+
+def test_only_candidate_ids_are_looked_up(db):
+    db.ids = [f"existing-{i}" for i in range(10000)]
+    assert add_to_chroma(make_chunks(5), "user", batch_size=2) == 5
+    assert [len(ids) for ids in db.lookups] == [2, 2, 1]
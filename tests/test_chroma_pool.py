@@ -0,0 +1,77 @@
+from pdf_qa.chroma_pool import ChromaPool
+from langchain_core.embeddings import FakeEmbeddings
+import chromadb
+
+
+class FakeClock:
+    def __init__(self):
+        self.now = 0.0
+
+    def __call__(self):
+        return self.now
+
+
+def make_pool(max_size=2, idle_seconds=60, clock=None):
+    client_calls = []
+
+    def client_factory():
+        client_calls.append(1)
+        return chromadb.EphemeralClient()
+
+    pool = ChromaPool(
+        client_factory=client_factory,
+        embeddings_factory=lambda: FakeEmbeddings(size=8),
+        max_size=max_size,
+        idle_seconds=idle_seconds,
+        clock=clock or FakeClock(),
+    )
+    return pool, client_calls
+
+
+def test_reuses_client_and_handles():
+    pool, client_calls = make_pool()
+    first = pool.get("alice")
+    second = pool.get("alice")
+    pool.get("bob")
+
+    assert first is second
+    assert len(client_calls) == 1
+    stats = pool.stats()
+    assert stats["hits"] == 1
+    assert stats["misses"] == 2
+    assert stats["size"] == 2
+
+
+def test_evicts_least_recently_used_handle():
+    pool, _ = make_pool(max_size=2)
+    pool.get("alice")
+    pool.get("bob")
+    pool.get("alice")
+    pool.get("carol")
+
+    assert pool.stats()["evictions"] == 1
+    pool.get("alice")
+    assert pool.stats()["hits"] == 2
+    pool.get("bob")
+    assert pool.stats()["misses"] == 4
+
+
+def test_evicts_idle_handles():
+    clock = FakeClock()
+    pool, _ = make_pool(idle_seconds=10, clock=clock)
+    pool.get("alice")
+    clock.now = 11
+    pool.get("alice")
+
+    stats = pool.stats()
+    assert stats["misses"] == 2
+    assert stats["evictions"] == 1
+
+
+def test_missing_client_is_not_cached():
+    pool = ChromaPool(
+        client_factory=lambda: None,
+        embeddings_factory=lambda: FakeEmbeddings(size=8),
+    )
+    assert pool.get("alice") is None
+    assert pool.stats()["size"] == 0
@@ -0,0 +1,33 @@
+from pathlib import Path
+import os
+import subprocess
+import sys
+
+
+SRC_DIR = Path(__file__).resolve().parent.parent / "image" / "src"
+HEAVY_MODULES = ("chromadb", "langchain_chroma", "langchain_community", "langchain_core", "langchain_google_genai", "langchain_text_splitters", "pypdf")
+
+PROBE = """
+import sys
+import api_handler
+from fastapi.testclient import TestClient
+from query_model import QueryModel
+
+async def list_items(user_id, count):
+    return []
+
+QueryModel.alist_items = list_items
+client = TestClient(api_handler.app)
+assert client.get("/").status_code == 200
+assert client.get("/users/user/queries").status_code == 200
+print(",".join(sorted({name.split(".")[0] for name in sys.modules})))
+"""
+
+
+def test_cheap_routes_do_not_import_the_rag_pipeline():
+    # A fresh interpreter, as the test session has already imported everything
+    env = dict(os.environ, PYTHONPATH=str(SRC_DIR))
+    result = subprocess.run([sys.executable, "-c", PROBE], cwd=SRC_DIR, env=env, capture_output=True, text=True, check=True)
+    loaded = set(result.stdout.strip().splitlines()[-1].split(","))
+
+    assert loaded & set(HEAVY_MODULES) == set()
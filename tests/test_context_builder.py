@@ -0,0 +1,120 @@
+from pdf_qa.chroma_pool import RelevanceChroma
+from pdf_qa.chroma_handler import iter_chunks_with_ids
+from pdf_qa.context_builder import build_context, estimate_tokens, find_overlap, merge_adjacent
+from pdf_qa.document_processing import split_documents
+from pdf_qa.query_handler import retrieve_results
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import asyncio
+import chromadb
+import pytest
+import random
+
+
+def make_result(text, chunk_id, score):
+    return Document(page_content=text, metadata={"id": chunk_id}), score
+
+
+def words(prefix, count):
+    return " ".join(f"{prefix}{i}" for i in range(count))
+
+
+def test_adjacent_chunks_are_merged_without_their_overlap():
+    first = words("a", 30)
+    second = words("a", 30)[-40:] + " " + words("b", 20)
+    passages = merge_adjacent([
+        make_result(second, "file.pdf:1:1:bbbbbbbb", 0.9),
+        make_result(first, "file.pdf:1:0:aaaaaaaa", 0.8),
+    ])
+
+    assert passages == [first + second[40:]]
+
+
+def test_chunks_on_other_pages_are_not_merged():
+    passages = merge_adjacent([
+        make_result("page one", "file.pdf:1:0:aaaaaaaa", 0.9),
+        make_result("page two", "file.pdf:2:1:bbbbbbbb", 0.8),
+    ])
+    assert passages == ["page one", "page two"]
+
+
+def test_near_duplicates_are_skipped_by_mmr():
+    text = words("w", 100)
+    results = [
+        make_result(text, "file.pdf:1:0:aaaaaaaa", 0.95),
+        make_result(text + " extra", "copy.pdf:1:0:bbbbbbbb", 0.94),
+        make_result(words("x", 100), "other.pdf:3:0:cccccccc", 0.80),
+    ]
+    context = build_context(results, max_chunks=2)
+
+    assert [doc.metadata["id"] for doc, _ in context.results] == ["file.pdf:1:0:aaaaaaaa", "other.pdf:3:0:cccccccc"]
+    assert context.tokens_saved > 0
+
+
+def test_exact_duplicates_and_budget():
+    chunk = "z" * 400
+    results = [make_result(chunk, f"file.pdf:{i}:0:aaaaaaaa", 0.9 - i / 100) for i in range(3)]
+    results += [make_result("y" * 400, f"other.pdf:{i}:0:bbbbbbbb", 0.5) for i in range(3)]
+
+    context = build_context(results, token_budget=150)
+    assert len(context.results) == 1
+    assert context.tokens == estimate_tokens(chunk)
+    assert context.baseline_tokens > 4 * context.tokens
+
+
+def test_find_overlap():
+    assert find_overlap("hello world", "world peace") == 5
+    assert find_overlap("abc", "xyz") == 0
+    # A single shared character is not an overlap
+    assert find_overlap("alpha beta.", ". gamma") == 0
+    assert find_overlap("alpha beta", "a gamma") == 0
+
+
+@pytest.mark.parametrize("seed", range(50))
+def test_merged_split_chunks_reproduce_the_page(seed):
+    rng = random.Random(seed)
+    vocabulary = ["alpha", "beta", "gamma", "delta", "epsilon", "zeta", "eta", "theta", "iota", "kappa"]
+    paragraphs = []
+    for _ in range(rng.randint(2, 5)):
+        words = [rng.choice(vocabulary) + rng.choice(["", "", "", ".", ","]) for _ in range(rng.randint(80, 300))]
+        paragraphs.append(" ".join(words))
+    page = "\n\n".join(paragraphs)
+    chunks = list(iter_chunks_with_ids(split_documents([Document(page_content=page, metadata={"source": "data/file.pdf", "page": 1})])))
+    assert len(chunks) > 1
+
+    [passage] = merge_adjacent([(chunk, 1.0) for chunk in chunks])
+    assert passage.split() == page.split()
+
+    # Chunks stored without their start index fall back to guessing the overlap, which never glues words together
+    for chunk in chunks:
+        del chunk.metadata["start_index"]
+    [guessed] = merge_adjacent([(chunk, 1.0) for chunk in chunks])
+    assert set(guessed.split()) <= set(page.split())
+
+
+class WordCountEmbeddings(Embeddings):
+    vocabulary = ["apple", "banana", "cherry", "egg", "fig"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        words = text.split()
+        return [float(words.count(word)) for word in self.vocabulary]
+
+
+def test_chroma_results_are_ranked_by_relevance():
+    db = RelevanceChroma(collection_name="user", embedding_function=WordCountEmbeddings(), client=chromadb.EphemeralClient())
+    texts = ["fig fig fig egg", "banana banana cherry", "apple banana", "cherry egg fig", "apple apple banana"]
+    db.add_texts(texts, ids=[f"file.pdf:{i}:0:{i:08}" for i in range(len(texts))])
+
+    results = retrieve_results(db, "apple banana")
+    scores = [score for _, score in results]
+    assert results[0][0].page_content == "apple banana"
+    assert scores == sorted(scores, reverse=True)
+    assert scores[0] == pytest.approx(1.0)
+
+    context = build_context(results, max_chunks=2)
+    assert [doc.page_content for doc, _ in context.results] == ["apple banana", "apple apple banana"]
+    assert asyncio.run(db.asimilarity_search_by_vector_with_relevance_scores([1.0, 1.0, 0, 0, 0], k=1)) == results[:1]
+    db.delete_collection()
@@ -0,0 +1,184 @@
+from botocore.exceptions import ClientError
+from fastapi.testclient import TestClient
+from fpdf import FPDF
+from pdf_qa import document_catalog, ingestion, ingestion_manifest
+from pdf_qa.document_catalog import InvalidCursor, list_documents
+from pdf_qa.ingestion_manifest import IngestionManifest, ManifestEntry
+import api_handler
+import os
+import pytest
+
+
+class FakeCatalogTable:
+    def __init__(self):
+        self.items = {}
+        self.queries = []
+        self.failing = False
+
+    def query(self, KeyConditionExpression, Limit=100, ExclusiveStartKey=None, **kwargs):
+        user_id = KeyConditionExpression.get_expression()["values"][1]
+        self.queries.append(Limit)
+        filenames = sorted(filename for owner, filename in self.items if owner == user_id)
+        if ExclusiveStartKey:
+            filenames = [filename for filename in filenames if filename > ExclusiveStartKey["filename"]]
+        page = filenames[:Limit]
+        response = {"Items": [self.items[(user_id, filename)] for filename in page]}
+        if len(filenames) > Limit:
+            response["LastEvaluatedKey"] = {"user_id": user_id, "filename": page[-1]}
+        return response
+
+    def batch_writer(self, overwrite_by_pkeys=None):
+        return self
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *args):
+        return False
+
+    def put_item(self, Item):
+        self.check()
+        self.items[(Item["user_id"], Item["filename"])] = Item
+
+    def delete_item(self, Key):
+        self.check()
+        self.items.pop((Key["user_id"], Key["filename"]), None)
+
+    def check(self):
+        if self.failing:
+            raise ClientError({"Error": {"Code": "InternalServerError", "Message": "failed"}}, "BatchWriteItem")
+
+
+def write_pdf(path, pages):
+    pdf = FPDF()
+    for text in pages:
+        pdf.add_page()
+        pdf.set_font("Arial", size=12)
+        pdf.write(5, text)
+    pdf.output(path)
+
+
+def page_through(user_id, limit):
+    filenames, cursor = [], None
+    while True:
+        page = list_documents(user_id, limit=limit, cursor=cursor)
+        filenames.extend(document.filename for document in page.documents)
+        cursor = page.next_cursor
+        if cursor is None:
+            return filenames
+
+
+@pytest.fixture
+def manifest_path(tmp_path, monkeypatch):
+    monkeypatch.setattr(ingestion_manifest, "get_manifest_path", lambda user_id: str(tmp_path / "manifest" / f"{user_id}.json"))
+    monkeypatch.delenv("AWS_EXECUTION_ENV", raising=False)
+
+
+@pytest.fixture
+def catalog_table(monkeypatch):
+    table = FakeCatalogTable()
+    monkeypatch.setattr(document_catalog, "DOCUMENT_TABLE_NAME", "catalog")
+    monkeypatch.setattr(document_catalog, "get_document_table", lambda: table)
+    return table
+
+
+def test_manifest_fallback_pages_by_filename(manifest_path, monkeypatch):
+    manifest = IngestionManifest("user")
+    for i in range(5):
+        manifest.record(ManifestEntry(filename=f"{i}.pdf", content_hash="hash", size=i, chunk_ids=["a", "b"], page_count=1))
+    manifest.save()
+    monkeypatch.setattr(document_catalog, "DOCUMENT_TABLE_NAME", None)
+
+    assert page_through("user", limit=2) == [f"{i}.pdf" for i in range(5)]
+    assert page_through("user", limit=5) == [f"{i}.pdf" for i in range(5)]
+    first = list_documents("user", limit=1).documents[0]
+    assert (first.chunk_count, first.page_count, first.size) == (2, 1, 0)
+    assert list_documents("nobody").documents == []
+
+
+def test_table_pages_read_one_page_per_call(catalog_table):
+    entries = [ManifestEntry(filename=f"{i:03}.pdf", content_hash="hash", size=1) for i in range(7)]
+    document_catalog.update_catalog("user", entries, [])
+    document_catalog.update_catalog("other", entries[:1], [])
+
+    assert page_through("user", limit=3) == [entry.filename for entry in entries]
+    assert catalog_table.queries == [3, 3, 3]
+
+    document_catalog.update_catalog("user", [], ["000.pdf"])
+    assert list_documents("user", limit=1).documents[0].filename == "001.pdf"
+
+
+def test_invalid_cursor_is_rejected(manifest_path):
+    with pytest.raises(InvalidCursor):
+        list_documents("user", cursor="not a cursor")
+
+    response = TestClient(api_handler.app).get("/users/user/documents", params={"cursor": "not a cursor"})
+    assert response.status_code == 400
+
+
+def test_ingestion_updates_the_catalog(tmp_path, manifest_path, catalog_table, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion, "add_to_chroma", lambda chunks, user_id="nobody", progress=None: len(list(chunks)))
+    monkeypatch.setattr(ingestion, "delete_from_chroma", lambda ids, user_id="nobody": None)
+
+    write_pdf(os.path.join(source_dir, "a.pdf"), ["first page", "second page"])
+    ingestion.ingest_user_documents("user")
+
+    response = TestClient(api_handler.app).get("/users/user/documents")
+    assert response.status_code == 200
+    [document] = response.json()["documents"]
+    assert document["filename"] == "a.pdf"
+    assert document["page_count"] == 2
+    assert document["chunk_count"] == 2
+    assert response.json()["next_cursor"] is None
+
+    os.remove(os.path.join(source_dir, "a.pdf"))
+    ingestion.ingest_user_documents("user")
+    assert catalog_table.items == {}
+
+
+def test_files_ingested_before_the_catalog_are_written_once(tmp_path, manifest_path, catalog_table, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    write_pdf(os.path.join(source_dir, "a.pdf"), ["page"])
+    manifest = IngestionManifest("user")
+    manifest.record(ManifestEntry(filename="a.pdf", content_hash=ingestion_manifest.compute_file_hash(os.path.join(source_dir, "a.pdf")), size=1))
+    manifest.save()
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion, "add_to_chroma", lambda chunks, user_id="nobody", progress=None: len(list(chunks)))
+    monkeypatch.setattr(ingestion, "delete_from_chroma", lambda ids, user_id="nobody": None)
+
+    assert ingestion.ingest_user_documents("user").unchanged_files == ["a.pdf"]
+    assert list(catalog_table.items) == [("user", "a.pdf")]
+    assert IngestionManifest.load("user").entries["a.pdf"].cataloged
+
+
+def test_clearing_the_catalog_deletes_every_page(catalog_table):
+    document_catalog.update_catalog("user", [ManifestEntry(filename=f"{i:03}.pdf", content_hash="hash", size=1) for i in range(250)], [])
+    document_catalog.update_catalog("other", [ManifestEntry(filename="a.pdf", content_hash="hash", size=1)], [])
+
+    document_catalog.clear_catalog("user")
+    assert list(catalog_table.items) == [("other", "a.pdf")]
+
+
+def test_failed_catalog_deletes_are_retried(tmp_path, manifest_path, catalog_table, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion, "add_to_chroma", lambda chunks, user_id="nobody", progress=None: len(list(chunks)))
+    monkeypatch.setattr(ingestion, "delete_from_chroma", lambda ids, user_id="nobody": None)
+    write_pdf(os.path.join(source_dir, "a.pdf"), ["page"])
+    ingestion.ingest_user_documents("user")
+    os.remove(os.path.join(source_dir, "a.pdf"))
+
+    catalog_table.failing = True
+    ingestion.ingest_user_documents("user")
+    assert list(catalog_table.items) == [("user", "a.pdf")]
+    assert "a.pdf" in IngestionManifest.load("user").entries
+
+    catalog_table.failing = False
+    assert ingestion.ingest_user_documents("user").removed_files == ["a.pdf"]
+    assert catalog_table.items == {}
+    assert IngestionManifest.load("user").entries == {}
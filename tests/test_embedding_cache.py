@@ -0,0 +1,52 @@
+from pdf_qa.embedding_cache import CachedEmbeddings, EmbeddingCache, hash_text
+from langchain_core.documents import Document
+from pdf_qa.chroma_handler import generate_content_hash
+from langchain_core.embeddings import Embeddings
+
+
+class CountingEmbeddings(Embeddings):
+    def __init__(self):
+        self.embedded = []
+
+    def embed_documents(self, texts):
+        self.embedded.extend(texts)
+        return [[float(len(text)), 0.5] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text)), 0.5]
+
+
+def test_repeat_texts_are_served_from_cache(tmp_path):
+    fake = CountingEmbeddings()
+    embeddings = CachedEmbeddings(fake, EmbeddingCache(str(tmp_path / "cache.sqlite3")), "model")
+
+    assert embeddings.embed_documents(["a", "bb", "a"]) == [[1.0, 0.5], [2.0, 0.5], [1.0, 0.5]]
+    assert embeddings.embed_documents(["bb", "ccc"]) == [[2.0, 0.5], [3.0, 0.5]]
+    assert fake.embedded == ["a", "bb", "ccc"]
+    stats = embeddings.cache.stats()
+    assert stats["hits"] == 1
+    assert stats["entries"] == 3
+
+
+def test_cache_persists_and_is_keyed_by_model(tmp_path):
+    path = str(tmp_path / "cache.sqlite3")
+    EmbeddingCache(path).put_many("model-a", {hash_text("a"): [1.0]})
+
+    cache = EmbeddingCache(path)
+    assert cache.get_many("model-a", [hash_text("a")]) == {hash_text("a"): [1.0]}
+    assert cache.get_many("model-b", [hash_text("a")]) == {}
+
+
+def test_evicts_least_recently_used_entries(tmp_path):
+    cache = EmbeddingCache(str(tmp_path / "cache.sqlite3"), max_entries=2)
+    cache.put_many("model", {"a": [1.0]})
+    cache.put_many("model", {"b": [2.0]})
+    cache.get_many("model", ["a"])
+    cache.put_many("model", {"c": [3.0]})
+
+    assert set(cache.get_many("model", ["a", "b", "c"])) == {"a", "c"}
+    assert cache.stats()["evictions"] == 1
+
+
+def test_hash_matches_chunk_content_hash():
+    assert hash_text("some text") == generate_content_hash(Document(page_content="some text"))
@@ -0,0 +1,89 @@
+from pdf_qa.embedding_service import AdaptiveConcurrencyLimiter, BatchedEmbeddings, TokenBucket, is_rate_limit_error
+from langchain_core.embeddings import Embeddings
+import threading
+import pytest
+
+
+class FakeEmbeddings(Embeddings):
+    def __init__(self, failures=0):
+        self.failures = failures
+        self.requests = []
+        self._lock = threading.Lock()
+
+    def embed_documents(self, texts):
+        with self._lock:
+            self.requests.append(list(texts))
+            if self.failures:
+                self.failures -= 1
+                raise RuntimeError("Error embedding content: 429 Resource has been exhausted (e.g. check quota).")
+        return [[float(len(text))] for text in texts]
+
+    def embed_query(self, text):
+        return [float(len(text))]
+
+
+def test_embeds_in_ordered_batches():
+    fake = FakeEmbeddings()
+    embeddings = BatchedEmbeddings(fake, batch_size=3, max_concurrency=4, requests_per_minute=0)
+    texts = ["a" * i for i in range(1, 11)]
+
+    assert embeddings.embed_documents(texts) == [[float(i)] for i in range(1, 11)]
+    assert sorted(len(batch) for batch in fake.requests) == [1, 3, 3, 3]
+    assert embeddings.metrics()["chunks"] == 10
+
+
+def test_batches_are_bounded_by_characters():
+    embeddings = BatchedEmbeddings(FakeEmbeddings(), batch_size=10, batch_max_chars=5)
+    assert embeddings.make_batches(["aaa", "bb", "c", "dddddd"]) == [["aaa", "bb"], ["c"], ["dddddd"]]
+
+
+def test_retries_rate_limited_requests_and_backs_off():
+    sleeps = []
+    fake = FakeEmbeddings(failures=2)
+    embeddings = BatchedEmbeddings(fake, batch_size=5, max_concurrency=4, requests_per_minute=0, sleep=sleeps.append)
+
+    assert embeddings.embed_documents(["a", "b"]) == [[1.0], [1.0]]
+    metrics = embeddings.metrics()
+    assert metrics["rate_limited"] == 2
+    assert metrics["concurrency_limit"] < 4
+    assert len(sleeps) == 2
+
+
+def test_other_errors_are_not_retried():
+    class BrokenEmbeddings(FakeEmbeddings):
+        def embed_documents(self, texts):
+            raise ValueError("invalid input")
+
+    embeddings = BatchedEmbeddings(BrokenEmbeddings(), requests_per_minute=0)
+    with pytest.raises(ValueError):
+        embeddings.embed_documents(["a"])
+
+
+def test_limiter_halves_and_recovers():
+    limiter = AdaptiveConcurrencyLimiter(max_limit=8)
+    limiter.acquire()
+    limiter.release(is_rate_limited=True)
+    assert limiter.limit == 4
+    for _ in range(40):
+        limiter.acquire()
+        limiter.release()
+    assert limiter.limit == 8
+
+
+def test_token_bucket_waits_for_tokens():
+    now = [0.0]
+    sleeps = []
+
+    def sleep(seconds):
+        sleeps.append(seconds)
+        now[0] += seconds
+
+    bucket = TokenBucket(rate=2, capacity=1, clock=lambda: now[0], sleep=sleep)
+    bucket.acquire()
+    bucket.acquire()
+    assert sleeps == [0.5]
+
+
+def test_detects_rate_limit_errors():
+    assert is_rate_limit_error(RuntimeError("429 Too Many Requests"))
+    assert not is_rate_limit_error(RuntimeError("400 Bad Request"))
@@ -0,0 +1,96 @@
+from pdf_qa import chroma_handler, ingestion, ingestion_manifest
+from pdf_qa.chroma_handler import iter_chunks_with_ids
+from fpdf import FPDF
+import os
+import pytest
+
+
+class FakeStore:
+    def __init__(self):
+        self.ids = set()
+        self.added = []
+        self.deleted = []
+
+    def add(self, chunks, user_id="nobody", progress=None):
+        new_ids = [chunk.metadata['id'] for chunk in iter_chunks_with_ids(chunks) if chunk.metadata['id'] not in self.ids]
+        self.ids.update(new_ids)
+        self.added.append(new_ids)
+        return len(new_ids)
+
+    def delete(self, ids, user_id="nobody"):
+        self.ids.difference_update(ids)
+        self.deleted.extend(ids)
+
+
+def write_pdf(path, text):
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.write(5, text)
+    pdf.output(path)
+
+
+@pytest.fixture
+def store(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    fake_store = FakeStore()
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion_manifest, "get_manifest_path", lambda user_id: str(tmp_path / "manifest" / f"{user_id}.json"))
+    monkeypatch.setattr(ingestion, "add_to_chroma", fake_store.add)
+    monkeypatch.setattr(ingestion, "delete_from_chroma", fake_store.delete)
+    monkeypatch.delenv("AWS_EXECUTION_ENV", raising=False)
+    fake_store.source_dir = source_dir
+    return fake_store
+
+
+def test_only_new_files_are_ingested(store):
+    write_pdf(os.path.join(store.source_dir, "a.pdf"), "first file")
+    first = ingestion.ingest_user_documents("user")
+    assert first.ingested_files == ["a.pdf"]
+    assert first.chunks_added == 1
+
+    write_pdf(os.path.join(store.source_dir, "b.pdf"), "second file")
+    second = ingestion.ingest_user_documents("user")
+    assert second.ingested_files == ["b.pdf"]
+    assert second.unchanged_files == ["a.pdf"]
+    assert second.chunks_added == 1
+
+    manifest = ingestion_manifest.IngestionManifest.load("user")
+    assert set(manifest.entries) == {"a.pdf", "b.pdf"}
+    assert manifest.entries["b.pdf"].chunk_ids == store.added[-1]
+
+
+def test_replaced_and_removed_files_drop_stale_chunks(store):
+    path = os.path.join(store.source_dir, "a.pdf")
+    write_pdf(path, "old content")
+    ingestion.ingest_user_documents("user")
+    old_ids = set(store.ids)
+
+    write_pdf(path, "new content")
+    replaced = ingestion.ingest_user_documents("user")
+    assert replaced.ingested_files == ["a.pdf"]
+    assert replaced.stale_chunks_removed == 1
+    assert store.ids.isdisjoint(old_ids)
+
+    os.remove(path)
+    removed = ingestion.ingest_user_documents("user")
+    assert removed.removed_files == ["a.pdf"]
+    assert store.ids == set()
+    assert ingestion_manifest.IngestionManifest.load("user").entries == {}
+
+
+def test_cleared_database_is_ingested_again(store, monkeypatch):
+    class FakeBackend:
+        def clear(self, user_id):
+            store.ids.clear()
+
+    monkeypatch.setattr(chroma_handler, "get_vector_store_backend", lambda: FakeBackend())
+    write_pdf(os.path.join(store.source_dir, "a.pdf"), "content")
+    ingestion.ingest_user_documents("user")
+
+    chroma_handler.clear_database("user")
+    assert ingestion_manifest.IngestionManifest.load("user").entries == {}
+    again = ingestion.ingest_user_documents("user")
+    assert again.ingested_files == ["a.pdf"]
+    assert store.ids
@@ -0,0 +1,200 @@
+from fastapi.testclient import TestClient
+from botocore.exceptions import ClientError
+from ingestion_job import IngestionJobModel, run_ingestion_job
+from fpdf import FPDF
+from pdf_qa import ingestion, ingestion_manifest
+from pdf_qa.ingestion import IngestionResult
+from pdf_qa.ingestion_progress import IngestionProgress
+from pdf_qa.uploads import UploadResult
+import api_handler
+import json
+import threading
+import worker_handler
+
+
+def fake_ingest(user_id, content_hashes=None, progress=None):
+    with progress.stage("parse"):
+        progress.pages_parsed += 3
+        progress.chunks_split += 5
+    progress.report(force=True)
+    with progress.stage("store"):
+        progress.chunks_embedded += 5
+        progress.chunks_upserted += 5
+    progress.report(force=True)
+    return IngestionResult(ingested_files=list(content_hashes))
+
+
+def store_jobs(monkeypatch) -> dict[str, list[IngestionJobModel]]:
+    stored = {}
+
+    def put_item(self):
+        stored.setdefault(self.job_id, []).append(self.model_copy(deep=True))
+
+    def get_item(cls, user_id, job_id):
+        versions = stored.get(job_id)
+        return versions[-1] if versions and versions[-1].user_id == user_id else None
+
+    monkeypatch.setattr(IngestionJobModel, "put_item", put_item)
+    monkeypatch.setattr(IngestionJobModel, "get_item", classmethod(get_item))
+    return stored
+
+
+def test_job_is_stored_with_prefixed_key_and_without_created_at():
+    job = IngestionJobModel(user_id="user")
+    item = job.as_ddb_item()
+    assert item["query_id"] == f"ingest#{job.job_id}"
+    assert "created_at" not in item
+
+
+def test_progress_is_written_while_the_job_runs(monkeypatch):
+    stored = store_jobs(monkeypatch)
+    monkeypatch.setattr(ingestion, "ingest_user_documents", fake_ingest)
+
+    job = run_ingestion_job(IngestionJobModel(user_id="user", files=["a.pdf"], content_hashes={"a.pdf": "hash"}))
+
+    versions = stored[job.job_id]
+    assert [version.status for version in versions[:-1]] == ["running"] * (len(versions) - 1)
+    assert versions[-1].status == "succeeded"
+    assert any(version.pages_parsed == 3 and version.chunks_upserted == 0 for version in versions)
+    assert job.chunks_embedded == job.chunks_upserted == 5
+    assert set(job.stage_ms) == {"parse", "store"}
+    assert job.ingested_files == ["a.pdf"]
+    assert job.started_at and job.finished_at
+
+
+def test_failed_job_keeps_its_progress(monkeypatch):
+    stored = store_jobs(monkeypatch)
+
+    def failing_ingest(user_id, content_hashes=None, progress=None):
+        progress.pages_parsed += 1
+        raise RuntimeError("embedding quota exceeded")
+
+    monkeypatch.setattr(ingestion, "ingest_user_documents", failing_ingest)
+    job = run_ingestion_job(IngestionJobModel(user_id="user"))
+
+    assert stored[job.job_id][-1].status == "failed"
+    assert job.error == "embedding quota exceeded"
+    assert job.pages_parsed == 1
+
+
+def test_job_fails_when_the_vector_store_is_unavailable(tmp_path, monkeypatch):
+    stored = store_jobs(monkeypatch)
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    pdf = FPDF()
+    pdf.add_page()
+    pdf.set_font("Arial", size=12)
+    pdf.write(5, "page")
+    pdf.output(str(source_dir / "a.pdf"))
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion_manifest, "get_manifest_path", lambda user_id: str(tmp_path / "manifest" / f"{user_id}.json"))
+    monkeypatch.setattr(ingestion, "add_to_chroma", lambda chunks, user_id="nobody", progress=None: None)
+    monkeypatch.delenv("AWS_EXECUTION_ENV", raising=False)
+
+    job = run_ingestion_job(IngestionJobModel(user_id="user", files=["a.pdf"]))
+
+    assert stored[job.job_id][-1].status == "failed"
+    assert "not available" in job.error
+    assert job.ingested_files == []
+    assert ingestion_manifest.IngestionManifest.load("user").entries == {}
+
+
+def test_upload_returns_the_job_before_it_runs(monkeypatch):
+    stored = store_jobs(monkeypatch)
+    release = threading.Event()
+
+    def slow_ingest(user_id, content_hashes=None, progress=None):
+        assert release.wait(5)
+        return fake_ingest(user_id, content_hashes, progress)
+
+    async def upload_documents(documents, **kwargs):
+        return [UploadResult(filename=document.filename, size=3, content_hash="hash") for document in documents]
+
+    monkeypatch.setattr(ingestion, "ingest_user_documents", slow_ingest)
+    monkeypatch.setattr(api_handler, "upload_documents", upload_documents)
+    monkeypatch.setattr(api_handler, "WORKER_LAMBDA_NAME", None)
+    monkeypatch.setattr(api_handler, "LOCAL_WORKER_CONCURRENCY", 1)
+    monkeypatch.delenv("AWS_EXECUTION_ENV", raising=False)
+
+    with TestClient(api_handler.app) as client:
+        response = client.post("/users/user/documents", files=[("documents", ("a.pdf", b"pdf", "application/pdf"))])
+        assert response.status_code == 200
+        body = response.json()
+        assert body["uploaded_files"] == ["a.pdf"]
+        assert body["status"] == "pending"
+        release.set()
+
+    job = client.get(f"/users/user/ingestion-jobs/{body['job_id']}").json()
+    assert job["status"] == "succeeded"
+    assert job["chunks_upserted"] == 5
+    assert set(job["stage_ms"]) == {"parse", "store"}
+    assert client.get(f"/users/other/ingestion-jobs/{body['job_id']}").status_code == 404
+    assert [version.status for version in stored[body["job_id"]]][:2] == ["pending", "running"]
+
+
+def test_worker_runs_ingestion_events(monkeypatch):
+    ran = []
+    monkeypatch.setattr(worker_handler, "run_ingestion_job", ran.append)
+
+    job = IngestionJobModel(user_id="user", files=["a.pdf"])
+    assert worker_handler.handler(job.as_worker_event(), None) is None
+    assert ran == [job]
+
+
+def test_jobs_are_queued_in_the_message_group_of_their_user(monkeypatch):
+    sent = []
+
+    class FakeSQS:
+        def send_message(self, **kwargs):
+            sent.append(kwargs)
+            return {"MessageId": "m1"}
+
+    monkeypatch.setattr(api_handler, "INGESTION_QUEUE_URL", "https://sqs/ingestion.fifo")
+    monkeypatch.setattr(api_handler, "get_sqs_client", lambda: FakeSQS())
+    job = IngestionJobModel(user_id="user", files=["a.pdf"])
+    api_handler.invoke_ingestion_worker(job)
+
+    [message] = sent
+    assert message["MessageGroupId"] == "user"
+    assert message["MessageDeduplicationId"] == job.job_id
+    assert json.loads(message["MessageBody"]) == job.as_worker_event()
+
+
+def test_worker_runs_ingestion_queue_records_in_order(monkeypatch):
+    ran = []
+
+    def run_job(job):
+        if job.user_id == "unstored":
+            raise ClientError({"Error": {"Code": "InternalServerError", "Message": "failed"}}, "PutItem")
+        ran.append(job.user_id)
+
+    monkeypatch.setattr(worker_handler, "run_ingestion_job", run_job)
+    jobs = [IngestionJobModel(user_id=user_id) for user_id in ("a", "unstored", "b")]
+    records = [{"messageId": f"m{i}", "body": json.dumps(job.as_worker_event())} for i, job in enumerate(jobs)]
+
+    assert worker_handler.handler({"Records": records[:1]}, None) == {"batchItemFailures": []}
+    assert ran == ["a"]
+    # A later job must not overtake the one which is retried
+    assert worker_handler.handler({"Records": records}, None) == {"batchItemFailures": [{"itemIdentifier": "m1"}, {"itemIdentifier": "m2"}]}
+    assert ran == ["a", "a"]
+
+
+def test_jobs_are_not_returned_as_queries(monkeypatch):
+    def get_item(cls, user_id, query_id):
+        raise AssertionError("the table must not be read")
+
+    monkeypatch.setattr(api_handler.QueryModel, "get_item", classmethod(get_item))
+    client = TestClient(api_handler.app)
+    assert client.get("/users/user/queries/ingest%23abc").status_code == 404
+    assert client.get("/users/user/queries/ingest%23abc/wait").status_code == 404
+
+
+def test_progress_reports_are_throttled():
+    reports = []
+    progress = IngestionProgress(listener=lambda progress: reports.append(progress.pages_parsed), report_interval=60)
+    for _ in progress.track(range(10), "pages_parsed", stage="parse"):
+        pass
+    progress.report(force=True)
+
+    assert reports == [1, 10]
+    assert "parse" in progress.stage_ms
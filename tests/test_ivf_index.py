@@ -0,0 +1,81 @@
+from pdf_qa.ivf_index import IVFIndex, normalize_rows
+from pdf_qa.local_vector_store import LocalVectorStore
+import numpy as np
+
+
+def make_vectors(count, dimension=32, clusters=20, seed=0):
+    rng = np.random.default_rng(seed)
+    centers = rng.normal(size=(clusters, dimension))
+    vectors = centers[rng.integers(clusters, size=count)] + 0.3 * rng.normal(size=(count, dimension))
+    return normalize_rows(vectors)
+
+
+def exact_top_k(vectors, query, k):
+    return set(np.argsort(-(vectors @ query))[:k].tolist())
+
+
+def recall_at_k(index, vectors, queries, k=5, nprobe=None):
+    hits = 0
+    for query in queries:
+        candidates = index.candidates(query, nprobe)
+        top = candidates[np.argsort(-(vectors[candidates] @ query))[:k]]
+        hits += len(exact_top_k(vectors, query, k) & set(top.tolist()))
+    return hits / (k * len(queries))
+
+
+def test_recall_grows_with_nprobe_and_is_exact_at_nlist():
+    vectors = make_vectors(4000)
+    queries = make_vectors(50, seed=1)
+    index = IVFIndex.train(vectors, nlist=32)
+
+    assert sorted(np.concatenate(index._lists).tolist()) == list(range(4000))
+    low, high = recall_at_k(index, vectors, queries, nprobe=1), recall_at_k(index, vectors, queries, nprobe=8)
+    assert low <= high
+    assert high >= 0.9
+    assert recall_at_k(index, vectors, queries, nprobe=32) == 1.0
+
+
+def test_incremental_add_and_persistence(tmp_path):
+    vectors = make_vectors(3000)
+    index = IVFIndex.train(vectors[:2000], nlist=16)
+    index.save(str(tmp_path))
+    index.save(str(tmp_path), appended_labels=index.add(vectors[2000:]))
+
+    loaded = IVFIndex.load(str(tmp_path), rows=3000)
+    assert np.array_equal(loaded.assignments, index.assignments)
+    query = vectors[2500]
+    assert 2500 in loaded.candidates(query, nprobe=1).tolist()
+    assert IVFIndex.load(str(tmp_path), rows=3001) is None
+
+
+class MatrixEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return self.vectors[[int(text) for text in texts]].tolist()
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+
+def test_store_switches_to_the_index_and_reloads_it(tmp_path):
+    vectors = make_vectors(1500)
+    embeddings = MatrixEmbeddings(vectors)
+    store = LocalVectorStore(str(tmp_path), embeddings, ann_min_vectors=1000, nprobe=4)
+    store.add_texts([str(i) for i in range(800)], ids=[str(i) for i in range(800)])
+    assert store.index is None
+
+    store.add_texts([str(i) for i in range(800, 1500)], ids=[str(i) for i in range(800, 1500)])
+    assert store.index is not None
+    assert len(store.index.assignments) == 1500
+
+    reloaded = LocalVectorStore(str(tmp_path), embeddings, ann_min_vectors=1000, nprobe=4)
+    assert np.array_equal(reloaded.index.assignments, store.index.assignments)
+    doc, score = reloaded.similarity_search_with_score("1234", k=1)[0]
+    assert doc.id == "1234"
+    assert score > 0.99
+
+    reloaded.delete([str(i) for i in range(1000)])
+    assert reloaded.index is None
+    assert reloaded.similarity_search("1234", k=1)[0].id == "1234"
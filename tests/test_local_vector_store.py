@@ -0,0 +1,137 @@
+from pdf_qa import chroma_handler, query_handler, vector_store
+from pdf_qa.chroma_handler import add_to_chroma, clear_database, delete_from_chroma
+from pdf_qa.chroma_pool import RelevanceChroma
+from pdf_qa.local_vector_store import LocalVectorStore, LocalVectorStoreBackend
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+import chromadb
+import pytest
+
+
+class KeywordEmbeddings(Embeddings):
+    """
+    Embeds a text as the counts of a few keywords, so similarities are predictable.
+    """
+
+    KEYWORDS = ["apple", "banana", "cherry", "durian"]
+
+    def embed_documents(self, texts):
+        return [self.embed_query(text) for text in texts]
+
+    def embed_query(self, text):
+        return [float(text.count(keyword)) + 0.01 for keyword in self.KEYWORDS]
+
+
+def make_store(tmp_path):
+    return LocalVectorStore(str(tmp_path / "store"), KeywordEmbeddings())
+
+
+def test_search_returns_top_k_by_cosine_similarity(tmp_path):
+    store = make_store(tmp_path)
+    store.add_texts(["apple apple", "banana", "cherry", "apple banana"], ids=["a", "b", "c", "ab"])
+
+    results = store.similarity_search_with_score("apple", k=2)
+    assert [doc.id for doc, _ in results] == ["a", "ab"]
+    assert results[0][1] == pytest.approx(1.0, abs=0.01)
+    assert results[0][1] > results[1][1]
+
+
+def test_store_is_persisted_and_reloaded(tmp_path):
+    store = make_store(tmp_path)
+    store.add_texts(["apple", "banana"], metadatas=[{"page": 1}, {"page": 2}], ids=["a", "b"])
+    store.delete(["a"])
+
+    reloaded = make_store(tmp_path)
+    assert reloaded.get()["ids"] == ["b"]
+    assert reloaded.get(ids=["a", "b"], include=[]) == {"ids": ["b"]}
+    doc, _ = reloaded.similarity_search_with_score("apple", k=1)[0]
+    assert doc.metadata == {"page": 2}
+
+
+def test_re_adding_an_id_replaces_it(tmp_path):
+    store = make_store(tmp_path)
+    store.add_texts(["apple"], ids=["x"])
+    store.add_texts(["durian"], ids=["x"])
+
+    assert store.count() == 1
+    assert store.similarity_search("durian", k=5)[0].page_content == "durian"
+    assert make_store(tmp_path).get()["documents"] == ["durian"]
+
+
+def test_deleted_rows_are_compacted(tmp_path):
+    store = make_store(tmp_path)
+    store.add_texts([f"apple {i}" for i in range(10)], ids=[str(i) for i in range(10)])
+    store.delete([str(i) for i in range(7)])
+
+    assert store.count() == 3
+    assert store._matrix.shape[0] == 3
+    assert sorted(make_store(tmp_path).get()["ids"]) == ["7", "8", "9"]
+
+
+def test_local_backend_serves_the_pipeline(tmp_path, monkeypatch):
+    monkeypatch.setattr(vector_store, "VECTOR_STORE_BACKEND", "local")
+    monkeypatch.setitem(
+        vector_store._backends,
+        "local",
+        LocalVectorStoreBackend(lambda user_id: str(tmp_path / user_id), KeywordEmbeddings)
+    )
+    chunks = [
+        Document(page_content="apple apple", metadata={"source": "data/fruit.pdf", "page": 0}),
+        Document(page_content="banana", metadata={"source": "data/fruit.pdf", "page": 1}),
+    ]
+
+    assert add_to_chroma(chunks, "user") == 2
+    assert add_to_chroma(chunks, "user") == 0
+    db = chroma_handler.get_chroma_db("user")
+    results = query_handler.retrieve_results(db, "apple")
+    assert results[0][0].metadata["source"] == "data/fruit.pdf"
+    assert query_handler.get_sources(results)[0].page == 0
+
+    delete_from_chroma([chunks[0].metadata["id"]], "user")
+    assert db.count() == 1
+    clear_database("user")
+    assert db.count() == 0
+    assert not (tmp_path / "user").exists()
+
+
+class UnitKeywordEmbeddings(KeywordEmbeddings):
+    def embed_query(self, text):
+        vector = super().embed_query(text)
+        norm = sum(value * value for value in vector) ** 0.5
+        return [value / norm for value in vector]
+
+
+def test_backends_score_with_the_same_convention(tmp_path):
+    texts = ["apple apple", "banana", "apple banana cherry", "durian"]
+    ids = ["a", "b", "abc", "d"]
+    local = LocalVectorStore(str(tmp_path / "store"), UnitKeywordEmbeddings())
+    local.add_texts(texts, ids=ids)
+    chroma = RelevanceChroma(collection_name="convention", embedding_function=UnitKeywordEmbeddings(), client=chromadb.EphemeralClient())
+    chroma.add_texts(texts, ids=ids)
+
+    query = UnitKeywordEmbeddings().embed_query("apple")
+    local_scores = {doc.id: score for doc, score in local.similarity_search_by_vector_with_relevance_scores(query, k=4)}
+    chroma_scores = {doc.id: score for doc, score in chroma.similarity_search_by_vector_with_relevance_scores(query, k=4)}
+    chroma.delete_collection()
+    assert chroma_scores == pytest.approx(local_scores, abs=1e-4)
+
+
+def test_backend_reloads_stores_written_by_another_process(tmp_path):
+    query_server = LocalVectorStoreBackend(lambda user_id: str(tmp_path / user_id), KeywordEmbeddings)
+    ingestion_worker = LocalVectorStoreBackend(lambda user_id: str(tmp_path / user_id), KeywordEmbeddings)
+    assert query_server.get("user").count() == 0
+
+    ingestion_worker.get("user").add_texts(["apple"], ids=["a"])
+    store = query_server.get("user")
+    assert store.count() == 1
+
+    # The server's own writes don't make it reload
+    store.add_texts(["banana"], ids=["b"])
+    assert query_server.get("user") is store
+    ingestion_worker.get("user").delete(["a"])
+    assert query_server.get("user").get()["ids"] == ["b"]
+
+
+def test_unknown_backend_is_rejected():
+    with pytest.raises(ValueError):
+        vector_store.get_vector_store_backend("unknown")
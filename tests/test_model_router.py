@@ -0,0 +1,160 @@
+from pdf_qa import model_router, query_cache, query_handler
+from pdf_qa.model_router import (
+    FAST_MODEL,
+    PRIMARY_MODEL,
+    RoutingDecision,
+    RoutingInfo,
+    ainvoke_with_fallback,
+    invoke_with_fallback,
+    route,
+    stream_with_fallback,
+)
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from query_model import QueryModel
+import api_handler
+import asyncio
+import pytest
+import time
+
+
+class FakeLLM:
+    def __init__(self, answer, delay=0.0, error=None):
+        self.answer = answer
+        self.delay = delay
+        self.error = error
+
+    def invoke(self, prompt):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.answer
+
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(self.delay)
+        if self.error:
+            raise self.error
+        return self.answer
+
+    def stream(self, prompt):
+        time.sleep(self.delay)
+        if self.error:
+            raise self.error
+        yield from self.answer.split(" ")
+
+
+def make_factory(primary, fast):
+    return lambda model: primary if model == PRIMARY_MODEL else fast
+
+
+def primary_decision(deadline=0.1):
+    return RoutingDecision(PRIMARY_MODEL, "long query or large context", "standard", deadline, FAST_MODEL)
+
+
+def test_short_query_with_small_context_goes_to_the_fast_model():
+    decision = route("What is the title?", 200, "user")
+    assert decision.model == FAST_MODEL
+    assert decision.fallback_model is None
+
+    decision = route("What is the title?", 5000, "user")
+    assert decision.model == PRIMARY_MODEL
+    assert decision.fallback_model == FAST_MODEL
+
+
+def test_premium_users_get_the_primary_model(monkeypatch):
+    monkeypatch.setattr(model_router, "PREMIUM_USER_IDS", {"vip"})
+    decision = route("What is the title?", 200, "vip")
+    assert decision.model == PRIMARY_MODEL
+    assert decision.tier == "premium"
+
+
+def test_slow_primary_falls_back_to_fast_model():
+    factory = make_factory(FakeLLM("slow", delay=1.0), FakeLLM("fast"))
+    answer, info = invoke_with_fallback("prompt", primary_decision(), llm_factory=factory)
+
+    assert answer == "fast"
+    assert info.model == FAST_MODEL
+    assert info.routed_model == PRIMARY_MODEL
+    assert info.fell_back
+    assert info.fallback_reason == "deadline exceeded"
+    assert info.generation_ms < 1000
+
+
+def test_failing_primary_falls_back_to_fast_model():
+    factory = make_factory(FakeLLM("", error=RuntimeError("quota")), FakeLLM("fast"))
+    answer, info = asyncio.run(ainvoke_with_fallback("prompt", primary_decision(), llm_factory=factory))
+
+    assert answer == "fast"
+    assert info.fallback_reason == "error: RuntimeError"
+
+
+def test_error_without_fallback_is_raised():
+    decision = RoutingDecision(FAST_MODEL, "short query and small context", "standard", 1.0, None)
+    with pytest.raises(RuntimeError):
+        invoke_with_fallback("prompt", decision, llm_factory=lambda model: FakeLLM("", error=RuntimeError()))
+
+
+def test_slow_model_without_fallback_is_waited_for():
+    # A deadline without a fallback would only turn a slow answer into a failed query
+    decision = RoutingDecision(FAST_MODEL, "short query and small context", "standard", 0.05, None)
+    factory = lambda model: FakeLLM("slow fast answer", delay=0.2)
+
+    answer, info = invoke_with_fallback("prompt", decision, llm_factory=factory)
+    assert answer == "slow fast answer"
+    assert not info.fell_back
+    answer, _ = asyncio.run(ainvoke_with_fallback("prompt", decision, llm_factory=factory))
+    assert answer == "slow fast answer"
+    info = RoutingInfo.for_decision(decision)
+    assert list(stream_with_fallback("prompt", decision, info, llm_factory=factory)) == ["slow", "fast", "answer"]
+    assert route("What is the title?", 200, "user").deadline is None
+
+
+def test_stream_falls_back_when_the_first_chunk_is_late():
+    decision = primary_decision()
+    info = RoutingInfo.for_decision(decision)
+    factory = make_factory(FakeLLM("slow answer", delay=1.0), FakeLLM("fast answer"))
+
+    assert list(stream_with_fallback("prompt", decision, info, llm_factory=factory)) == ["fast", "answer"]
+    assert info.fell_back
+    assert info.model == FAST_MODEL
+
+
+def test_stream_keeps_the_primary_model_when_it_answers_in_time():
+    decision = primary_decision(deadline=1.0)
+    info = RoutingInfo.for_decision(decision)
+    factory = make_factory(FakeLLM("primary answer"), FakeLLM("fast answer"))
+
+    assert list(stream_with_fallback("prompt", decision, info, llm_factory=factory)) == ["primary", "answer"]
+    assert not info.fell_back
+
+
+def test_routing_is_stored_with_the_query(monkeypatch):
+    class FakeEmbeddings:
+        model = "fake-model"
+
+        async def aembed_query(self, text):
+            return [1.0, 0.0]
+
+    class FakeDB:
+        embeddings = FakeEmbeddings()
+
+        async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+            return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+    stored = []
+
+    async def aput_item(self):
+        stored.append(self.model_copy())
+
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "none")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM(f"answer from {model}"))
+    monkeypatch.setattr(api_handler, "WORKER_LAMBDA_NAME", None)
+    monkeypatch.setattr(QueryModel, "aput_item", aput_item)
+    response = TestClient(api_handler.app).post("/users/user/queries", json={"query_text": "Short question?"})
+
+    assert response.status_code == 200
+    assert response.json()["answer_text"] == f"answer from {FAST_MODEL}"
+    routing = stored[-1].as_ddb_item()["routing"]
+    assert routing["model"] == FAST_MODEL
+    assert isinstance(routing["generation_ms"], int)
@@ -0,0 +1,39 @@
+from pdf_qa.pdf_extraction import extract_pdf_documents, list_pdf_files
+from langchain_community.document_loaders import PyPDFDirectoryLoader
+from fpdf import FPDF
+import os
+
+
+def write_pdf(path, pages):
+    pdf = FPDF()
+    # Document information which the parser normalizes: padded strings and a PDF date
+    pdf.set_title(" Title ")
+    pdf.set_author("Author")
+    pdf.set_font("Arial", size=12)
+    for text in pages:
+        pdf.add_page()
+        pdf.write(5, text)
+    pdf.output(path)
+
+
+def test_matches_directory_loader(tmp_path):
+    write_pdf(os.path.join(tmp_path, "long.pdf"), [f"page {i} of the long file" for i in range(7)])
+    write_pdf(os.path.join(tmp_path, "short.pdf"), ["only page"])
+    write_pdf(os.path.join(tmp_path, ".hidden.pdf"), ["hidden"])
+
+    expected = PyPDFDirectoryLoader(tmp_path).load()
+    actual = extract_pdf_documents(list_pdf_files(str(tmp_path)), max_workers=2, pages_per_task=3)
+
+    assert [doc.page_content for doc in actual] == [doc.page_content for doc in expected]
+    assert [doc.metadata for doc in actual] == [doc.metadata for doc in expected]
+
+
+def test_serial_and_parallel_extraction_are_identical(tmp_path):
+    path = os.path.join(tmp_path, "file.pdf")
+    write_pdf(path, [f"page {i}" for i in range(5)])
+
+    serial = extract_pdf_documents([path], max_workers=1, pages_per_task=2)
+    parallel = extract_pdf_documents([path], max_workers=3, pages_per_task=2)
+
+    assert serial == parallel
+    assert [doc.metadata["page"] for doc in parallel] == [0, 1, 2, 3, 4]
@@ -0,0 +1,126 @@
+from pdf_qa import query_cache, query_handler
+from pdf_qa.query_cache import DynamoDBCacheBackend, InMemoryCacheBackend, QueryCache, normalize_query
+from pdf_qa.query_handler import Source, process_query
+from langchain_core.documents import Document
+from langchain_core.embeddings import Embeddings
+from botocore.exceptions import ClientError
+import pytest
+
+
+class CountingEmbeddings(Embeddings):
+    model = "fake-model"
+
+    def __init__(self):
+        self.queries = []
+
+    def embed_documents(self, texts):
+        return [[1.0, 0.0] for _ in texts]
+
+    def embed_query(self, text):
+        self.queries.append(text)
+        return [1.0, 0.0]
+
+
+class FakeDB:
+    def __init__(self):
+        self.embeddings = CountingEmbeddings()
+        self.searches = 0
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        self.searches += 1
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:2:0:abcd1234"}), 0.9)]
+
+
+class FakeLLM:
+    calls = 0
+
+    def __init__(self, **kwargs):
+        pass
+
+    def invoke(self, prompt):
+        FakeLLM.calls += 1
+        return "answer"
+
+
+@pytest.fixture
+def cache(monkeypatch):
+    cache = QueryCache(InMemoryCacheBackend())
+    monkeypatch.setattr(query_cache, "_query_cache", cache)
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "memory")
+    return cache
+
+
+@pytest.fixture
+def db(monkeypatch):
+    fake_db = FakeDB()
+    FakeLLM.calls = 0
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": fake_db)
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM())
+    return fake_db
+
+
+def test_repeated_query_is_answered_from_cache(cache, db):
+    first = process_query("What is  the answer?", "user")
+    second = process_query("what is the answer?", "user")
+
+    assert second == first
+    assert second.sources == [Source(filename="file.pdf", page=2)]
+    assert FakeLLM.calls == 1
+    assert db.searches == 1
+    assert cache.stats()["hits"] == 1
+
+
+def test_corpus_change_invalidates_only_that_users_answers(cache, db):
+    process_query("question", "user")
+    process_query("question", "other")
+    query_cache.bump_corpus_version("user")
+
+    process_query("question", "user")
+    process_query("question", "other")
+
+    assert FakeLLM.calls == 3
+    # The query embedding survives the corpus change
+    assert db.embeddings.queries == ["question"]
+
+
+def test_in_memory_backend_expires_and_evicts():
+    now = [0.0]
+    backend = InMemoryCacheBackend(max_entries=2, clock=lambda: now[0])
+    backend.set("a", 1, ttl_seconds=10)
+    backend.set("b", 2)
+    backend.set("c", 3)
+    assert backend.get("a") is None
+    assert backend.get("b") == 2
+
+    backend.set("d", 4, ttl_seconds=10)
+    now[0] = 11
+    assert backend.get("d") is None
+    assert backend.get("b") == 2
+
+
+def test_corpus_versions_are_never_evicted():
+    backend = InMemoryCacheBackend(max_entries=1)
+    backend.increment("corpus_version#user")
+    backend.set("a", 1)
+    backend.set("b", 2)
+    assert backend.get_counter("corpus_version#user") == 1
+
+
+def test_normalize_query():
+    assert normalize_query("  What IS\tthis?\n") == "what is this?"
+
+
+def test_shared_backend_is_the_default_on_aws():
+    assert query_cache.get_default_cache_backend({}) == "memory"
+    assert query_cache.get_default_cache_backend({"AWS_EXECUTION_ENV": "AWS_Lambda_python3.11"}) == "dynamodb"
+    assert query_cache.get_default_cache_backend({"WORKER_QUEUE_URL": "https://sqs"}) == "dynamodb"
+
+
+def test_failed_corpus_version_bump_does_not_raise():
+    class FailingTable:
+        def update_item(self, **kwargs):
+            raise ClientError({"Error": {"Code": "ProvisionedThroughputExceededException", "Message": "slow down"}}, "UpdateItem")
+
+    backend = DynamoDBCacheBackend.__new__(DynamoDBCacheBackend)
+    backend.table = FailingTable()
+    assert QueryCache(backend).bump_corpus_version("user") == 0
@@ -0,0 +1,103 @@
+from botocore.exceptions import ClientError
+from pdf_qa.model_router import RoutingInfo
+from pdf_qa.query_handler import Source
+from query_model import LIST_PROJECTION, QueryModel
+import pytest
+import query_model
+import threading
+
+
+class FakeTable:
+    def __init__(self, exists=True):
+        self.exists = exists
+        self.calls = []
+
+    def update_item(self, **kwargs):
+        self.calls.append(("update_item", kwargs))
+        if not self.exists:
+            raise ClientError({"Error": {"Code": "ConditionalCheckFailedException", "Message": "failed"}}, "UpdateItem")
+        return {}
+
+    def put_item(self, **kwargs):
+        self.calls.append(("put_item", kwargs))
+        return {}
+
+    def query(self, **kwargs):
+        self.calls.append(("query", kwargs))
+        return {"Items": [{"query_id": "q1", "user_id": "user", "created_at": 1, "ttl": 2, "query_text": "question", "is_complete": True}]}
+
+
+@pytest.fixture
+def table(monkeypatch):
+    table = FakeTable()
+    monkeypatch.setattr(QueryModel, "get_table", classmethod(lambda cls: table))
+    return table
+
+
+def make_answered_query():
+    return QueryModel(
+        query_id="q1",
+        user_id="user",
+        query_text="question",
+        answer_text="answer",
+        sources=[Source(filename="file.pdf", page=1)],
+        is_complete=True,
+        routing=RoutingInfo(model="fast", routed_model="fast", reason="short query and small context"),
+    )
+
+
+def test_update_answer_writes_only_the_answer_fields(table):
+    make_answered_query().update_answer()
+
+    [(method, kwargs)] = table.calls
+    assert method == "update_item"
+    assert kwargs["Key"] == {"query_id": "q1", "user_id": "user"}
+    assert set(kwargs["ExpressionAttributeNames"].values()) == {"answer_text", "sources", "routing", "is_complete"}
+    assert kwargs["ExpressionAttributeValues"][":sources"] == [{"filename": "file.pdf", "page": 1}]
+    assert "query_text" not in kwargs["UpdateExpression"]
+
+
+def test_update_answer_puts_queries_which_were_never_stored(table):
+    table.exists = False
+    make_answered_query().update_answer()
+    assert [method for method, _ in table.calls] == ["update_item", "put_item"]
+    assert table.calls[1][1]["Item"]["query_text"] == "question"
+
+
+def test_list_items_reads_only_the_listed_attributes(table):
+    [item] = QueryModel.list_items("user", 25)
+
+    kwargs = table.calls[0][1]
+    assert sorted(kwargs["ExpressionAttributeNames"].values()) == sorted(LIST_PROJECTION)
+    assert "#ttl" in kwargs["ProjectionExpression"]
+    assert item.query_text == "question"
+    assert item.answer_text is None
+
+    QueryModel.list_items("user", 25, projection=None)
+    assert "ProjectionExpression" not in table.calls[1][1]
+
+
+def test_table_handle_is_reused_per_thread(monkeypatch):
+    sessions = []
+
+    class FakeSession:
+        def __init__(self):
+            sessions.append(self)
+
+        def resource(self, name):
+            return self
+
+        def Table(self, name):
+            return object()
+
+    monkeypatch.setattr(query_model, "TABLE_NAME", "table")
+    monkeypatch.setattr(query_model.boto3.session, "Session", FakeSession)
+    monkeypatch.setattr(query_model, "_thread_local", threading.local())
+
+    assert QueryModel.get_table() is QueryModel.get_table()
+    other = []
+    thread = threading.Thread(target=lambda: other.append(QueryModel.get_table()))
+    thread.start()
+    thread.join()
+    assert other[0] is not QueryModel.get_table()
+    assert len(sessions) == 2
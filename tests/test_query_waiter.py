@@ -0,0 +1,118 @@
+from pdf_qa import query_cache, query_handler
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from query_model import QueryModel
+from query_waiter import notify_complete, wait_for_completion
+import api_handler
+import asyncio
+import pytest
+
+
+class FakeStore:
+    """
+    Stands in for the table: the query is complete from the `complete_after`-th read on.
+    """
+
+    def __init__(self, complete_after=None):
+        self.complete_after = complete_after
+        self.reads = 0
+        self.items = {}
+
+    async def aget_item(self, user_id, query_id):
+        self.reads += 1
+        item = self.items.get((user_id, query_id))
+        if item is not None and self.complete_after is not None and self.reads >= self.complete_after:
+            item.is_complete = True
+        return item.model_copy() if item else None
+
+
+@pytest.fixture
+def store(monkeypatch):
+    store = FakeStore()
+    monkeypatch.setattr(QueryModel, "aget_item", classmethod(lambda cls, *args, **kwargs: store.aget_item(*args, **kwargs)))
+    return store
+
+
+def add_query(store, query_id="q1"):
+    query = QueryModel(query_id=query_id, user_id="user", query_text="question")
+    store.items[("user", query_id)] = query
+    return query
+
+
+def test_reads_back_off_until_the_query_is_complete(store):
+    add_query(store)
+    store.complete_after = 4
+    result = asyncio.run(wait_for_completion("user", "q1", timeout=5, initial_delay=0.01, max_delay=0.02))
+
+    assert result.query.is_complete
+    assert result.reads == 4
+    assert not result.notified
+
+
+def test_wait_times_out_with_the_incomplete_query(store):
+    add_query(store)
+    result = asyncio.run(wait_for_completion("user", "q1", timeout=0.2, initial_delay=0.05, max_delay=0.1))
+
+    assert not result.query.is_complete
+    # Reads at 0, 0.05, 0.15 and 0.2 seconds, instead of one every poll
+    assert result.reads <= 4
+
+
+def test_notification_completes_the_wait_without_reading_again(store):
+    query = add_query(store)
+
+    async def run():
+        waiting = asyncio.create_task(wait_for_completion("user", "q1", timeout=5, initial_delay=1))
+        await asyncio.sleep(0.05)
+        notify_complete(query.model_copy(update={"is_complete": True, "answer_text": "answer"}))
+        return await waiting
+
+    result = asyncio.run(run())
+    assert result.notified
+    assert result.reads == 1
+    assert result.query.answer_text == "answer"
+    assert result.waited_ms < 1000
+
+
+def test_missing_query_is_not_found(store):
+    response = TestClient(api_handler.app).get("/users/user/queries/missing/wait", params={"timeout": 1})
+    assert response.status_code == 404
+
+
+def test_wait_route_returns_the_answer_of_the_background_worker(store, monkeypatch):
+    class FakeEmbeddings:
+        model = "fake-model"
+
+        async def aembed_query(self, text):
+            return [1.0, 0.0]
+
+    class FakeDB:
+        embeddings = FakeEmbeddings()
+
+        async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+            return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+    class FakeLLM:
+        async def ainvoke(self, prompt):
+            await asyncio.sleep(0.2)
+            return "answer"
+
+    async def aput_item(self):
+        store.items[(self.user_id, self.query_id)] = self.model_copy()
+
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "none")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM())
+    monkeypatch.setattr(QueryModel, "aput_item", aput_item)
+    monkeypatch.setattr(QueryModel, "aupdate_answer", aput_item)
+    monkeypatch.setattr(api_handler, "WORKER_LAMBDA_NAME", None)
+    monkeypatch.setattr(api_handler, "LOCAL_WORKER_CONCURRENCY", 1)
+
+    with TestClient(api_handler.app) as client:
+        query_id = client.post("/users/user/queries", json={"query_text": "question"}).json()["query_id"]
+        response = client.get(f"/users/user/queries/{query_id}/wait", params={"timeout": 5})
+
+    assert response.status_code == 200
+    assert response.json()["is_complete"]
+    assert response.json()["answer_text"] == "answer"
+    assert response.headers["X-Query-Reads"] == "1"
@@ -0,0 +1,53 @@
+from pdf_qa.s3_sync import list_s3_files, sync_s3_files
+import os
+
+
+class FakePaginator:
+    def __init__(self, pages):
+        self.pages = pages
+
+    def paginate(self, Bucket, Prefix):
+        return iter(self.pages)
+
+
+class FakeS3:
+    def __init__(self, objects):
+        self.objects = objects
+        self.downloads = []
+
+    def get_paginator(self, name):
+        keys = sorted(self.objects)
+        pages = [
+            {"Contents": [{"Key": key, "Size": len(self.objects[key][0]), "ETag": f'"{self.objects[key][1]}"'} for key in keys[i:i + 2]]}
+            for i in range(0, len(keys), 2)
+        ]
+        return FakePaginator(pages)
+
+    def download_file(self, bucket, key, path):
+        self.downloads.append(key)
+        with open(path, "wb") as file:
+            file.write(self.objects[key][0])
+
+
+def test_lists_every_page():
+    s3 = FakeS3({f"source/user/{i}.pdf": (b"x", "etag") for i in range(5)})
+    remote_files = list_s3_files("source/user/", s3)
+    assert [remote_file.filename for remote_file in remote_files] == [f"{i}.pdf" for i in range(5)]
+
+
+def test_skips_files_matching_their_sidecar(tmp_path):
+    s3 = FakeS3({
+        "source/user/a.pdf": (b"aaaa", "etag-a"),
+        "source/user/b.pdf": (b"bb", "etag-b"),
+    })
+    first = sync_s3_files(list_s3_files("source/user/", s3), str(tmp_path), s3, max_workers=2)
+    assert sorted(first.downloaded_files) == ["a.pdf", "b.pdf"]
+    assert first.bytes_transferred == 6
+
+    s3.objects["source/user/b.pdf"] = (b"bbb", "etag-b2")
+    second = sync_s3_files(list_s3_files("source/user/", s3), str(tmp_path), s3, max_workers=2)
+    assert second.downloaded_files == ["b.pdf"]
+    assert second.skipped_files == ["a.pdf"]
+    assert second.bytes_transferred == 3
+    assert second.bytes_skipped == 4
+    assert open(os.path.join(tmp_path, "b.pdf"), "rb").read() == b"bbb"
@@ -0,0 +1,80 @@
+from pdf_qa import query_cache, query_handler
+from pdf_qa.query_cache import InMemoryCacheBackend, QueryCache
+from fastapi.testclient import TestClient
+from langchain_core.documents import Document
+from langchain_core.language_models.fake import FakeStreamingListLLM
+from query_model import QueryModel
+import api_handler
+import json
+import pytest
+
+
+class FakeEmbeddings:
+    model = "fake-model"
+
+    def embed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeDB:
+    embeddings = FakeEmbeddings()
+
+    def similarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:3:0:abcd1234"}), 0.9)]
+
+
+def parse_sse(text):
+    events = []
+    for block in text.strip().split("\n\n"):
+        lines = dict(line.split(": ", 1) for line in block.split("\n"))
+        events.append((lines["event"], json.loads(lines["data"])))
+    return events
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    stored = []
+    monkeypatch.setattr(query_cache, "_query_cache", QueryCache(InMemoryCacheBackend()))
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "memory")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeStreamingListLLM(responses=["It works"]))
+    monkeypatch.setattr(QueryModel, "put_item", lambda self: stored.append(self.model_copy()))
+    return stored
+
+
+def test_sources_then_tokens_then_stored_query(stored):
+    client = TestClient(api_handler.app)
+    with client.stream("POST", "/users/user/queries/stream", json={"query_text": "does it work?"}) as response:
+        assert response.status_code == 200
+        assert response.headers["content-type"].startswith("text/event-stream")
+        events = parse_sse(response.read().decode())
+
+    names = [name for name, _ in events]
+    assert names[:2] == ["query", "sources"]
+    assert names[-1] == "done"
+    assert set(names[2:-1]) == {"token"}
+    assert events[1][1] == [{"filename": "file.pdf", "page": 3}]
+    assert "".join(data["text"] for name, data in events if name == "token") == "It works"
+
+    assert len(stored) == 1
+    assert stored[0].query_id == events[0][1]["query_id"]
+    assert stored[0].answer_text == "It works"
+    assert stored[0].is_complete
+    assert events[-1][1]["answer_text"] == "It works"
+
+
+def test_repeated_streamed_query_is_served_from_cache(stored, monkeypatch):
+    client = TestClient(api_handler.app)
+    client.post("/users/user/queries/stream", json={"query_text": "does it work?"})
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: pytest.fail("the LLM should not be called"))
+
+    events = parse_sse(client.post("/users/user/queries/stream", json={"query_text": "does it work?"}).text)
+    assert [name for name, _ in events] == ["query", "sources", "token", "done"]
+    assert stored[-1].answer_text == "It works"
+
+
+def test_too_long_query_is_rejected(stored):
+    client = TestClient(api_handler.app)
+    response = client.post("/users/user/queries/stream", json={"query_text": "a" * 10000})
+    assert response.status_code == 400
+    assert stored == []
@@ -0,0 +1,123 @@
+from pdf_qa import ingestion
+from pdf_qa.uploads import get_upload_memory_bound, stream_to_s3, upload_documents
+from botocore.exceptions import ClientError
+import asyncio
+import hashlib
+import io
+import os
+import pytest
+import threading
+import time
+
+
+class FakeUpload:
+    def __init__(self, filename, content, max_read=None):
+        self.filename = filename
+        self.file = io.BytesIO(content)
+        self.max_read = max_read
+        self.largest_read = 0
+
+    async def read(self, size=-1):
+        if self.max_read:
+            size = min(size, self.max_read)
+        chunk = self.file.read(size)
+        self.largest_read = max(self.largest_read, len(chunk))
+        return chunk
+
+
+class FakeS3:
+    def __init__(self, fail_part=None):
+        self.fail_part = fail_part
+        self.objects = {}
+        self.parts = {}
+        self.aborted = []
+        self.in_flight = 0
+        self.peak_in_flight = 0
+        self.lock = threading.Lock()
+
+    def put_object(self, Bucket, Key, Body, **kwargs):
+        self.objects[Key] = Body
+
+    def create_multipart_upload(self, Bucket, Key, **kwargs):
+        return {"UploadId": f"upload-{Key}"}
+
+    def upload_part(self, Bucket, Key, UploadId, PartNumber, Body):
+        with self.lock:
+            self.in_flight += 1
+            self.peak_in_flight = max(self.peak_in_flight, self.in_flight)
+        time.sleep(0.01)
+        with self.lock:
+            self.in_flight -= 1
+        if PartNumber == self.fail_part:
+            raise ClientError({"Error": {"Code": "InternalError", "Message": "failed"}}, "UploadPart")
+        self.parts[(UploadId, PartNumber)] = Body
+        return {"ETag": f"etag-{PartNumber}"}
+
+    def complete_multipart_upload(self, Bucket, Key, UploadId, MultipartUpload):
+        numbers = [part["PartNumber"] for part in MultipartUpload["Parts"]]
+        assert numbers == sorted(numbers)
+        self.objects[Key] = b"".join(self.parts[(UploadId, number)] for number in numbers)
+
+    def abort_multipart_upload(self, Bucket, Key, UploadId):
+        self.aborted.append(Key)
+
+
+def test_large_file_is_sent_in_bounded_parallel_parts():
+    content = os.urandom(10_500)
+    s3 = FakeS3()
+    upload = FakeUpload("big.pdf", content, max_read=700)
+    result = asyncio.run(stream_to_s3(upload, "bucket", "source/user/big.pdf", part_size=1000, max_parallel_parts=3, s3_client=s3))
+
+    assert s3.objects["source/user/big.pdf"] == content
+    assert result.parts == 11
+    assert result.size == len(content)
+    assert result.content_hash == hashlib.sha256(content).hexdigest()
+    assert s3.peak_in_flight <= 3
+    assert upload.largest_read <= 1000
+
+
+def test_small_file_is_put_in_one_request():
+    s3 = FakeS3()
+    result = asyncio.run(stream_to_s3(FakeUpload("small.pdf", b"pdf"), "bucket", "small.pdf", part_size=1000, s3_client=s3))
+    assert s3.objects == {"small.pdf": b"pdf"}
+    assert result.parts == 1
+
+
+def test_failed_part_aborts_the_upload_and_skips_the_file():
+    s3 = FakeS3(fail_part=2)
+    documents = [FakeUpload("broken.pdf", os.urandom(5000)), FakeUpload("fine.pdf", b"pdf")]
+    results = asyncio.run(upload_documents(documents, bucket="bucket", prefix="source/user/", part_size=1000, s3_client=s3))
+
+    assert [result.filename for result in results] == ["fine.pdf"]
+    assert s3.aborted == ["source/user/broken.pdf"]
+    assert "source/user/broken.pdf" not in s3.objects
+
+
+def test_local_upload_streams_to_disk(tmp_path):
+    content = os.urandom(2500)
+    [result] = asyncio.run(upload_documents([FakeUpload("a.pdf", content)], directory=str(tmp_path), part_size=1000))
+
+    assert (tmp_path / "a.pdf").read_bytes() == content
+    assert result.content_hash == hashlib.sha256(content).hexdigest()
+    assert not (tmp_path / "a.pdf.part").exists()
+
+
+def test_memory_bound():
+    assert get_upload_memory_bound(part_size=8, max_parallel_parts=4, max_concurrent_files=2) == 80
+
+
+def test_ingestion_reuses_upload_hashes(tmp_path, monkeypatch):
+    source_dir = tmp_path / "source"
+    source_dir.mkdir()
+    (source_dir / "a.pdf").write_bytes(b"content")
+    monkeypatch.setattr(ingestion, "get_source_dir", lambda user_id: str(source_dir))
+    monkeypatch.setattr(ingestion.IngestionManifest, "load", classmethod(lambda cls, user_id: cls(user_id)))
+    monkeypatch.setattr(ingestion.IngestionManifest, "save", lambda self: None)
+    monkeypatch.setattr(ingestion, "iter_pdf_documents", lambda paths: iter([]))
+    monkeypatch.setattr(ingestion, "add_to_chroma", lambda chunks, user_id="nobody", progress=None: len(list(chunks)))
+    monkeypatch.setattr(ingestion, "delete_from_chroma", lambda ids, user_id="nobody": None)
+    monkeypatch.setattr(ingestion, "compute_file_hash", lambda path: pytest.fail("the file should not be read again"))
+    monkeypatch.delenv("AWS_EXECUTION_ENV", raising=False)
+
+    result = ingestion.ingest_user_documents("user", {"a.pdf": hashlib.sha256(b"content").hexdigest()})
+    assert result.ingested_files == ["a.pdf"]
@@ -0,0 +1,125 @@
+from pdf_qa.ivf_index import normalize_rows
+from pdf_qa.local_vector_store import LocalVectorStore
+from pdf_qa.vector_codec import VectorCodec
+import numpy as np
+import pytest
+
+
+def make_vectors(count, dimension=64, seed=0):
+    return normalize_rows(np.random.default_rng(seed).normal(size=(count, dimension)))
+
+
+class MatrixEmbeddings:
+    def __init__(self, vectors):
+        self.vectors = vectors
+
+    def embed_documents(self, texts):
+        return self.vectors[[int(text) for text in texts]].tolist()
+
+    def embed_query(self, text):
+        return self.vectors[int(text)].tolist()
+
+
+def make_store(path, vectors, codec=None):
+    store = LocalVectorStore(str(path), MatrixEmbeddings(vectors), ann_min_vectors=0, codec=codec, rescore_multiplier=4)
+    return store
+
+
+def fill(store, count):
+    rows = [str(i) for i in range(count)]
+    store.add_texts(rows, ids=rows)
+
+
+def test_int8_scores_are_close_to_float_scores():
+    vectors = make_vectors(200)
+    codec = VectorCodec(quantization="int8")
+    codes, scales = codec.encode(vectors)
+
+    assert codes.dtype == np.int8
+    approx = codec.score(codes, scales, vectors[0])
+    assert np.max(np.abs(approx - vectors @ vectors[0])) < 0.02
+
+
+def test_truncation_keeps_leading_dimensions_normalized():
+    codes, scales = VectorCodec(dimensions=16).encode(make_vectors(10))
+    assert codes.shape == (10, 16)
+    assert scales is None
+    assert np.allclose(np.linalg.norm(codes, axis=1), 1)
+
+
+def test_unknown_quantization_is_rejected():
+    with pytest.raises(ValueError):
+        VectorCodec(quantization="int4")
+
+
+def test_compact_store_rescores_in_full_precision(tmp_path):
+    vectors = make_vectors(500)
+    store = make_store(tmp_path, vectors, VectorCodec(quantization="int8", dimensions=32))
+    fill(store, 500)
+
+    doc, score = store.similarity_search_with_score("42", k=1)[0]
+    assert doc.id == "42"
+    assert score == pytest.approx(1.0, abs=1e-5)
+    footprint = store.memory_footprint()
+    assert footprint["search_bytes"] < footprint["full_bytes"] / 6
+
+
+def test_codec_is_kept_per_collection(tmp_path):
+    vectors = make_vectors(100)
+    fill(make_store(tmp_path / "compact", vectors, VectorCodec(quantization="int8")), 100)
+    fill(make_store(tmp_path / "full", vectors), 100)
+
+    compact = make_store(tmp_path / "compact", vectors)
+    full = make_store(tmp_path / "full", vectors, VectorCodec(quantization="int8"))
+    assert compact.codec == VectorCodec(quantization="int8")
+    assert compact._codes.shape == (100, 64)
+    assert full.codec.is_identity
+    assert full._codes is None
+
+
+def test_set_codec_re_encodes_the_collection(tmp_path):
+    vectors = make_vectors(100)
+    store = make_store(tmp_path, vectors)
+    fill(store, 100)
+    store.delete([str(i) for i in range(60)])
+
+    store.set_codec(VectorCodec(quantization="int8", dimensions=16))
+    reloaded = make_store(tmp_path, vectors)
+    assert reloaded.codec == VectorCodec(quantization="int8", dimensions=16)
+    assert reloaded._codes.shape == (40, 16)
+    assert reloaded.similarity_search("77", k=1)[0].id == "77"
+
+
+def test_store_without_rescoring_keeps_only_the_codes(tmp_path):
+    vectors = make_vectors(500)
+    fill(make_store(tmp_path / "full", vectors), 500)
+    fill(make_store(tmp_path / "rescored", vectors, VectorCodec(quantization="int8")), 500)
+    store = make_store(tmp_path / "compact", vectors, VectorCodec(quantization="int8", rescore=False))
+    fill(store, 500)
+
+    full_bytes = make_store(tmp_path / "full", vectors).disk_bytes()
+    assert make_store(tmp_path / "rescored", vectors).disk_bytes() > full_bytes
+    assert store.disk_bytes() < full_bytes
+    assert not (tmp_path / "compact" / "vectors.f32").exists()
+
+    store.delete([str(i) for i in range(300)])
+    reloaded = make_store(tmp_path / "compact", vectors)
+    assert reloaded.memory_footprint()["full_bytes"] == 0
+    doc, score = reloaded.similarity_search_with_score("342", k=1)[0]
+    assert doc.id == "342"
+    assert score == pytest.approx(1.0, abs=0.02)
+
+
+def test_store_without_rescoring_searches_its_index_in_the_space_of_the_codes(tmp_path):
+    vectors = make_vectors(400)
+    store = LocalVectorStore(str(tmp_path), MatrixEmbeddings(vectors), ann_min_vectors=200, nprobe=4)
+    fill(store, 300)
+    store.set_codec(VectorCodec(quantization="int8", dimensions=32, rescore=False))
+    assert store.index is not None
+    rows = [str(i) for i in range(300, 400)]
+    store.add_texts(rows, ids=rows)
+
+    assert store.similarity_search("350", k=1)[0].id == "350"
+    assert make_store(tmp_path, vectors).similarity_search("42", k=1)[0].id == "42"
+    with pytest.raises(ValueError):
+        store.set_codec(VectorCodec())
@@ -0,0 +1,99 @@
+from pdf_qa import query_cache, query_handler
+from botocore.exceptions import ClientError
+from langchain_core.documents import Document
+from query_model import QueryModel
+import asyncio
+import json
+import pytest
+import time
+import worker_handler
+
+
+LATENCY = 0.1
+
+
+class FakeEmbeddings:
+    model = "fake-model"
+
+    async def aembed_query(self, text):
+        return [1.0, 0.0]
+
+
+class FakeDB:
+    embeddings = FakeEmbeddings()
+
+    async def asimilarity_search_by_vector_with_relevance_scores(self, embedding, k=4):
+        return [(Document(page_content="context", metadata={"id": "data/file.pdf:1:0:abcd1234"}), 0.9)]
+
+
+class FakeLLM:
+    async def ainvoke(self, prompt):
+        await asyncio.sleep(LATENCY)
+        if "fail" in prompt:
+            raise RuntimeError("quota")
+        return "answer"
+
+
+@pytest.fixture
+def stored(monkeypatch):
+    stored = []
+    monkeypatch.setattr(query_cache, "QUERY_CACHE_BACKEND", "none")
+    monkeypatch.setattr(query_handler, "get_chroma_db", lambda user_id="nobody": FakeDB())
+    monkeypatch.setattr(query_handler, "get_llm", lambda model=None: FakeLLM())
+    monkeypatch.setattr(QueryModel, "batch_put_items", classmethod(lambda cls, items: stored.append(items)))
+    return stored
+
+
+def make_record(message_id, query_text, receive_count=1):
+    body = QueryModel(query_id=message_id, user_id="user", query_text=query_text).model_dump_json()
+    return {"messageId": message_id, "body": body, "attributes": {"ApproximateReceiveCount": str(receive_count)}}
+
+
+def test_sqs_batch_reports_partial_failures(stored):
+    event = {"Records": [make_record("m1", "question"), make_record("m2", "fail please"), {"messageId": "m3", "body": "not json"}]}
+    result = worker_handler.handler(event, None)
+
+    # The unparsable message would fail on every retry, so it is dropped instead of reported
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m2"}]}
+    assert len(stored) == 1
+    assert [item.query_id for item in stored[0]] == ["m1"]
+    assert stored[0][0].is_complete
+    assert stored[0][0].answer_text == "answer"
+
+
+def test_list_batch_runs_concurrently_and_writes_once(stored):
+    queries = [json.loads(QueryModel(user_id="user", query_text=f"question {i}").model_dump_json()) for i in range(20)]
+
+    start = time.perf_counter()
+    result = worker_handler.handler(queries, None)
+    elapsed = time.perf_counter() - start
+
+    assert result == {"batchItemFailures": []}
+    assert len(stored) == 1
+    assert {item.query_id for item in stored[0]} == {query["query_id"] for query in queries}
+    # 20 queries at 8 at a time take 3 rounds; one at a time would take 20
+    assert elapsed < 10 * LATENCY
+
+
+def test_failed_write_fails_every_answered_query(stored, monkeypatch):
+    def batch_put_items(cls, items):
+        raise ClientError({"Error": {"Message": "throttled"}}, "BatchWriteItem")
+
+    monkeypatch.setattr(QueryModel, "batch_put_items", classmethod(batch_put_items))
+    result = worker_handler.handler({"Records": [make_record("m1", "question")]}, None)
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+
+
+def test_query_failing_on_its_last_attempt_is_completed(stored):
+    event = {"Records": [
+        make_record("m1", "fail please", receive_count=worker_handler.WORKER_MAX_RECEIVE_COUNT - 1),
+        make_record("m2", "fail please", receive_count=worker_handler.WORKER_MAX_RECEIVE_COUNT),
+    ]}
+    result = worker_handler.handler(event, None)
+
+    # The last attempt would be dead-lettered, so the query is completed with an error answer instead
+    assert result == {"batchItemFailures": [{"itemIdentifier": "m1"}]}
+    [[query_item]] = stored
+    assert query_item.query_id == "m2"
+    assert query_item.is_complete
+    assert query_item.answer_text == worker_handler.FAILED_ANSWER